@@ -1,5 +1,6 @@
 from django.contrib import admin
-from .models import Profile
+from .models import Profile, ProcessingJob
 
 admin.site.register(Profile)
+admin.site.register(ProcessingJob)
 # Register your models here.
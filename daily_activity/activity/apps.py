@@ -1,6 +1,17 @@
 from django.apps import AppConfig
+from django.db import connections
+from django.db.models.signals import post_migrate
+
+
+def repair_search_index_after_migrate(sender, using, **kwargs):
+    from .search import repair_search_index
+    repair_search_index(connections[using])
 
 
 class ActivityConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'activity'
+
+    def ready(self):
+        post_migrate.connect(repair_search_index_after_migrate, sender=self)
+        from . import authentication, blobs, profiles, rollups, versions  # noqa: F401 - connect their signal handlers
@@ -0,0 +1,109 @@
+"""
+JWT authentication without a User query on every request.
+
+CachedJWTAuthentication keeps recently seen users in a small in-process cache for
+ACTIVITY_JWT_USER_CACHE_SECONDS. Saving or deleting a user (deactivation, password
+change, ...) drops its entry in this process; other processes pick the change up
+when their entry expires. StatelessJWTAuthentication skips the database entirely
+and builds the user from the token's claims, so a deactivated user keeps access
+until their access token expires.
+"""
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.utils import get_md5_hash_password
+
+MAX_CACHED_USERS = 10000
+
+
+class UserCache:
+    def __init__(self, max_entries=MAX_CACHED_USERS):
+        self.max_entries = max_entries
+        self._users = OrderedDict()  # user id -> (user, expires_at)
+        self._lock = threading.Lock()
+
+    def get(self, user_id):
+        with self._lock:
+            cached = self._users.get(user_id)
+            if cached is None:
+                return None
+            if cached[1] <= time.monotonic():
+                del self._users[user_id]
+                return None
+            self._users.move_to_end(user_id)
+            user = cached[0]
+        # A copy, so attributes set on request.user don't leak into other requests
+        return copy.copy(user)
+
+    def set(self, user_id, user):
+        with self._lock:
+            self._users[user_id] = (copy.copy(user), time.monotonic() + settings.ACTIVITY_JWT_USER_CACHE_SECONDS)
+            self._users.move_to_end(user_id)
+            while len(self._users) > self.max_entries:
+                self._users.popitem(last=False)
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._users.pop(user_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._users.clear()
+
+
+user_cache = UserCache()
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+@receiver(post_delete, sender=settings.AUTH_USER_MODEL)
+def _invalidate_cached_user(sender, instance, **kwargs):
+    user_cache.invalidate(str(getattr(instance, api_settings.USER_ID_FIELD)))
+
+
+def _check_user(user, validated_token):
+    # The same checks JWTAuthentication.get_user makes after loading the user
+    if api_settings.CHECK_USER_IS_ACTIVE and not user.is_active:
+        raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+    if api_settings.CHECK_REVOKE_TOKEN:
+        if validated_token.get(api_settings.REVOKE_TOKEN_CLAIM) != get_md5_hash_password(user.password):
+            raise AuthenticationFailed(_("The user's password has been changed."), code="password_changed")
+
+
+class CachedJWTAuthentication(JWTAuthentication):
+    def get_user(self, validated_token):
+        try:
+            user_id = str(validated_token[api_settings.USER_ID_CLAIM])
+        except KeyError as e:
+            raise InvalidToken(_("Token contained no recognizable user identification")) from e
+
+        user = user_cache.get(user_id)
+        if user is not None:
+            _check_user(user, validated_token)
+            return user
+        user = super().get_user(validated_token)
+        user_cache.set(user_id, user)
+        return user
+
+
+class StatelessJWTAuthentication(JWTAuthentication):
+    """
+    Builds a User from the token that only knows its primary key. That is enough for
+    `filter(user=request.user)` and foreign key assignment; it must never be saved.
+    """
+    def get_user(self, validated_token):
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError as e:
+            raise InvalidToken(_("Token contained no recognizable user identification")) from e
+        user_model = get_user_model()
+        return user_model(**{api_settings.USER_ID_FIELD: user_id, 'is_active': True})
@@ -0,0 +1,452 @@
+"""
+Benchmark and load-test harness behind `manage.py benchmark`.
+
+Everything runs against a throwaway database and MEDIA_ROOT with the speech
+recognizer and OpenAI replaced by local stubs, so results only depend on this code
+and the machine. Each scenario is driven through the Django test client (one request
+at a time, in-process) and, for the HTTP load test, through a live server hit by
+concurrent urllib clients. Queued transcription jobs are drained at the end and
+timed as their own scenario.
+
+EndpointComparison (`manage.py benchmark_async`) puts the same concurrent load on the
+sync endpoints served by a threaded WSGI server and on their api/async/ versions
+served by uvicorn.
+"""
+import asyncio
+import json
+import math
+import os
+import platform
+import resource
+import shutil
+import socket
+import sys
+import tempfile
+import threading
+import time
+import uuid
+import wave
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack, contextmanager
+from io import BytesIO
+from types import SimpleNamespace
+from unittest import mock
+from urllib.error import HTTPError
+from urllib.request import Request, urlopen
+
+import django
+from django.contrib.auth.models import User
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.test import Client
+from django.test.testcases import LiveServerThread, _StaticFilesHandler
+from django.test.utils import override_settings
+from pydub import AudioSegment
+from rest_framework_simplejwt.tokens import AccessToken
+
+from .jobs import run_worker
+from .models import AudioRecording, ProcessingJob
+from .utility import transcription, utils
+from .utility.audio import ffmpeg_binary
+
+SAMPLE_RATE = 16000
+TONE_HZ = 400  # Divides SAMPLE_RATE, so one period of samples can simply be repeated
+BENCHMARK_DATE = '2024-01-01'
+# Metrics where a higher value is a regression; throughput is the one where lower is
+LATENCY_METRICS = ('p50_ms', 'p95_ms', 'p99_ms')
+
+
+class StubRecognizerBackend:
+    """Speech recognizer stand-in that answers after `latency` seconds."""
+    def __init__(self, latency=0.0):
+        self.latency = latency
+
+    def recognize(self, audio_data):
+        if self.latency:
+            time.sleep(self.latency)
+        return 'benchmark transcript of a synthetic tone'
+
+
+def _completion(messages):
+    content = f"Summary: {messages[-1]['content'][:40]}"
+    return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=content))])
+
+
+class StubOpenAI:
+    """OpenAI client stand-in whose chat completions take `latency` seconds."""
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.chat = SimpleNamespace(completions=SimpleNamespace(create=self.create))
+
+    def create(self, model, messages):
+        if self.latency:
+            time.sleep(self.latency)
+        return _completion(messages)
+
+
+class AsyncStubOpenAI(StubOpenAI):
+    async def create(self, model, messages):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return _completion(messages)
+
+
+def synthetic_wav(seconds, sample_rate=SAMPLE_RATE):
+    """A mono 16-bit sine tone of `seconds` length, as WAV bytes."""
+    period = array('h', (int(8000 * math.sin(2 * math.pi * i * TONE_HZ / sample_rate))
+                         for i in range(sample_rate // TONE_HZ)))
+    samples = period * int(seconds * TONE_HZ)
+    buffer = BytesIO()
+    with wave.open(buffer, 'wb') as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(sample_rate)
+        wav.writeframes(samples.tobytes())
+    return buffer.getvalue()
+
+
+def synthetic_audio(seconds, audio_format):
+    """Synthetic audio in `audio_format` ('wav' or anything ffmpeg can encode)."""
+    data = synthetic_wav(seconds)
+    if audio_format == 'wav':
+        return data
+    buffer = BytesIO()
+    AudioSegment.from_wav(BytesIO(data)).export(buffer, format=audio_format)
+    return buffer.getvalue()
+
+
+def ffmpeg_available():
+    return shutil.which(ffmpeg_binary()) is not None
+
+
+def percentile(sorted_values, fraction):
+    # Nearest-rank percentile
+    if not sorted_values:
+        return 0.0
+    rank = max(math.ceil(fraction * len(sorted_values)) - 1, 0)
+    return sorted_values[rank]
+
+
+def peak_rss_mb():
+    # ru_maxrss is in KiB on Linux and bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+
+def summarize(latencies, elapsed, errors):
+    latencies = sorted(latencies)
+    return {
+        'requests': len(latencies),
+        'errors': errors,
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 2),
+        'p95_ms': round(percentile(latencies, 0.95) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 2),
+        'throughput_rps': round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+        'peak_rss_mb': peak_rss_mb(),
+    }
+
+
+def _multipart(fields, files):
+    boundary = uuid.uuid4().hex
+    body = BytesIO()
+    for name, value in fields.items():
+        body.write(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode())
+    for name, (filename, content, content_type) in files.items():
+        body.write(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"; filename="{filename}"\r\n'
+                   f'Content-Type: {content_type}\r\n\r\n'.encode())
+        body.write(content)
+        body.write(b'\r\n')
+    body.write(f'--{boundary}--\r\n'.encode())
+    return body.getvalue(), f'multipart/form-data; boundary={boundary}'
+
+
+@contextmanager
+def benchmark_environment(recognizer_latency=0.0, openai_latency=0.0):
+    """
+    Point Django at a throwaway database and MEDIA_ROOT and stub out the recognizer and
+    OpenAI for the duration of the block. Jobs are only queued, not run.
+    """
+    media_root = tempfile.mkdtemp(prefix='activity-bench-media-')
+    db_dir = tempfile.mkdtemp(prefix='activity-bench-db-')
+    # A file database (rather than SQLite's shared in-memory one) lets the live server's
+    # threads use their own connections, as they would in production
+    connection.settings_dict.setdefault('TEST', {})['NAME'] = os.path.join(db_dir, 'bench.sqlite3')
+    old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+    try:
+        with ExitStack() as stack:
+            stack.enter_context(override_settings(
+                MEDIA_ROOT=media_root,
+                ACTIVITY_JOB_RUN_IN_PROCESS=False,  # Queued here, drained by the 'jobs' scenario
+                ACTIVITY_METRICS_LOG_TIMINGS=False,
+            ))
+            stack.enter_context(mock.patch.object(
+                transcription, '_backend', StubRecognizerBackend(recognizer_latency)))
+            stack.enter_context(mock.patch.object(utils, '_client', StubOpenAI(openai_latency)))
+            stack.enter_context(mock.patch.object(utils, '_async_client', AsyncStubOpenAI(openai_latency)))
+            yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        shutil.rmtree(media_root, ignore_errors=True)
+        shutil.rmtree(db_dir, ignore_errors=True)
+
+
+@contextmanager
+def wsgi_server():
+    """A threaded WSGI server for the project, like the live server tests use. Yields its base URL."""
+    server = LiveServerThread('localhost', _StaticFilesHandler)
+    server.daemon = True
+    server.start()
+    server.is_ready.wait()
+    if server.error:
+        raise server.error
+    try:
+        # 'localhost' rather than 'testserver', which only the test runner adds to ALLOWED_HOSTS
+        yield f'http://localhost:{server.port}'
+    finally:
+        server.terminate()
+
+
+@contextmanager
+def asgi_server():
+    """uvicorn serving the project's ASGI application on one event loop. Yields its base URL."""
+    import uvicorn
+    from django.core.asgi import get_asgi_application
+
+    sock = socket.socket()
+    sock.bind(('localhost', 0))
+    server = uvicorn.Server(uvicorn.Config(get_asgi_application(), lifespan='off', log_level='warning'))
+    thread = threading.Thread(target=server.run, kwargs={'sockets': [sock]}, daemon=True)
+    thread.start()
+    while not server.started:
+        if not thread.is_alive():
+            raise RuntimeError("uvicorn did not start")
+        time.sleep(0.01)
+    try:
+        yield f'http://localhost:{sock.getsockname()[1]}'
+    finally:
+        server.should_exit = True
+        thread.join()
+        sock.close()
+
+
+def _send(request):
+    url, method, body, headers = request
+    request_start = time.perf_counter()
+    try:
+        with urlopen(Request(url, data=body, headers=headers, method=method), timeout=120) as response:
+            response.read()
+            ok = True
+    except HTTPError as e:
+        e.read()
+        ok = False
+    return time.perf_counter() - request_start, ok
+
+
+def run_load(requests, concurrency):
+    """Send (url, method, body, headers) `requests` from `concurrency` clients; summarize the outcomes."""
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        outcomes = list(pool.map(_send, requests))
+    elapsed = time.perf_counter() - start
+    return summarize([latency for latency, _ in outcomes], elapsed, sum(not ok for _, ok in outcomes))
+
+
+class Benchmark:
+    def __init__(self, lengths=(5, 30), formats=('wav',), iterations=20, requests=200, concurrency=8,
+                 recognizer_latency=0.0, openai_latency=0.0, job_workers=4, log=print):
+        self.lengths = lengths
+        self.formats = formats
+        self.iterations = iterations
+        self.requests = requests
+        self.concurrency = concurrency
+        self.recognizer_latency = recognizer_latency
+        self.openai_latency = openai_latency
+        self.job_workers = job_workers
+        self.log = log
+
+    def scenarios(self):
+        """(name, method, path, body builder) for every request the suite sends."""
+        audio = {(length, fmt): synthetic_audio(length, fmt) for length in self.lengths for fmt in self.formats}
+        scenarios = []
+        for (length, fmt), data in audio.items():
+            content_type = 'audio/wav' if fmt == 'wav' else f'audio/{fmt}'
+            scenarios.append((f'record_{fmt}_{length}s', 'POST', '/api/record/',
+                              ({'date': BENCHMARK_DATE}, {'audio_file': (f'bench.{fmt}', data, content_type)})))
+        scenarios += [
+            ('audio_for_date', 'POST', f'/api/audio/date/{BENCHMARK_DATE}/', None),
+            ('activities', 'GET', '/api/activities/', None),
+            ('profile', 'GET', '/api/profile/', None),
+        ]
+        return scenarios
+
+    def run(self):
+        """Run every scenario and return the results document."""
+        with benchmark_environment(self.recognizer_latency, self.openai_latency):
+            results = self._run_scenarios()
+        return {
+            'meta': {
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'platform': platform.platform(),
+                'lengths': list(self.lengths),
+                'formats': list(self.formats),
+                'iterations': self.iterations,
+                'requests': self.requests,
+                'concurrency': self.concurrency,
+                'recognizer_latency': self.recognizer_latency,
+                'openai_latency': self.openai_latency,
+            },
+            'results': results,
+        }
+
+    def _run_scenarios(self):
+        user = User.objects.create(username='benchmark')
+        token = str(AccessToken.for_user(user))
+        scenarios = self.scenarios()
+        results = {}
+
+        # 'localhost' rather than 'testserver', which only the test runner adds to ALLOWED_HOSTS
+        client = Client(SERVER_NAME='localhost', HTTP_AUTHORIZATION=f'Bearer {token}')
+        for name, method, path, payload in scenarios:
+            key = f'client:{name}'
+            results[key] = self._run_client(client, method, path, payload)
+            self.log(key, results[key])
+
+        with wsgi_server() as base_url:
+            for name, method, path, payload in scenarios:
+                key = f'http:{name}'
+                results[key] = self._run_http(base_url + path, method, payload, token)
+                self.log(key, results[key])
+
+        start = time.perf_counter()
+        run_worker(self.job_workers, once=True)
+        elapsed = time.perf_counter() - start
+        jobs = ProcessingJob.objects.count()
+        failed = ProcessingJob.objects.exclude(status=ProcessingJob.STATUS_SUCCEEDED).count()
+        results['jobs:process'] = {
+            'requests': jobs,
+            'errors': failed,
+            'throughput_rps': round(jobs / elapsed, 2) if elapsed else 0.0,
+            'peak_rss_mb': peak_rss_mb(),
+        }
+        self.log('jobs:process', results['jobs:process'])
+        return results
+
+    def _run_client(self, client, method, path, payload):
+        latencies, errors = [], 0
+        start = time.perf_counter()
+        for _ in range(self.iterations):
+            if payload is not None:
+                fields, files = payload
+                data = dict(fields)
+                for field, (filename, content, content_type) in files.items():
+                    data[field] = SimpleUploadedFile(filename, content, content_type)
+                request_start = time.perf_counter()
+                response = client.post(path, data)
+            else:
+                request_start = time.perf_counter()
+                response = client.generic(method, path)
+            latencies.append(time.perf_counter() - request_start)
+            errors += response.status_code >= 400
+        return summarize(latencies, time.perf_counter() - start, errors)
+
+    def _run_http(self, url, method, payload, token):
+        headers = {'Authorization': f'Bearer {token}'}
+        body = None
+        if payload is not None:
+            body, headers['Content-Type'] = _multipart(*payload)
+        return run_load([(url, method, body, headers)] * self.requests, self.concurrency)
+
+
+class EndpointComparison:
+    """
+    Record, list and delete recordings with the same concurrent load through the sync
+    endpoints (api/...) on a threaded WSGI server and through the async ones
+    (api/async/...) on uvicorn. Each server gets its own user, so both list and delete
+    the same number of recordings.
+    """
+    SERVERS = (('wsgi', '/api', wsgi_server), ('asgi', '/api/async', asgi_server))
+
+    def __init__(self, requests=100, concurrency=16, seconds=5.0, log=print):
+        self.requests = requests
+        self.concurrency = concurrency
+        self.seconds = seconds
+        self.log = log
+
+    def run(self):
+        """Return {'meta': ..., 'results': {'<server>:<scenario>': metrics}}."""
+        with benchmark_environment():
+            results = {}
+            for server, prefix, serve in self.SERVERS:
+                user = User.objects.create(username=f'benchmark-{server}')
+                headers = {'Authorization': f'Bearer {AccessToken.for_user(user)}'}
+                with serve() as base_url:
+                    for scenario, requests in self._scenarios(user, base_url + prefix, headers):
+                        key = f'{server}:{scenario}'
+                        results[key] = run_load(requests(), self.concurrency)
+                        self.log(key, results[key])
+        return {
+            'meta': {
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'platform': platform.platform(),
+                'requests': self.requests,
+                'concurrency': self.concurrency,
+                'seconds': self.seconds,
+            },
+            'results': results,
+        }
+
+    def _uploads(self):
+        # Distinct audio per request, so no upload is answered as a duplicate of another
+        wav = synthetic_wav(self.seconds)
+        for index in range(self.requests):
+            data = wav[:-4] + index.to_bytes(4, 'little')
+            yield _multipart({'date': BENCHMARK_DATE}, {'audio_file': ('bench.wav', data, 'audio/wav')})
+
+    def _scenarios(self, user, api, headers):
+        """(name, builder of its requests) in order; built lazily, as delete needs what record stored."""
+        def record():
+            return [(f'{api}/record/', 'POST', body, {**headers, 'Content-Type': content_type})
+                    for body, content_type in self._uploads()]
+
+        def list_day():
+            return [(f'{api}/audio/date/{BENCHMARK_DATE}/', 'GET', None, headers)] * self.requests
+
+        def delete():
+            names = AudioRecording.objects.filter(user=user).values_list('date', 'filename')
+            return [(f'{api}/audio/delete/', 'POST',
+                     json.dumps({'date': str(date), 'file_name': filename}).encode(),
+                     {**headers, 'Content-Type': 'application/json'}) for date, filename in names]
+
+        return [('record', record), ('list', list_day), ('delete', delete)]
+
+
+def compare(baseline, current, threshold):
+    """
+    Return a list of regressions of `current` against `baseline`: latencies more than
+    `threshold` (a fraction) higher, throughput more than `threshold` lower.
+    """
+    regressions = []
+    for key, before in baseline['results'].items():
+        after = current['results'].get(key)
+        if after is None:
+            continue
+        for metric in LATENCY_METRICS + ('peak_rss_mb',):
+            if metric in before and before[metric] and after[metric] > before[metric] * (1 + threshold):
+                regressions.append(f'{key} {metric}: {before[metric]} -> {after[metric]}')
+        if before.get('throughput_rps') and after['throughput_rps'] < before['throughput_rps'] * (1 - threshold):
+            regressions.append(f"{key} throughput_rps: {before['throughput_rps']} -> {after['throughput_rps']}")
+    return regressions
+
+
+def load(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def save(results, path):
+    with open(path, 'w') as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+        f.write('\n')
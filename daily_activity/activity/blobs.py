@@ -0,0 +1,236 @@
+"""
+Content-addressed storage of recordings.
+
+Each distinct upload is stored once, as MEDIA_ROOT/blobs/<aa>/<bb>/<sha256>.wav
+(.flac or .opus once activity/tiering.py has re-encoded it), keyed by the SHA-256 of the bytes as uploaded (computed while the upload streams in,
+see HashingUploadHandler). AudioRecording rows are the per-user, per-date references
+to a blob and AudioBlob.ref_count counts them: referenced_blob() takes a reference,
+deleting an AudioRecording (directly, in bulk or by cascade) gives it back, and the
+blob file goes with its last reference. Uploading audio that is already stored costs
+the hash and a row insert; nothing is transcoded or written.
+
+Blob files are only installed or removed while their AudioBlob row is locked, so an
+upload racing the deletion of the same audio can't end up without a file. Everything
+slow (transcoding, reading the samples for the waveform) happens in stage_blob(),
+before that lock is taken: on SQLite any write transaction blocks all other writers.
+"""
+import hashlib
+import logging
+import os
+import tempfile
+from contextlib import contextmanager
+from dataclasses import dataclass
+
+from django.conf import settings
+from django.core.files.uploadhandler import TemporaryFileUploadHandler
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F
+from django.db.models.signals import post_delete
+from django.dispatch import receiver
+
+from .models import AudioBlob, AudioRecording
+from .utility.audio import CHUNK_SIZE, probe_wav, store_as_wav
+from .utility.metrics import registry, span
+from .versions import touch
+
+logger = logging.getLogger('activity_logger')
+
+deduplicated_uploads = registry.counter(
+    'activity_blob_dedup_total', 'Uploads whose audio was already stored.',
+)
+
+
+class HashingUploadHandler(TemporaryFileUploadHandler):
+    """
+    TemporaryFileUploadHandler that also hashes each file as its chunks arrive,
+    and sets the hex SHA-256 as the uploaded file's `sha256` attribute.
+    """
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.digest = hashlib.sha256()
+
+    def receive_data_chunk(self, raw_data, start):
+        self.digest.update(raw_data)
+        return super().receive_data_chunk(raw_data, start)
+
+    def file_complete(self, file_size):
+        file = super().file_complete(file_size)
+        file.sha256 = self.digest.hexdigest()
+        return file
+
+
+def source_digest(source):
+    """
+    Hex SHA-256 of `source` (a path or an UploadedFile), reusing the one computed
+    by HashingUploadHandler when there is one.
+    """
+    if getattr(source, 'sha256', None):
+        return source.sha256
+    digest = hashlib.sha256()
+    with span('audio_hash'):
+        if isinstance(source, (str, os.PathLike)):
+            with open(source, 'rb') as f:
+                for data in iter(lambda: f.read(CHUNK_SIZE), b''):
+                    digest.update(data)
+        else:
+            for chunk in source.chunks(CHUNK_SIZE):
+                digest.update(chunk)
+            source.seek(0)
+    return digest.hexdigest()
+
+
+def is_stored(digest):
+    blob = AudioBlob.objects.filter(digest=digest).first()
+    return blob is not None and os.path.exists(blob.path)
+
+
+@dataclass
+class StagedBlob:
+    path: str
+    description: dict  # AudioBlob field values: size, codec, waveform, ...
+
+
+def stage_blob(source):
+    """
+    Store `source` as WAV in a temporary file beside the blobs, ready for
+    referenced_blob() to move into place, and describe it. Returns a StagedBlob.
+    """
+    directory = os.path.join(settings.MEDIA_ROOT, 'blobs', 'tmp')
+    os.makedirs(directory, exist_ok=True)
+    fd, path = tempfile.mkstemp(dir=directory, suffix='.wav')
+    os.close(fd)
+    try:
+        transcoded = store_as_wav(source, path)
+    except Exception:
+        _remove(path)
+        raise
+    logger.info("Audio staged at %s (transcoded: %s)", path, transcoded)
+    return StagedBlob(path, _describe(path))
+
+
+def _describe(path):
+    # NumPy is only imported once audio is actually stored
+    from .utility.waveform import wav_peaks
+
+    description = {'size': os.path.getsize(path), 'extension': 'wav'}
+    try:
+        _, description['codec'] = probe_wav(path)
+        with span('audio_peaks'):
+            description['peaks'], description['sample_rate'], description['channels'], description['duration'] = (
+                wav_peaks(path))
+    except Exception:
+        logger.warning("Could not read the WAV samples of %s", path, exc_info=True)
+        description.update(codec='', peaks=None, sample_rate=None, channels=None, duration=None)
+    return description
+
+
+def add_waveform(blob):
+    """
+    Compute the waveform of a WAV blob stored before peaks were recorded.
+    Returns False if there is no WAV to compute it from.
+    """
+    if blob.extension != 'wav' or not os.path.exists(blob.path):
+        return False
+    # Read outside any transaction; only the writes below hold the database's write lock
+    description = _describe(blob.path)
+    if description['peaks'] is None:
+        return False
+    fields = ['peaks', 'sample_rate', 'channels', 'duration']
+    for name in fields:
+        setattr(blob, name, description[name])
+    with transaction.atomic():
+        AudioBlob.objects.filter(pk=blob.pk).update(**{name: description[name] for name in fields})
+        # The peaks show up in the recording listings of everyone referencing it
+        touch(blob.recordings.all())
+    return True
+
+
+def _install(blob, digest, staged):
+    """Move the staged file into place for `digest`. Returns the (locked) AudioBlob row."""
+    description = staged.description
+    if blob is None:
+        try:
+            with transaction.atomic():
+                blob = AudioBlob.objects.create(digest=digest, **description)
+        except IntegrityError:
+            # Stored concurrently by another upload; wait for it and use its file if it has one
+            blob = AudioBlob.objects.select_for_update().get(digest=digest)
+            if os.path.exists(blob.path):
+                return blob
+    else:
+        for name, value in description.items():
+            setattr(blob, name, value)
+        blob.save(update_fields=list(description))
+    os.makedirs(os.path.dirname(blob.path), exist_ok=True)
+    os.replace(staged.path, blob.path)
+    return blob
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+@contextmanager
+def referenced_blob(source, digest=None, staged=None):
+    """
+    Take a reference to the AudioBlob holding `source`, storing it unless the same
+    audio is stored already (pass `staged` if stage_blob() was called up front).
+
+    Yields the blob inside a transaction that keeps its row locked: create the
+    AudioRecording referencing it in the with block, so that a failure there also
+    gives the reference back.
+    """
+    digest = digest or source_digest(source)
+    try:
+        while True:
+            if staged is None and not is_stored(digest):
+                staged = stage_blob(source)
+            with transaction.atomic():
+                blob = AudioBlob.objects.select_for_update().filter(digest=digest).first()
+                if blob is None or not os.path.exists(blob.path):
+                    if staged is None:
+                        continue  # Deleted since is_stored() looked: store it after all
+                    blob = _install(blob, digest, staged)
+                else:
+                    deduplicated_uploads.inc()
+                AudioBlob.objects.filter(pk=blob.pk).update(ref_count=F('ref_count') + 1)
+                blob.ref_count += 1
+                yield blob
+                return
+    finally:
+        if staged is not None:
+            _remove(staged.path)
+
+
+def release_blob(blob_id):
+    """
+    Give back one reference to a blob; the last one removes its file and row.
+    """
+    with transaction.atomic():
+        blob = AudioBlob.objects.select_for_update().filter(pk=blob_id).first()
+        if blob is None:
+            return
+        if blob.ref_count > 1:
+            AudioBlob.objects.filter(pk=blob_id).update(ref_count=F('ref_count') - 1)
+            return
+        _remove(blob.path)
+        blob.delete()
+        logger.info("Removed unreferenced blob %s", blob.digest)
+
+
+@receiver(post_delete, sender=AudioRecording)
+def _release_blob_on_delete(sender, instance, **kwargs):
+    if instance.blob_id is not None:
+        release_blob(instance.blob_id)
+
+
+def reconcile_ref_counts():
+    """Recount every blob's references. Returns the number of blobs that were off."""
+    fixed = 0
+    for blob in AudioBlob.objects.annotate(references=Count('recordings')).exclude(ref_count=F('references')):
+        AudioBlob.objects.filter(pk=blob.pk).update(ref_count=blob.references)
+        fixed += 1
+    return fixed
@@ -0,0 +1,89 @@
+"""
+Bulk writes of activities, e.g. a mobile client syncing a day of offline entries.
+
+Every item is validated with ActivitySerializer first. The valid items are written
+with one bulk_create / bulk_update in a single transaction; invalid ones are skipped,
+and their errors come back in a list aligned with the input ({} for the valid items),
+so one bad entry doesn't hold back the rest of a client's batch. Bulk writes bypass
+model signals, so the spending rollups (activity/rollups.py) and the change versions
+(activity/versions.py) are updated here.
+"""
+from django.db import transaction
+
+from .models import DailyActivity
+from .rollups import activity_state, apply_activity_changes
+from .serializers import ActivitySerializer
+from .versions import touch
+
+
+def bulk_create_activities(user, items):
+    """
+    Create an activity for each valid dict in `items`. Returns (activities, errors),
+    both aligned with `items`: the created activity or None, and the item's errors or {}.
+    """
+    serializers = [ActivitySerializer(data=item) for item in items]
+    errors = [{} if serializer.is_valid() else serializer.errors for serializer in serializers]
+
+    activities = [DailyActivity(user=user, **serializer.validated_data) if not error else None
+                  for serializer, error in zip(serializers, errors)]
+    valid = [activity for activity in activities if activity is not None]
+    if valid:
+        with transaction.atomic():
+            DailyActivity.objects.bulk_create(valid, batch_size=500)
+            apply_activity_changes((None, activity_state(activity)) for activity in valid)
+            _touch(valid)
+    return activities, errors
+
+
+def bulk_update_activities(user, items):
+    """
+    Apply partial updates to the user's activities; each dict in `items` needs the
+    'id' of the activity it updates. Ids of other users' activities are not found.
+    Returns (activities, errors) like bulk_create_activities.
+    """
+    ids = [item.get('id') if isinstance(item, dict) else None for item in items]
+    with transaction.atomic():
+        existing = DailyActivity.objects.select_for_update().filter(
+            user=user, pk__in=[pk for pk in ids if isinstance(pk, int)],
+        ).in_bulk()
+
+        serializers, errors, seen = [], [], set()
+        for pk, item in zip(ids, items):
+            if pk not in existing:
+                serializers.append(None)
+                errors.append({'id': ['Activity not found.' if pk is not None else 'This field is required.']})
+                continue
+            if pk in seen:
+                serializers.append(None)
+                errors.append({'id': ['Activity is updated more than once.']})
+                continue
+            seen.add(pk)
+            serializer = ActivitySerializer(existing[pk], data=item, partial=True)
+            valid = serializer.is_valid()
+            serializers.append(serializer if valid else None)
+            errors.append({} if valid else serializer.errors)
+
+        activities, changes, fields = [], [], set()
+        for serializer in serializers:
+            if serializer is None:
+                activities.append(None)
+                continue
+            activity = serializer.instance
+            old = activity_state(activity)
+            for name, value in serializer.validated_data.items():
+                setattr(activity, name, value)
+            fields.update(serializer.validated_data)
+            activities.append(activity)
+            changes.append((old, activity_state(activity)))
+        if fields:
+            updated = [activity for activity in activities if activity is not None]
+            DailyActivity.objects.bulk_update(updated, sorted(fields), batch_size=500)
+            apply_activity_changes(changes)
+            _touch(updated)
+    return activities, errors
+
+
+def _touch(activities):
+    version = touch(DailyActivity.objects.filter(pk__in=[activity.pk for activity in activities]))
+    for activity in activities:
+        activity.sync_version = version
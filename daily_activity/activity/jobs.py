@@ -0,0 +1,202 @@
+"""
+Background transcription and summarization jobs.
+
+Jobs are rows in the ProcessingJob table, so the queue survives restarts and needs no
+external broker. By default a small in-process thread pool picks a job up as soon as the
+transaction that enqueued it commits; `python manage.py run_jobs` runs the same job
+runner as a standalone worker that polls the table instead.
+"""
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import DailyActivity, ProcessingJob
+from .utility.metrics import span
+from .versions import touch
+from .utility.utils import request_summary
+
+logger = logging.getLogger('activity_logger')
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """Return the shared in-process worker pool, creating it on first use."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(
+                max_workers=settings.ACTIVITY_JOB_WORKERS,
+                thread_name_prefix='activity-job',
+            )
+            # Pick up anything left queued by a previous process
+            _pool.submit(_submit_due_jobs)
+        return _pool
+
+
+def enqueue_processing(activity, audio_path, user=None):
+    """
+    Queue a transcribe -> summarize job for a saved recording and return it.
+    The caller gets the job back immediately; the work happens on a worker.
+    """
+    job = ProcessingJob.objects.create(
+        user=user,
+        activity=activity,
+        audio_path=audio_path,
+        max_attempts=settings.ACTIVITY_JOB_MAX_ATTEMPTS,
+    )
+    if settings.ACTIVITY_JOB_RUN_IN_PROCESS:
+        # Don't let a worker look for the row before it is visible to other connections
+        transaction.on_commit(lambda: get_pool().submit(run_job, job.pk))
+    logger.info("Queued processing job %s for activity %s", job.pk, activity.pk)
+    return job
+
+
+def due_job_ids(limit):
+    """Ids of queued jobs whose retry delay (if any) has elapsed, oldest first."""
+    now = timezone.now()
+    return list(
+        ProcessingJob.objects
+        .filter(status=ProcessingJob.STATUS_QUEUED)
+        .filter(Q(run_after__isnull=True) | Q(run_after__lte=now))
+        .order_by('created_at')
+        .values_list('pk', flat=True)[:limit]
+    )
+
+
+def _submit_due_jobs():
+    try:
+        for job_id in due_job_ids(limit=1000):
+            get_pool().submit(run_job, job_id)
+    finally:
+        close_old_connections()
+
+
+def claim_job(job_id):
+    """
+    Atomically move a queued job to running. Returns False if another worker
+    got there first or the job is not due yet.
+    """
+    now = timezone.now()
+    claimed = (
+        ProcessingJob.objects
+        .filter(pk=job_id, status=ProcessingJob.STATUS_QUEUED)
+        .filter(Q(run_after__isnull=True) | Q(run_after__lte=now))
+        .update(status=ProcessingJob.STATUS_RUNNING, attempts=F('attempts') + 1, updated_at=now)
+    )
+    return claimed == 1
+
+
+def run_job(job_id):
+    """Run a single job if it can be claimed. Safe to call from any thread."""
+    close_old_connections()
+    try:
+        if not claim_job(job_id):
+            return
+        job = ProcessingJob.objects.get(pk=job_id)
+        try:
+            _process(job)
+        except Exception as e:
+            _handle_failure(job, e)
+    finally:
+        # Worker threads outlive requests, so release their DB connections explicitly
+        close_old_connections()
+
+
+def _process(job):
+    # Imported here so loading the job module (e.g. for the URLconf) doesn't import the recognizer
+    import speech_recognition as sr
+
+    from .utility.transcription import transcribe_file
+
+    if job.stage == ProcessingJob.STAGE_TRANSCRIBE:
+        logger.info("Job %s: transcribing %s", job.pk, job.audio_path)
+        try:
+            with span('transcribe'):
+                transcription = transcribe_file(job.audio_path)
+        except sr.UnknownValueError:
+            # Not a transient failure, so don't retry; nothing to summarize either
+            _update_activity(job, transcript="Speech recognition could not understand the audio")
+            _finish(job)
+            return
+        _update_activity(
+            job,
+            transcript=transcription.text,
+            transcript_segments=transcription.segments_as_dicts(),
+        )
+        job.stage = ProcessingJob.STAGE_SUMMARIZE
+        job.save(update_fields=['stage', 'updated_at'])
+
+    if job.stage == ProcessingJob.STAGE_SUMMARIZE:
+        logger.info("Job %s: summarizing", job.pk)
+        transcript = DailyActivity.objects.values_list('transcript', flat=True).get(pk=job.activity_id)
+        summary = request_summary(transcript)
+        _update_activity(job, summary=summary)
+
+    _finish(job)
+
+
+def _update_activity(job, **fields):
+    activity = DailyActivity.objects.filter(pk=job.activity_id)
+    activity.update(**fields)
+    # QuerySet.update doesn't send the signal that records the change for caching and sync
+    touch(activity)
+
+
+def _finish(job):
+    job.stage = ProcessingJob.STAGE_DONE
+    job.status = ProcessingJob.STATUS_SUCCEEDED
+    job.error = ''
+    job.save(update_fields=['stage', 'status', 'error', 'updated_at'])
+    logger.info("Job %s finished", job.pk)
+
+
+def _handle_failure(job, exc):
+    job.error = str(exc)
+    if job.attempts < job.max_attempts:
+        # Exponential backoff; the stage is kept so a retry resumes where it failed
+        delay = settings.ACTIVITY_JOB_RETRY_DELAY * (2 ** (job.attempts - 1))
+        job.status = ProcessingJob.STATUS_QUEUED
+        job.run_after = timezone.now() + timedelta(seconds=delay)
+        job.save(update_fields=['status', 'run_after', 'error', 'updated_at'])
+        logger.warning("Job %s failed (attempt %s/%s), retrying in %ss: %s",
+                       job.pk, job.attempts, job.max_attempts, delay, exc)
+        if _pool is not None:
+            # In-process mode; a standalone worker just picks the job up once it is due
+            timer = threading.Timer(delay, lambda: get_pool().submit(run_job, job.pk))
+            timer.daemon = True
+            timer.start()
+    else:
+        job.status = ProcessingJob.STATUS_FAILED
+        job.save(update_fields=['status', 'error', 'updated_at'])
+        logger.error("Job %s failed permanently after %s attempts: %s", job.pk, job.attempts, exc)
+
+
+def requeue_stale_jobs(older_than):
+    """Put jobs left 'running' by a crashed worker back on the queue."""
+    cutoff = timezone.now() - older_than
+    return ProcessingJob.objects.filter(
+        status=ProcessingJob.STATUS_RUNNING, updated_at__lt=cutoff,
+    ).update(status=ProcessingJob.STATUS_QUEUED, run_after=None)
+
+
+def run_worker(concurrency, poll_interval=2.0, once=False):
+    """Poll the job table and run due jobs on a bounded pool until interrupted."""
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='activity-job') as pool:
+        while True:
+            job_ids = due_job_ids(limit=concurrency * 2)
+            close_old_connections()
+            if job_ids:
+                wait([pool.submit(run_job, job_id) for job_id in job_ids])
+            elif once:
+                return
+            else:
+                time.sleep(poll_interval)
@@ -0,0 +1,61 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from activity.benchmarks import Benchmark, compare, ffmpeg_available, load, save
+
+
+def _csv(cast):
+    return lambda value: tuple(cast(item) for item in value.split(',') if item)
+
+
+class Command(BaseCommand):
+    help = ("Benchmark the record, audio listing, activities and profile endpoints with synthetic audio "
+            "and stubbed recognizer/OpenAI calls. Writes p50/p95/p99 latency, throughput and peak RSS "
+            "as JSON, and with --compare fails when they regress beyond --threshold.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lengths', type=_csv(float), default=(5, 30),
+                            help="Comma-separated lengths in seconds of the synthetic recordings.")
+        parser.add_argument('--formats', type=_csv(str), default=('wav',),
+                            help="Comma-separated upload formats, e.g. wav,mp3 (non-WAV needs ffmpeg).")
+        parser.add_argument('--iterations', type=int, default=20,
+                            help="Sequential test client requests per scenario.")
+        parser.add_argument('--requests', type=int, default=200, help="HTTP requests per scenario.")
+        parser.add_argument('--concurrency', type=int, default=8, help="Concurrent HTTP clients.")
+        parser.add_argument('--recognizer-latency', type=float, default=0.0,
+                            help="Seconds the stub recognizer takes per segment.")
+        parser.add_argument('--openai-latency', type=float, default=0.0,
+                            help="Seconds the stub OpenAI client takes per summary.")
+        parser.add_argument('--output', help="Write the results to this JSON file (e.g. a new baseline).")
+        parser.add_argument('--compare', metavar='BASELINE', help="Compare against this baseline JSON file.")
+        parser.add_argument('--threshold', type=float, default=0.2,
+                            help="Allowed regression as a fraction of the baseline value.")
+
+    def handle(self, *args, **options):
+        formats = options['formats']
+        if any(fmt != 'wav' for fmt in formats) and not ffmpeg_available():
+            raise CommandError("ffmpeg is required to generate non-WAV audio")
+        baseline = load(options['compare']) if options['compare'] else None
+
+        benchmark = Benchmark(
+            lengths=options['lengths'],
+            formats=formats,
+            iterations=options['iterations'],
+            requests=options['requests'],
+            concurrency=options['concurrency'],
+            recognizer_latency=options['recognizer_latency'],
+            openai_latency=options['openai_latency'],
+            log=lambda name, result: self.stdout.write(f"{name}: {result}"),
+        )
+        results = benchmark.run()
+        if options['output']:
+            save(results, options['output'])
+            self.stdout.write(f"Wrote {options['output']}")
+
+        if baseline is not None:
+            regressions = compare(baseline, results, options['threshold'])
+            if regressions:
+                for regression in regressions:
+                    self.stderr.write(regression)
+                raise CommandError(f"{len(regressions)} metric(s) regressed by more than "
+                                   f"{options['threshold']:.0%}")
+            self.stdout.write(self.style.SUCCESS("No regressions against the baseline"))
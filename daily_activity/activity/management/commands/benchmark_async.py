@@ -0,0 +1,46 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from activity.benchmarks import EndpointComparison, save
+
+SCENARIOS = ('record', 'list', 'delete')
+
+
+class Command(BaseCommand):
+    help = ("Put the same concurrent load on the sync endpoints (api/..., threaded WSGI server) and the "
+            "async ones (api/async/..., uvicorn): record, list and delete recordings, with stubbed "
+            "recognizer/OpenAI calls. Reports p50/p95/p99 latency and throughput for each.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=100,
+                            help="Recordings uploaded (and then listed and deleted as often) per server.")
+        parser.add_argument('--concurrency', type=int, default=16, help="Concurrent HTTP clients.")
+        parser.add_argument('--seconds', type=float, default=5.0, help="Length of the synthetic recordings.")
+        parser.add_argument('--output', help="Also write the results to this JSON file.")
+
+    def handle(self, *args, **options):
+        try:
+            import uvicorn  # noqa: F401
+        except ImportError:
+            raise CommandError("uvicorn is required to serve the async endpoints")
+
+        comparison = EndpointComparison(
+            requests=options['requests'],
+            concurrency=options['concurrency'],
+            seconds=options['seconds'],
+            log=lambda name, result: self.stdout.write(f"{name}: {result}"),
+        )
+        results = comparison.run()
+        if options['output']:
+            save(results, options['output'])
+            self.stdout.write(f"Wrote {options['output']}")
+
+        self.stdout.write(f"\n{'':8}{'server':8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'req/s':>10}{'errors':>8}")
+        for scenario in SCENARIOS:
+            for server in ('wsgi', 'asgi'):
+                result = results['results'][f'{server}:{scenario}']
+                self.stdout.write(f"{scenario:8}{server:8}{result['p50_ms']:>10}{result['p95_ms']:>10}"
+                                  f"{result['p99_ms']:>10}{result['throughput_rps']:>10}{result['errors']:>8}")
+            sync_rps = results['results'][f'wsgi:{scenario}']['throughput_rps']
+            async_rps = results['results'][f'asgi:{scenario}']['throughput_rps']
+            if sync_rps:
+                self.stdout.write(f"{scenario:8}async/sync throughput: {async_rps / sync_rps:.2f}x")
@@ -0,0 +1,18 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from activity.uploads import cleanup_abandoned_uploads
+
+
+class Command(BaseCommand):
+    help = "Delete resumable upload sessions (and their chunk files) that have been abandoned."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--older-than', type=int, default=settings.ACTIVITY_UPLOAD_SESSION_TTL_HOURS,
+                            help="Remove sessions not touched for this many hours.")
+
+    def handle(self, *args, **options):
+        removed = cleanup_abandoned_uploads(timedelta(hours=options['older_than']))
+        self.stdout.write(f"Removed {removed} upload session(s)")
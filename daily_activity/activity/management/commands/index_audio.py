@@ -0,0 +1,124 @@
+import os
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from activity.blobs import reconcile_ref_counts
+from activity.models import AudioRecording
+from activity.recordings import index_recording
+
+
+def _parse_date(name):
+    try:
+        return datetime.strptime(name, '%Y-%m-%d').date()
+    except ValueError:
+        return None
+
+
+class Command(BaseCommand):
+    help = ("Backfill or reconcile the AudioRecording index with the .wav files stored under "
+            "MEDIA_ROOT/audio/<user_id>/<date>/, and recount the references to content-addressed blobs. "
+            "Files in legacy shared MEDIA_ROOT/audio/<date>/ folders are moved to the folders of "
+            "ACTIVITY_LEGACY_OWNER (or of the only account) and indexed as theirs.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--prune', action='store_true',
+                            help="Delete index rows whose file no longer exists on disk.")
+
+    def _date_folders(self, audio_root):
+        """Yield (user_id or None, date, path) for every date folder."""
+        for entry in os.scandir(audio_root):
+            if not entry.is_dir():
+                continue
+            date = _parse_date(entry.name)
+            if date is not None:
+                yield None, date, entry.path
+            elif entry.name.isdigit():
+                for date_entry in os.scandir(entry.path):
+                    date = _parse_date(date_entry.name)
+                    if date_entry.is_dir() and date is not None:
+                        yield int(entry.name), date, date_entry.path
+
+    def _legacy_owner(self):
+        if settings.ACTIVITY_LEGACY_OWNER:
+            owner = User.objects.filter(username=settings.ACTIVITY_LEGACY_OWNER).first()
+            if owner is None:
+                raise CommandError(f"ACTIVITY_LEGACY_OWNER: there is no user named {settings.ACTIVITY_LEGACY_OWNER!r}")
+            return owner
+        users = list(User.objects.all()[:2])
+        return users[0] if len(users) == 1 else None
+
+    def _adopt_legacy_folder(self, folder, date, owner):
+        """Move the files of a shared date folder into the owner's; returns the owner's folder."""
+        destination = os.path.join(settings.MEDIA_ROOT, 'audio', str(owner.pk), str(date))
+        os.makedirs(destination, exist_ok=True)
+        for entry in os.scandir(folder):
+            if not entry.is_file() or not entry.name.endswith('.wav'):
+                continue
+            target = os.path.join(destination, entry.name)
+            if os.path.exists(target):
+                self.stderr.write(f"Not moving {entry.path}: {target} already exists")
+                continue
+            os.replace(entry.path, target)
+        return destination
+
+    def handle(self, *args, **options):
+        audio_root = os.path.join(settings.MEDIA_ROOT, 'audio')
+        indexed = {
+            (user_id, str(date), filename): size
+            for user_id, date, filename, size in AudioRecording.objects.filter(blob__isnull=True).values_list(
+                'user_id', 'date', 'filename', 'size')
+        }
+        users = {}
+        seen = set()
+        added = updated = 0
+
+        if os.path.isdir(audio_root):
+            legacy_owner = self._legacy_owner()
+            # Listed up front: adopting legacy folders adds per-user ones while scanning
+            for user_id, date, folder in list(self._date_folders(audio_root)):
+                if user_id is None:
+                    if legacy_owner is None:
+                        self.stderr.write(f"Skipping {folder}: set ACTIVITY_LEGACY_OWNER to the user who owns it")
+                        continue
+                    user_id, folder = legacy_owner.pk, self._adopt_legacy_folder(folder, date, legacy_owner)
+                    users[user_id] = legacy_owner
+                if user_id not in users:
+                    users[user_id] = User.objects.filter(pk=user_id).first()
+                    if users[user_id] is None:
+                        self.stderr.write(f"Skipping {os.path.dirname(folder)}: no user with id {user_id}")
+                if users[user_id] is None:
+                    continue
+
+                for entry in os.scandir(folder):
+                    if not entry.is_file() or not entry.name.endswith('.wav'):
+                        continue
+                    key = (user_id, str(date), entry.name)
+                    seen.add(key)
+                    stat = entry.stat()
+                    if key in indexed and indexed[key] == stat.st_size:
+                        continue
+                    index_recording(
+                        entry.path, date, user=users[user_id],
+                        created_at=datetime.fromtimestamp(stat.st_mtime, tz=dt_timezone.utc) if key not in indexed else None,
+                    )
+                    if key in indexed:
+                        updated += 1
+                    else:
+                        added += 1
+
+        missing = set(indexed) - seen
+        self.stdout.write(f"Indexed {added} new and refreshed {updated} changed recording(s)")
+        if missing:
+            if options['prune']:
+                for user_id, date, filename in missing:
+                    AudioRecording.objects.filter(user_id=user_id, date=date, filename=filename, blob__isnull=True).delete()
+                self.stdout.write(f"Removed {len(missing)} index row(s) for missing files")
+            else:
+                self.stdout.write(f"{len(missing)} indexed recording(s) are missing on disk (use --prune to remove)")
+
+        fixed = reconcile_ref_counts()
+        if fixed:
+            self.stdout.write(f"Corrected the reference count of {fixed} blob(s)")
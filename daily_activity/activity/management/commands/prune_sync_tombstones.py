@@ -0,0 +1,19 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from activity.sync import prune_tombstones
+
+
+class Command(BaseCommand):
+    help = ("Delete sync tombstones of deleted activities and recordings once they are older than the sync token "
+            "lifetime. Meant to run periodically, e.g. from cron.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--older-than', type=int, default=settings.ACTIVITY_SYNC_TOMBSTONE_DAYS,
+                            help="Remove tombstones older than this many days.")
+
+    def handle(self, *args, **options):
+        removed = prune_tombstones(timedelta(days=options['older_than']))
+        self.stdout.write(f"Removed {removed} tombstone(s)")
@@ -0,0 +1,21 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from activity.rollups import rebuild_rollups
+
+
+class Command(BaseCommand):
+    help = "Recompute the daily/weekly/monthly spending rollups from the activity table."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--user', help="Only rebuild the rollups of this username.")
+
+    def handle(self, *args, **options):
+        user = None
+        if options['user']:
+            try:
+                user = User.objects.get(username=options['user'])
+            except User.DoesNotExist:
+                raise CommandError(f"Unknown user {options['user']}")
+        written = rebuild_rollups(user)
+        self.stdout.write(f"Wrote {written} rollup row(s)")
@@ -0,0 +1,30 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from activity.jobs import requeue_stale_jobs, run_worker
+
+
+class Command(BaseCommand):
+    help = "Run a standalone worker for queued transcription/summarization jobs."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--concurrency', type=int, default=settings.ACTIVITY_JOB_WORKERS,
+                            help="Number of jobs to run in parallel.")
+        parser.add_argument('--poll-interval', type=float, default=2.0,
+                            help="Seconds to wait between polls when the queue is empty.")
+        parser.add_argument('--stale-after', type=int, default=3600,
+                            help="Requeue jobs stuck in 'running' for longer than this many seconds.")
+        parser.add_argument('--once', action='store_true',
+                            help="Exit once the queue is empty instead of polling forever.")
+
+    def handle(self, *args, **options):
+        requeued = requeue_stale_jobs(timedelta(seconds=options['stale_after']))
+        if requeued:
+            self.stdout.write(f"Requeued {requeued} stale job(s)")
+        self.stdout.write(f"Running jobs with concurrency {options['concurrency']}")
+        try:
+            run_worker(options['concurrency'], poll_interval=options['poll_interval'], once=options['once'])
+        except KeyboardInterrupt:
+            self.stdout.write("Worker stopped")
@@ -0,0 +1,72 @@
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# Only needed once audio is processed or a summary is requested; see activity/utility/utils.py
+LAZY_MODULES = ('openai', 'speech_recognition', 'pydub', 'PIL', 'dotenv', 'numpy')
+
+PROBE = """
+import json, os, sys, time
+start = time.perf_counter()
+import django
+django.setup()
+from django.urls import get_resolver
+get_resolver().url_patterns
+elapsed = time.perf_counter() - start
+print(json.dumps({'seconds': elapsed, 'loaded': [m for m in %r if m in sys.modules]}))
+""" % (LAZY_MODULES,)
+
+
+def _run_probe(importtime=False):
+    command = [sys.executable] + (['-X', 'importtime'] if importtime else []) + ['-c', PROBE]
+    env = dict(os.environ, DJANGO_SETTINGS_MODULE=os.environ.get('DJANGO_SETTINGS_MODULE', 'daily_activity.settings'))
+    result = subprocess.run(command, capture_output=True, text=True, cwd=settings.BASE_DIR, env=env)
+    if result.returncode != 0:
+        raise CommandError(f"Startup probe failed:\n{result.stderr}")
+    return json.loads(result.stdout.strip().splitlines()[-1]), result.stderr
+
+
+class Command(BaseCommand):
+    help = ("Measure django.setup() plus URLconf loading in fresh interpreters and fail if it exceeds "
+            "the budget or imports heavy dependencies that should load lazily.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--budget', type=float, default=1.0, help="Allowed median startup time in seconds.")
+        parser.add_argument('--runs', type=int, default=5, help="Fresh interpreters to measure.")
+        parser.add_argument('--top', type=int, default=0,
+                            help="Also list the N slowest imports (cumulative, from python -X importtime).")
+
+    def handle(self, *args, **options):
+        timings = []
+        loaded = set()
+        for _ in range(options['runs']):
+            probe, _ = _run_probe()
+            timings.append(probe['seconds'])
+            loaded.update(probe['loaded'])
+        median = statistics.median(timings)
+        self.stdout.write(f"django.setup() + URLconf: median {median:.3f}s, "
+                          f"min {min(timings):.3f}s, max {max(timings):.3f}s over {len(timings)} run(s)")
+
+        if options['top']:
+            _, importtime = _run_probe(importtime=True)
+            rows = []
+            for line in importtime.splitlines():
+                parts = line.split('|')
+                if line.startswith('import time:') and len(parts) == 3 and parts[1].strip().isdigit():
+                    rows.append((int(parts[1]), parts[2].strip()))
+            for cumulative, module in sorted(rows, reverse=True)[:options['top']]:
+                self.stdout.write(f"  {cumulative / 1000:8.1f}ms  {module}")
+
+        problems = []
+        if loaded:
+            problems.append(f"imported at startup: {', '.join(sorted(loaded))}")
+        if median > options['budget']:
+            problems.append(f"median {median:.3f}s exceeds the {options['budget']:.3f}s budget")
+        if problems:
+            raise CommandError('; '.join(problems))
+        self.stdout.write(self.style.SUCCESS("Startup is within budget"))
@@ -0,0 +1,42 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from activity.tiering import RAW_ARCHIVE, RAW_DELETE, purge_archive, tier_recordings
+from activity.utility.audio import ENCODINGS
+
+
+class Command(BaseCommand):
+    help = ("Re-encode WAV recordings older than --age-days to FLAC or Opus, retire the raw WAVs "
+            "(delete or archive) and purge archived files past their retention. Meant to run periodically, e.g. from cron.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--age-days', type=int, default=settings.ACTIVITY_TIERING_AGE_DAYS,
+                            help="Tier recordings whose newest upload is older than this many days.")
+        parser.add_argument('--format', choices=sorted(ENCODINGS), default=settings.ACTIVITY_TIERING_FORMAT)
+        parser.add_argument('--bitrate', default=settings.ACTIVITY_TIERING_OPUS_BITRATE, help="Opus bitrate, e.g. 32k.")
+        parser.add_argument('--raw', choices=[RAW_DELETE, RAW_ARCHIVE], default=settings.ACTIVITY_TIERING_RAW_RETENTION,
+                            help="What to do with the raw WAV once re-encoded.")
+        parser.add_argument('--limit', type=int, default=None, help="Tier at most this many recordings.")
+        parser.add_argument('--dry-run', action='store_true', help="Only report what would be tiered.")
+
+    def handle(self, *args, **options):
+        result = tier_recordings(
+            older_than=timedelta(days=options['age_days']), extension=options['format'],
+            bitrate=options['bitrate'], raw_policy=options['raw'], limit=options['limit'], dry_run=options['dry_run'],
+        )
+        if options['dry_run']:
+            self.stdout.write(f"Would adopt {result.adopted} legacy recording(s) and tier {result.tiered} "
+                              f"blob(s) ({result.bytes_before / 1024 ** 2:.1f} MiB of WAV)")
+            return
+
+        self.stdout.write(f"Adopted {result.adopted} legacy recording(s) into blobs")
+        ratio = f", {result.bytes_before / result.bytes_after:.1f}x smaller" if result.bytes_after else ''
+        self.stdout.write(f"Tiered {result.tiered} blob(s) to {options['format']}: "
+                          f"{result.bytes_before / 1024 ** 2:.1f} MiB -> {result.bytes_after / 1024 ** 2:.1f} MiB{ratio}")
+        if result.failed:
+            self.stderr.write(f"{result.failed} blob(s) could not be re-encoded (see the log)")
+        removed = purge_archive()
+        if removed:
+            self.stdout.write(f"Purged {removed} archived raw file(s)")
@@ -0,0 +1,111 @@
+import logging
+import re
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.utils.cache import patch_vary_headers
+from django.utils.deprecation import MiddlewareMixin
+from django.utils.text import compress_string
+
+try:
+    import brotli
+except ImportError:  # Optional: without it responses are gzip-compressed only
+    brotli = None
+
+from .utility.metrics import end_breakdown, registry, start_breakdown
+
+logger = logging.getLogger('activity_logger')
+
+request_seconds = registry.histogram(
+    'activity_request_seconds', 'HTTP request latency by route.', ['route', 'method'],
+)
+requests_total = registry.counter(
+    'activity_requests_total', 'HTTP requests by route and response status.', ['route', 'method', 'status'],
+)
+
+
+class TimingMiddleware:
+    """
+    Record the latency of every request per URL route, and optionally log the time
+    spent in each span(...) stage while handling it (ACTIVITY_METRICS_LOG_TIMINGS).
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        token = start_breakdown()
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            breakdown = end_breakdown(token)
+        self._record(request, response, time.perf_counter() - start, breakdown)
+        return response
+
+    async def __acall__(self, request):
+        token = start_breakdown()
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            breakdown = end_breakdown(token)
+        self._record(request, response, time.perf_counter() - start, breakdown)
+        return response
+
+    def _record(self, request, response, elapsed, breakdown):
+        # The route pattern rather than the path keeps the number of series bounded
+        match = request.resolver_match
+        route = match.route if match is not None else 'unmatched'
+        request_seconds.observe(elapsed, route, request.method)
+        requests_total.inc(route, request.method, str(response.status_code))
+        if settings.ACTIVITY_METRICS_LOG_TIMINGS:
+            stages = ' '.join(f'{stage}={seconds * 1000:.1f}ms' for stage, seconds in breakdown)
+            logger.info("%s %s %s total=%.1fms %s", request.method, request.path, response.status_code,
+                        elapsed * 1000, stages)
+
+
+COMPRESSIBLE_TYPES = ('application/json', 'text/')
+accepts_br = re.compile(r'\bbr\b')
+accepts_gzip = re.compile(r'\bgzip\b')
+
+
+class CompressionMiddleware(MiddlewareMixin):
+    """
+    Compress JSON and text responses with Brotli or gzip, whichever the client accepts
+    (Brotli preferred). Audio, streamed and partial responses are passed through, as are
+    bodies under ACTIVITY_COMPRESS_MIN_BYTES.
+    """
+    def process_response(self, request, response):
+        if (response.streaming or response.has_header('Content-Encoding') or response.status_code == 206
+                or not response.get('Content-Type', '').startswith(COMPRESSIBLE_TYPES)):
+            return response
+        if len(response.content) < settings.ACTIVITY_COMPRESS_MIN_BYTES:
+            return response
+        patch_vary_headers(response, ('Accept-Encoding',))
+
+        accept_encoding = request.META.get('HTTP_ACCEPT_ENCODING', '')
+        if brotli is not None and accepts_br.search(accept_encoding):
+            encoding, compressed = 'br', brotli.compress(response.content, quality=5)
+        elif accepts_gzip.search(accept_encoding):
+            encoding, compressed = 'gzip', compress_string(response.content)
+        else:
+            return response
+        if len(compressed) >= len(response.content):
+            return response
+
+        response.content = compressed
+        response['Content-Length'] = str(len(compressed))
+        response['Content-Encoding'] = encoding
+        # The compressed bytes differ from the identity ones, so a strong ETag no longer holds
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response['ETag'] = 'W/' + etag
+        return response
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:42
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('activity', '0004_upload_sessions'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AudioRecording',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField()),
+                ('filename', models.CharField(max_length=255)),
+                ('size', models.BigIntegerField(default=0)),
+                ('duration', models.FloatField(blank=True, null=True)),
+                ('codec', models.CharField(blank=True, max_length=32)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('activity', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='recordings', to='activity.dailyactivity')),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['date', 'created_at'], name='recording_date_created_idx')],
+                'constraints': [models.UniqueConstraint(fields=('date', 'filename'), name='unique_recording_date_filename')],
+            },
+        ),
+    ]
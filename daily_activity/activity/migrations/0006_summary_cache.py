@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:43
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('activity', '0005_audio_recording_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SummaryCacheEntry',
+            fields=[
+                ('key', models.CharField(max_length=64, primary_key=True, serialize=False)),
+                ('model', models.CharField(max_length=100)),
+                ('summary', models.TextField()),
+                ('size', models.PositiveIntegerField()),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('last_used_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['last_used_at'], name='summary_cache_last_used_idx'), models.Index(fields=['created_at'], name='summary_cache_created_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('activity', '0006_summary_cache'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='dailyactivity',
+            name='transcript_segments',
+            field=models.JSONField(blank=True, default=list),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('activity', '0007_transcript_segments'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='dailyactivity',
+            name='date',
+            field=models.DateField(db_index=True),
+        ),
+    ]
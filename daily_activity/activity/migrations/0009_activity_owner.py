@@ -0,0 +1,41 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:45
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('activity', '0008_dailyactivity_date_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveConstraint(
+            model_name='audiorecording',
+            name='unique_recording_date_filename',
+        ),
+        migrations.RemoveIndex(
+            model_name='audiorecording',
+            name='recording_date_created_idx',
+        ),
+        migrations.AddField(
+            model_name='dailyactivity',
+            name='user',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='activities', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='audiorecording',
+            index=models.Index(fields=['user', 'date', 'created_at'], name='recording_user_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='dailyactivity',
+            index=models.Index(fields=['user', 'date'], name='activity_user_date_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='audiorecording',
+            constraint=models.UniqueConstraint(fields=('user', 'date', 'filename'), name='unique_recording_user_date_filename'),
+        ),
+    ]
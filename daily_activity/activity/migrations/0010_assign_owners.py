@@ -0,0 +1,101 @@
+# Assigns owners to existing activities/recordings and moves indexed recordings
+# from the shared 'audio/<date>/' folders into per-user 'audio/<user_id>/<date>/' folders.
+# Rows whose owner can't be traced (through their job, recording or activity) go to the
+# only account, or with several accounts to the one named by ACTIVITY_LEGACY_OWNER; without
+# it the migration fails rather than leave them unowned and invisible to everyone.
+
+import os
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import migrations
+
+
+def _legacy_path(recording):
+    return os.path.join('audio', str(recording.date), recording.filename)
+
+
+def _user_path(recording):
+    return os.path.join('audio', str(recording.user_id), str(recording.date), recording.filename)
+
+
+def _move(apps, recording, old_relative, new_relative):
+    DailyActivity = apps.get_model('activity', 'DailyActivity')
+    ProcessingJob = apps.get_model('activity', 'ProcessingJob')
+
+    old_path = os.path.join(settings.MEDIA_ROOT, old_relative)
+    new_path = os.path.join(settings.MEDIA_ROOT, new_relative)
+    if not os.path.exists(old_path) or os.path.exists(new_path):
+        return
+    os.makedirs(os.path.dirname(new_path), exist_ok=True)
+    os.replace(old_path, new_path)
+    DailyActivity.objects.filter(audio_file=old_relative).update(audio_file=new_relative)
+    ProcessingJob.objects.filter(audio_path=old_path).update(audio_path=new_path)
+
+
+def _fallback_owner_id(apps):
+    User = apps.get_model('auth', 'User')
+    username = getattr(settings, 'ACTIVITY_LEGACY_OWNER', None)
+    if username:
+        owner_id = User.objects.filter(username=username).values_list('pk', flat=True).first()
+        if owner_id is None:
+            raise ImproperlyConfigured(f"ACTIVITY_LEGACY_OWNER: there is no user named {username!r}")
+        return owner_id
+    if User.objects.count() == 1:
+        return User.objects.values_list('pk', flat=True).get()
+    return None
+
+
+def assign_owners(apps, schema_editor):
+    DailyActivity = apps.get_model('activity', 'DailyActivity')
+    AudioRecording = apps.get_model('activity', 'AudioRecording')
+    ProcessingJob = apps.get_model('activity', 'ProcessingJob')
+
+    fallback_owner_id = _fallback_owner_id(apps)
+
+    for activity in DailyActivity.objects.filter(user__isnull=True).iterator():
+        owner_id = (
+            ProcessingJob.objects.filter(activity=activity, user__isnull=False).values_list('user_id', flat=True).first()
+            or AudioRecording.objects.filter(activity=activity, user__isnull=False).values_list('user_id', flat=True).first()
+            or fallback_owner_id
+        )
+        if owner_id:
+            DailyActivity.objects.filter(pk=activity.pk).update(user_id=owner_id)
+
+    for recording in AudioRecording.objects.filter(user__isnull=True).iterator():
+        owner_id = None
+        if recording.activity_id:
+            owner_id = DailyActivity.objects.filter(pk=recording.activity_id).values_list('user_id', flat=True).first()
+        owner_id = owner_id or fallback_owner_id
+        if owner_id:
+            recording.user_id = owner_id
+            recording.save(update_fields=['user'])
+
+    # Checked before any file is moved, so that failing here (which rolls back the rows) leaves the files alone
+    unowned = (DailyActivity.objects.filter(user__isnull=True).count(),
+               AudioRecording.objects.filter(user__isnull=True).count())
+    if any(unowned):
+        raise ImproperlyConfigured(
+            f"{unowned[0]} activities and {unowned[1]} recordings have no traceable owner. Set "
+            f"ACTIVITY_LEGACY_OWNER to the username that should own them, then migrate again."
+        )
+
+    for recording in AudioRecording.objects.all().iterator():
+        _move(apps, recording, _legacy_path(recording), _user_path(recording))
+
+
+def move_back(apps, schema_editor):
+    AudioRecording = apps.get_model('activity', 'AudioRecording')
+    for recording in AudioRecording.objects.filter(user__isnull=False).iterator():
+        _move(apps, recording, _user_path(recording), _legacy_path(recording))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('activity', '0009_activity_owner'),
+    ]
+
+    operations = [
+        migrations.RunPython(assign_owners, move_back),
+    ]
@@ -0,0 +1,25 @@
+# Full-text search index over DailyActivity.transcript/summary (see activity/search.py):
+# an FTS5 table plus sync triggers on SQLite, a GIN tsvector index on PostgreSQL.
+
+from django.db import migrations
+
+
+def create_search_index(apps, schema_editor):
+    from activity.search import ensure_search_index
+    ensure_search_index(schema_editor.connection)
+
+
+def drop_search_index(apps, schema_editor):
+    from activity.search import drop_search_index
+    drop_search_index(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('activity', '0010_assign_owners'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:50
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncDay, TruncMonth, TruncWeek
+
+
+def populate_rollups(apps, schema_editor):
+    DailyActivity = apps.get_model('activity', 'DailyActivity')
+    SpendingRollup = apps.get_model('activity', 'SpendingRollup')
+    activities = DailyActivity.objects.filter(user__isnull=False)
+    rows = []
+    for period, truncation in (('day', TruncDay('date')), ('week', TruncWeek('date')), ('month', TruncMonth('date'))):
+        totals = (activities.annotate(start=truncation).values('user_id', 'start')
+                  .annotate(total=Sum('spending'), count=Count('id')).order_by())
+        rows.extend(
+            SpendingRollup(user_id=row['user_id'], period=period, period_start=row['start'],
+                           total=row['total'] or 0, count=row['count'])
+            for row in totals
+        )
+    SpendingRollup.objects.bulk_create(rows, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('activity', '0011_activity_search_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SpendingRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period', models.CharField(choices=[('day', 'Day'), ('week', 'Week'), ('month', 'Month')], max_length=8)),
+                ('period_start', models.DateField()),
+                ('total', models.FloatField(default=0)),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='spending_rollups', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('user', 'period', 'period_start'), name='unique_spending_rollup')],
+            },
+        ),
+        migrations.RunPython(populate_rollups, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:52
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('activity', '0012_spending_rollup'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='profile',
+            name='thumbnails',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:07
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('activity', '0013_profile_thumbnails'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AudioBlob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('digest', models.CharField(max_length=64, unique=True)),
+                ('size', models.BigIntegerField(default=0)),
+                ('duration', models.FloatField(blank=True, null=True)),
+                ('codec', models.CharField(blank=True, max_length=32)),
+                ('ref_count', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='audiorecording',
+            name='blob',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='recordings', to='activity.audioblob'),
+        ),
+    ]
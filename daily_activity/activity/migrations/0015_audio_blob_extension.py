@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('activity', '0014_audio_blob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='audioblob',
+            name='extension',
+            field=models.CharField(default='wav', max_length=8),
+        ),
+    ]
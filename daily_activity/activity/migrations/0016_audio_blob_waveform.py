@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('activity', '0015_audio_blob_extension'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='audioblob',
+            name='channels',
+            field=models.PositiveSmallIntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='audioblob',
+            name='peaks',
+            field=models.JSONField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='audioblob',
+            name='sample_rate',
+            field=models.PositiveIntegerField(blank=True, null=True),
+        ),
+    ]
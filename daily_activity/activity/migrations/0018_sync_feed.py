@@ -0,0 +1,78 @@
+# Generated by Django 5.2.18 on 2026-10-18 15:18
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import F, Max
+
+
+def stamp_existing_rows(apps, schema_editor):
+    # Existing rows get distinct versions (their ids), so the first sync pages through them
+    # like any other changes; each owner's counter then starts above all of them
+    DailyActivity = apps.get_model('activity', 'DailyActivity')
+    AudioRecording = apps.get_model('activity', 'AudioRecording')
+    DataVersion = apps.get_model('activity', 'DataVersion')
+    DailyActivity.objects.update(sync_version=F('id'))
+    AudioRecording.objects.update(sync_version=F('id'))
+    top = max(DailyActivity.objects.aggregate(top=Max('id'))['top'] or 0,
+              AudioRecording.objects.aggregate(top=Max('id'))['top'] or 0)
+    user_ids = (set(DailyActivity.objects.filter(user__isnull=False).values_list('user_id', flat=True))
+                | set(AudioRecording.objects.filter(user__isnull=False).values_list('user_id', flat=True)))
+    DataVersion.objects.bulk_create(
+        [DataVersion(user_id=user_id, scope='sync', version=top) for user_id in user_ids], batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('activity', '0017_data_version'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SyncTombstone',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('activity', 'Activity'), ('recording', 'Recording')], max_length=16)),
+                ('object_id', models.BigIntegerField()),
+                ('sync_version', models.BigIntegerField()),
+                ('deleted_at', models.DateTimeField(db_index=True, default=django.utils.timezone.now)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='audiorecording',
+            name='sync_version',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='dailyactivity',
+            name='sync_version',
+            field=models.BigIntegerField(default=0),
+        ),
+        migrations.AlterField(
+            model_name='dataversion',
+            name='scope',
+            field=models.CharField(choices=[('activities', 'Activities'), ('recordings', 'Recordings'), ('profile', 'Profile'), ('sync', 'Sync')], max_length=16),
+        ),
+        migrations.AddIndex(
+            model_name='audiorecording',
+            index=models.Index(fields=['user', 'sync_version'], name='recording_user_sync_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='dailyactivity',
+            index=models.Index(fields=['user', 'sync_version'], name='activity_user_sync_idx'),
+        ),
+        migrations.AddField(
+            model_name='synctombstone',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='sync_tombstones', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='synctombstone',
+            index=models.Index(fields=['user', 'sync_version'], name='tombstone_user_sync_idx'),
+        ),
+        migrations.RunPython(stamp_existing_rows, migrations.RunPython.noop),
+    ]
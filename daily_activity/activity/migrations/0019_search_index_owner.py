@@ -0,0 +1,23 @@
+# Re-create the SQLite full-text index with the owner's user_id as an indexed column, so
+# searches are matched within the user's own activities (see activity/search.py).
+
+from django.db import migrations
+
+
+def recreate_search_index(apps, schema_editor):
+    from activity.search import drop_search_index, ensure_search_index
+    if schema_editor.connection.vendor != 'sqlite':
+        return  # The PostgreSQL index already filters on user_id
+    drop_search_index(schema_editor.connection)
+    ensure_search_index(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('activity', '0018_sync_feed'),
+    ]
+
+    operations = [
+        migrations.RunPython(recreate_search_index, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,40 @@
+# Every activity and recording has an owner from here on. Databases that ran 0010 before it
+# refused to leave rows unowned get their remaining rows assigned (or the migration stops) first.
+# The date index is dropped: the (user, date) indexes serve every date query.
+
+from importlib import import_module
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def assign_remaining_owners(apps, schema_editor):
+    import_module('activity.migrations.0010_assign_owners').assign_owners(apps, schema_editor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('activity', '0019_search_index_owner'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(assign_remaining_owners, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='dailyactivity',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='activities', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterField(
+            model_name='dailyactivity',
+            name='date',
+            field=models.DateField(),
+        ),
+        migrations.AlterField(
+            model_name='audiorecording',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL),
+        ),
+    ]
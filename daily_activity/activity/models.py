@@ -1,4 +1,9 @@
+import os
+import uuid
+
+from django.conf import settings
 from django.db import models
+from django.utils import timezone
 from django.contrib.auth.models import User
 
 # Function to store audio files in a directory based on the date
@@ -7,21 +12,288 @@ def audio_directory_path(instance, filename):
     return f'audios/{instance.date}/{filename}'
 
 
+def recording_relative_path(user_id, date, filename):
+    # Recordings are sharded per user: 'audio/<user_id>/YYYY-MM-DD/<filename>'
+    return os.path.join('audio', str(user_id), str(date), filename)
+
+
+def blob_relative_path(digest, extension='wav'):
+    # Content-addressed audio is fanned out over 'blobs/<aa>/<bb>/<sha256>.<ext>' to keep directories small
+    return os.path.join('blobs', digest[:2], digest[2:4], f'{digest}.{extension}')
+
+
 # Model to store daily activities
 class DailyActivity(models.Model):
-    date = models.DateField()
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='activities')
+    date = models.DateField()  # Queried per user, through the (user, date) index
     audio_file = models.FileField(upload_to=audio_directory_path, null=True, blank=True) 
     transcript = models.TextField(blank=True)
+    transcript_segments = models.JSONField(default=list, blank=True)  # [{'start', 'end', 'text'}], seconds
     summary = models.TextField(blank=True)
     reminders = models.TextField(blank=True)
     spending = models.FloatField(default=0)
+    sync_version = models.BigIntegerField(default=0)  # Owner's sync counter at the last change, see activity/sync.py
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'date'], name='activity_user_date_idx'),
+            models.Index(fields=['user', 'sync_version'], name='activity_user_sync_idx'),
+        ]
 
     def __str__(self):
         return f"Activity on {self.date}"  # String representation for easy identification in admin
 
+# Audio stored once per distinct upload under MEDIA_ROOT/blobs/ and shared by its AudioRecordings (see activity/blobs.py)
+class AudioBlob(models.Model):
+    digest = models.CharField(max_length=64, unique=True)  # SHA-256 of the audio as uploaded
+    size = models.BigIntegerField(default=0)  # Bytes stored
+    duration = models.FloatField(null=True, blank=True)  # Seconds
+    sample_rate = models.PositiveIntegerField(null=True, blank=True)  # Hz
+    channels = models.PositiveSmallIntegerField(null=True, blank=True)
+    # Peak amplitudes (0-1) over PEAK_BUCKETS equal slices, see activity/utility/waveform.py
+    peaks = models.JSONField(null=True, blank=True)
+    codec = models.CharField(max_length=32, blank=True)
+    extension = models.CharField(max_length=8, default='wav')  # 'flac' or 'opus' once tiered, see activity/tiering.py
+    ref_count = models.PositiveIntegerField(default=0)  # AudioRecordings referencing it
+    created_at = models.DateTimeField(default=timezone.now)
+
+    @property
+    def relative_path(self):
+        return blob_relative_path(self.digest, self.extension)
+
+    @property
+    def path(self):
+        return os.path.join(settings.MEDIA_ROOT, self.relative_path)
+
+    def __str__(self):
+        return self.digest
+
+# Index of the recordings stored under MEDIA_ROOT/audio/, so listings don't have to touch the filesystem.
+# Recordings uploaded since content addressing are references to an AudioBlob instead of files of their own
+class AudioRecording(models.Model):
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    activity = models.ForeignKey(DailyActivity, on_delete=models.SET_NULL, null=True, blank=True,
+                                 related_name='recordings')
+    blob = models.ForeignKey(AudioBlob, on_delete=models.PROTECT, null=True, blank=True,
+                             related_name='recordings')  # None for files stored under MEDIA_ROOT/audio/
+    date = models.DateField()
+    filename = models.CharField(max_length=255)
+    size = models.BigIntegerField(default=0)  # Bytes
+    duration = models.FloatField(null=True, blank=True)  # Seconds
+    codec = models.CharField(max_length=32, blank=True)
+    created_at = models.DateTimeField(default=timezone.now)
+    sync_version = models.BigIntegerField(default=0)  # Owner's sync counter at the last change, see activity/sync.py
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'date', 'filename'], name='unique_recording_user_date_filename'),
+        ]
+        indexes = [
+            models.Index(fields=['user', 'date', 'created_at'], name='recording_user_date_idx'),
+            models.Index(fields=['user', 'sync_version'], name='recording_user_sync_idx'),
+        ]
+
+    @property
+    def relative_path(self):
+        if self.blob_id is not None:
+            return self.blob.relative_path
+        return recording_relative_path(self.user_id, self.date, self.filename)
+
+    @property
+    def path(self):
+        return os.path.join(settings.MEDIA_ROOT, self.relative_path)
+
+    def __str__(self):
+        return f"{self.filename} ({self.date})"
+
 class Profile(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE)
     profile_photo = models.ImageField(upload_to='profile_pics/', blank=True)
+    # Resized copies of profile_photo: {"<size>": {"webp": <path>, "jpeg": <path>}}, see activity/profiles.py
+    thumbnails = models.JSONField(default=dict, blank=True)
+
+    def __str__(self):
+        return self.user.username
+
+# Background transcribe -> summarize job for an uploaded recording (see activity/jobs.py)
+class ProcessingJob(models.Model):
+    STATUS_QUEUED = 'queued'
+    STATUS_RUNNING = 'running'
+    STATUS_SUCCEEDED = 'succeeded'
+    STATUS_FAILED = 'failed'
+    STATUS_CHOICES = [
+        (STATUS_QUEUED, 'Queued'),
+        (STATUS_RUNNING, 'Running'),
+        (STATUS_SUCCEEDED, 'Succeeded'),
+        (STATUS_FAILED, 'Failed'),
+    ]
+
+    STAGE_TRANSCRIBE = 'transcribe'
+    STAGE_SUMMARIZE = 'summarize'
+    STAGE_DONE = 'done'
+    STAGE_CHOICES = [
+        (STAGE_TRANSCRIBE, 'Transcribing'),
+        (STAGE_SUMMARIZE, 'Summarizing'),
+        (STAGE_DONE, 'Done'),
+    ]
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True)
+    activity = models.ForeignKey(DailyActivity, on_delete=models.CASCADE, related_name='jobs')
+    audio_path = models.CharField(max_length=500)  # Absolute path of the saved audio (updated when it is tiered)
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=STATUS_QUEUED)
+    stage = models.CharField(max_length=16, choices=STAGE_CHOICES, default=STAGE_TRANSCRIBE)
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=3)
+    error = models.TextField(blank=True)
+    run_after = models.DateTimeField(null=True, blank=True)  # Earliest time a retry may run
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'run_after'], name='job_status_run_after_idx'),
+        ]
+
+    def __str__(self):
+        return f"Job {self.pk} ({self.status}/{self.stage}) for activity {self.activity_id}"
+
+
+# Resumable upload of a long recording, sent as numbered chunks (see activity/uploads.py)
+class UploadSession(models.Model):
+    STATUS_OPEN = 'open'
+    STATUS_FINALIZING = 'finalizing'
+    STATUS_COMPLETED = 'completed'
+    STATUS_CHOICES = [
+        (STATUS_OPEN, 'Open'),
+        (STATUS_FINALIZING, 'Finalizing'),
+        (STATUS_COMPLETED, 'Completed'),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    date = models.DateField()
+    file_name = models.CharField(max_length=255, blank=True)  # Original name, informational only
+    total_size = models.BigIntegerField(null=True, blank=True)  # Expected size in bytes, if known up front
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=STATUS_OPEN)
+    activity = models.ForeignKey(DailyActivity, on_delete=models.SET_NULL, null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'updated_at'], name='upload_status_updated_idx'),
+        ]
+
+    def __str__(self):
+        return f"Upload {self.id} ({self.status}) by {self.user}"
+
+
+class UploadChunk(models.Model):
+    session = models.ForeignKey(UploadSession, on_delete=models.CASCADE, related_name='chunks')
+    index = models.PositiveIntegerField()
+    offset = models.BigIntegerField()
+    size = models.PositiveIntegerField()
+    sha256 = models.CharField(max_length=64)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['session', 'index'], name='unique_upload_chunk_index'),
+        ]
+
+    def __str__(self):
+        return f"Chunk {self.index} of upload {self.session_id}"
+
+
+# Persistent tier of the summarization cache (see activity/utility/summary_cache.py)
+class SummaryCacheEntry(models.Model):
+    key = models.CharField(max_length=64, primary_key=True)  # sha256 of (model, prompt, text)
+    model = models.CharField(max_length=100)
+    summary = models.TextField()
+    size = models.PositiveIntegerField()  # Bytes of summary, used for size-based eviction
+    created_at = models.DateTimeField(default=timezone.now)
+    last_used_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['last_used_at'], name='summary_cache_last_used_idx'),
+            models.Index(fields=['created_at'], name='summary_cache_created_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.model}:{self.key[:12]}"
+
+
+# Per-user spending totals per day/week/month, maintained incrementally (see activity/rollups.py)
+class SpendingRollup(models.Model):
+    PERIOD_DAY = 'day'
+    PERIOD_WEEK = 'week'  # Weeks start on Monday
+    PERIOD_MONTH = 'month'
+    PERIOD_CHOICES = [
+        (PERIOD_DAY, 'Day'),
+        (PERIOD_WEEK, 'Week'),
+        (PERIOD_MONTH, 'Month'),
+    ]
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='spending_rollups')
+    period = models.CharField(max_length=8, choices=PERIOD_CHOICES)
+    period_start = models.DateField()
+    total = models.FloatField(default=0)
+    count = models.PositiveIntegerField(default=0)  # Number of activities in the period
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'period', 'period_start'], name='unique_spending_rollup'),
+        ]
+
+    def __str__(self):
+        return f"{self.user} {self.period} {self.period_start}: {self.total}"
+
+
+# Per-user change counters, bumped whenever the user's data in `scope` changes (see activity/versions.py)
+class DataVersion(models.Model):
+    SCOPE_ACTIVITIES = 'activities'
+    SCOPE_RECORDINGS = 'recordings'
+    SCOPE_PROFILE = 'profile'
+    SCOPE_SYNC = 'sync'  # Any change to activities or recordings; orders the sync feed
+    SCOPE_CHOICES = [
+        (SCOPE_ACTIVITIES, 'Activities'),
+        (SCOPE_RECORDINGS, 'Recordings'),
+        (SCOPE_PROFILE, 'Profile'),
+        (SCOPE_SYNC, 'Sync'),
+    ]
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='data_versions')
+    scope = models.CharField(max_length=16, choices=SCOPE_CHOICES)
+    version = models.BigIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'scope'], name='unique_data_version'),
+        ]
+
+    def __str__(self):
+        return f"{self.user} {self.scope}: {self.version}"
+
+
+# A deleted activity or recording, kept for ACTIVITY_SYNC_TOMBSTONE_DAYS so the sync feed can report it
+class SyncTombstone(models.Model):
+    KIND_ACTIVITY = 'activity'
+    KIND_RECORDING = 'recording'
+    KIND_CHOICES = [
+        (KIND_ACTIVITY, 'Activity'),
+        (KIND_RECORDING, 'Recording'),
+    ]
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='sync_tombstones')
+    kind = models.CharField(max_length=16, choices=KIND_CHOICES)
+    object_id = models.BigIntegerField()
+    sync_version = models.BigIntegerField()
+    deleted_at = models.DateTimeField(default=timezone.now, db_index=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['user', 'sync_version'], name='tombstone_user_sync_idx'),
+        ]
 
     def __str__(self):
-        return self.user.username
\ No newline at end of file
+        return f"{self.kind} {self.object_id} deleted at {self.deleted_at}"
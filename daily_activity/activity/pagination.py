@@ -0,0 +1,14 @@
+from rest_framework.pagination import CursorPagination, LimitOffsetPagination
+
+
+class AudioRecordingPagination(LimitOffsetPagination):
+    default_limit = 50
+    max_limit = 500
+
+
+class ActivityCursorPagination(CursorPagination):
+    # Keyset pagination: each page is an index range scan on date, however deep the client pages
+    ordering = ('-date', '-id')
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 500
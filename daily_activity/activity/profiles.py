@@ -0,0 +1,149 @@
+"""
+User profiles: cached serialized profiles and profile photo thumbnails.
+
+Serialized profiles are kept in Django's cache per user and dropped whenever the
+profile or its user is saved. On upload, square WebP and JPEG thumbnails are written
+next to the original for every size in ACTIVITY_PROFILE_THUMBNAIL_SIZES, so clients
+can pick a small image instead of downloading the full-resolution photo.
+"""
+import logging
+import os
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import Profile
+
+logger = logging.getLogger('activity_logger')
+
+THUMBNAIL_DIR = 'profile_pics/thumbs'
+JPEG_QUALITY = 85
+WEBP_QUALITY = 80
+
+
+class InvalidImage(Exception):
+    pass
+
+
+def _cache_key(user_id):
+    return f'activity:profile:{user_id}'
+
+
+def get_profile_data(user):
+    """Serialized profile of `user`, creating the profile on first access."""
+    from .serializers import ProfileSerializer
+
+    key = _cache_key(user.pk)
+    data = cache.get(key)
+    if data is None:
+        profile, _ = Profile.objects.select_related('user').get_or_create(user=user)
+        data = dict(ProfileSerializer(profile).data)
+        cache.set(key, data, settings.ACTIVITY_PROFILE_CACHE_SECONDS)
+    return data
+
+
+def invalidate_profile(user_id):
+    cache.delete(_cache_key(user_id))
+
+
+@receiver(post_save, sender=Profile)
+@receiver(post_delete, sender=Profile)
+def _invalidate_on_profile_change(sender, instance, **kwargs):
+    invalidate_profile(instance.user_id)
+
+
+@receiver(post_save, sender=User)
+def _invalidate_on_user_change(sender, instance, **kwargs):
+    # The serialized profile embeds username/email
+    invalidate_profile(instance.pk)
+
+
+def verify_image(uploaded_file):
+    """Raise InvalidImage unless `uploaded_file` is an image Pillow can read."""
+    from PIL import Image
+    try:
+        with Image.open(uploaded_file) as image:
+            image.verify()
+    except (OSError, SyntaxError, Image.DecompressionBombError) as e:
+        raise InvalidImage(str(e))
+    finally:
+        uploaded_file.seek(0)
+
+
+def _encode(image, size, fmt):
+    from PIL import Image, ImageOps
+    thumbnail = ImageOps.fit(image, (size, size), Image.LANCZOS)
+    buffer = ContentFile(b'')
+    if fmt == 'jpeg':
+        if thumbnail.mode in ('RGBA', 'LA', 'P'):
+            # JPEG has no alpha channel: flatten transparent avatars onto white
+            thumbnail = thumbnail.convert('RGBA')
+            background = Image.new('RGB', thumbnail.size, 'white')
+            background.paste(thumbnail, mask=thumbnail.getchannel('A'))
+            thumbnail = background
+        thumbnail.convert('RGB').save(buffer, 'JPEG', quality=JPEG_QUALITY, optimize=True, progressive=True)
+    else:
+        if thumbnail.mode not in ('RGB', 'RGBA'):
+            thumbnail = thumbnail.convert('RGBA')
+        thumbnail.save(buffer, 'WEBP', quality=WEBP_QUALITY, method=4)
+    buffer.seek(0)
+    return buffer
+
+
+def delete_thumbnails(thumbnails):
+    for variants in thumbnails.values():
+        for path in variants.values():
+            default_storage.delete(path)
+
+
+def generate_thumbnails(profile):
+    """Write thumbnails for profile.profile_photo and return the paths to store in profile.thumbnails."""
+    if not profile.profile_photo:
+        return {}
+    # Pillow is only imported when photos are processed, not on every process start
+    from PIL import Image, ImageOps
+
+    base = os.path.splitext(os.path.basename(profile.profile_photo.name))[0]
+    thumbnails = {}
+    with profile.profile_photo.open('rb') as photo, Image.open(photo) as image:
+        image = ImageOps.exif_transpose(image)
+        for size in settings.ACTIVITY_PROFILE_THUMBNAIL_SIZES:
+            variants = {}
+            for fmt, extension in (('webp', 'webp'), ('jpeg', 'jpg')):
+                name = f'{THUMBNAIL_DIR}/{profile.user_id}/{base}_{size}.{extension}'
+                if default_storage.exists(name):
+                    default_storage.delete(name)
+                variants[fmt] = default_storage.save(name, _encode(image, size, fmt))
+            thumbnails[str(size)] = variants
+    return thumbnails
+
+
+def update_profile_photo(profile, uploaded_file):
+    """
+    Replace the profile photo (or clear it when `uploaded_file` is None) and
+    regenerate its thumbnails. Raises InvalidImage for unreadable uploads.
+    """
+    from PIL import Image
+
+    if uploaded_file is not None:
+        verify_image(uploaded_file)
+    old_thumbnails = profile.thumbnails
+    profile.profile_photo = uploaded_file
+    profile.thumbnails = {}
+    profile.save()
+    if old_thumbnails:
+        delete_thumbnails(old_thumbnails)
+    if uploaded_file is not None:
+        try:
+            profile.thumbnails = generate_thumbnails(profile)
+        except (OSError, Image.DecompressionBombError):
+            # The original is still served; thumbnails can be regenerated later
+            logger.exception("Could not generate thumbnails for profile of user %s", profile.user_id)
+        else:
+            profile.save(update_fields=['thumbnails'])
+    return profile
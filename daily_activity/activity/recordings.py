@@ -0,0 +1,156 @@
+"""
+Storage of uploaded recordings, shared by the single-request upload
+(record_activity_api) and the resumable upload finalize step.
+"""
+import asyncio
+import logging
+import os
+import uuid
+from datetime import datetime
+
+from asgiref.sync import sync_to_async
+
+from .blobs import is_stored, referenced_blob, source_digest, stage_blob
+from .jobs import enqueue_processing
+from .models import AudioRecording, DailyActivity
+from .utility.audio import probe_wav
+from .utility.metrics import span
+
+logger = logging.getLogger('activity_logger')
+
+
+def _recording_name(formatted_date):
+    # The time keeps names readable; the suffix keeps two uploads in the same second apart
+    return f'audio_{formatted_date}_{datetime.now().strftime("%H-%M-%S")}_{uuid.uuid4().hex[:8]}.wav'
+
+
+class _Duplicate(Exception):
+    def __init__(self, activity):
+        super().__init__(activity.pk)
+        self.activity = activity
+
+
+def _create_recording(user, formatted_date, source, digest, staged):
+    try:
+        activity = _create_activity(user, formatted_date, source, digest, staged)
+    except _Duplicate as duplicate:
+        # A retried upload: answer with what the first one created
+        activity = duplicate.activity
+        job = activity.jobs.order_by('-created_at').first()
+        if job is not None:
+            logger.info("Upload of %s for %s is a duplicate of activity %s", digest, formatted_date, activity.pk)
+            return activity, job
+    with span('job_enqueue'):
+        job = enqueue_processing(activity, activity.audio_file.path, user=user)
+    return activity, job
+
+
+def _create_activity(user, formatted_date, source, digest, staged):
+    with referenced_blob(source, digest, staged) as blob:
+        # The blob row is locked here, so identical uploads can't both get past this check
+        existing = (AudioRecording.objects.filter(user=user, date=formatted_date, blob=blob, activity__isnull=False)
+                    .select_related('activity').first())
+        if existing is not None:
+            raise _Duplicate(existing.activity)  # Rolls back the reference just taken
+        # Transcription and summarization run on a background worker so the
+        # response doesn't wait on the recognizer or OpenAI
+        with span('activity_create'):
+            activity = DailyActivity.objects.create(
+                user=user,
+                date=formatted_date,
+                audio_file=blob.relative_path,
+            )
+        with span('recording_index'):
+            AudioRecording.objects.create(
+                user=user, activity=activity, blob=blob, date=formatted_date,
+                filename=_recording_name(formatted_date),
+                size=blob.size, duration=blob.duration, codec=blob.codec,
+            )
+    return activity
+
+
+def save_recording(user, formatted_date, source, sha256=None):
+    """
+    Store `source` (an UploadedFile or a path on disk) as a WAV recording for
+    `formatted_date` (YYYY-MM-DD), create its DailyActivity and queue the
+    transcribe -> summarize job. Returns (activity, job).
+
+    The audio is stored content-addressed (see activity/blobs.py): if the same bytes
+    (`sha256`, hashed here when not given) are stored already, only rows are added.
+    Uploading the same audio for the same user and date again (e.g. a client retry)
+    adds nothing and returns the existing activity and its job.
+    """
+    digest = sha256 or source_digest(source)
+    staged = None if is_stored(digest) else stage_blob(source)
+    return _create_recording(user, formatted_date, source, digest, staged)
+
+
+async def asave_recording(user, formatted_date, source, sha256=None):
+    """
+    save_recording for async views: the file is hashed and stored on a worker
+    thread and the event loop is free while it is copied or transcoded.
+    """
+    digest = sha256 or await asyncio.to_thread(source_digest, source)
+    staged = None
+    if not await sync_to_async(is_stored)(digest):
+        staged = await asyncio.to_thread(stage_blob, source)
+    return await sync_to_async(_create_recording)(user, formatted_date, source, digest, staged)
+
+
+def index_recording(file_path, date, user, activity=None, created_at=None):
+    """
+    Create or refresh the user's AudioRecording row for a WAV file stored under MEDIA_ROOT/audio/<user_id>/.
+    """
+    try:
+        duration, codec = probe_wav(file_path)
+    except Exception:
+        logger.warning("Could not read WAV header of %s", file_path, exc_info=True)
+        duration, codec = None, ''
+    defaults = {
+        'size': os.path.getsize(file_path),
+        'duration': duration,
+        'codec': codec,
+    }
+    if activity is not None:
+        defaults['activity'] = activity
+    if created_at is not None:
+        defaults['created_at'] = created_at
+    recording, _ = AudioRecording.objects.update_or_create(
+        user=user, date=date, filename=os.path.basename(file_path), defaults=defaults,
+    )
+    return recording
+
+
+def _remove_file(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        logger.warning("Indexed recording %s was already missing on disk", path)
+
+
+def delete_recording(recording):
+    """
+    Remove a recording's index row together with its file. A blob is only removed
+    with its last reference, by the AudioRecording post_delete handler in activity/blobs.py.
+    """
+    if recording.blob_id is None:
+        _remove_file(recording.path)
+    recording.delete()
+
+
+def delete_recordings(recordings):
+    """
+    delete_recording for several recordings, with a single query for the index rows.
+    """
+    recordings = list(recordings)
+    for recording in recordings:
+        if recording.blob_id is None:
+            _remove_file(recording.path)
+    if recordings:
+        AudioRecording.objects.filter(pk__in=[recording.pk for recording in recordings]).delete()
+
+
+async def adelete_recording(recording):
+    if recording.blob_id is None:
+        await asyncio.to_thread(_remove_file, recording.path)
+    await recording.adelete()
@@ -0,0 +1,130 @@
+"""
+Spending rollups: per-user totals and activity counts per day, week and month.
+
+SpendingRollup rows are adjusted by the difference on every DailyActivity save and
+delete, so stats never aggregate over the activity history. Code that bypasses model
+signals (QuerySet.update, bulk_create, ...) on date/spending/user must call
+apply_activity_change(s) itself; `manage.py rebuild_rollups` recomputes everything.
+"""
+from collections import defaultdict
+from datetime import timedelta
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncDay, TruncMonth, TruncWeek
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from .models import DailyActivity, SpendingRollup
+
+PERIODS = (SpendingRollup.PERIOD_DAY, SpendingRollup.PERIOD_WEEK, SpendingRollup.PERIOD_MONTH)
+
+
+def period_start(period, date):
+    if period == SpendingRollup.PERIOD_WEEK:
+        return date - timedelta(days=date.weekday())
+    if period == SpendingRollup.PERIOD_MONTH:
+        return date.replace(day=1)
+    return date
+
+
+def _adjust(user_id, period, start, spending, count):
+    rollups = SpendingRollup.objects.filter(user_id=user_id, period=period, period_start=start)
+    if rollups.update(total=F('total') + spending, count=F('count') + count):
+        return
+    try:
+        with transaction.atomic():
+            SpendingRollup.objects.create(user_id=user_id, period=period, period_start=start,
+                                          total=spending, count=count)
+    except IntegrityError:
+        # Created concurrently by another request
+        rollups.update(total=F('total') + spending, count=F('count') + count)
+
+
+def apply_activity_changes(changes):
+    """
+    Update the rollups for activities that changed from `old` to `new`, given as
+    (old, new) pairs of (user_id, date, spending) tuples or None when the activity
+    didn't / no longer exists. Differences are summed per rollup row first, so a
+    batch touches each row once.
+    """
+    deltas = defaultdict(lambda: [0.0, 0])
+    for old, new in changes:
+        if old == new:
+            continue
+        for state, sign in ((old, -1), (new, 1)):
+            if state is None or state[0] is None:
+                continue
+            user_id, date, spending = state
+            for period in PERIODS:
+                delta = deltas[(user_id, period, period_start(period, date))]
+                delta[0] += sign * spending
+                delta[1] += sign
+    deltas = {key: delta for key, delta in deltas.items() if delta[0] or delta[1]}
+    if not deltas:
+        return
+    with transaction.atomic():
+        for (user_id, period, start), (spending, count) in deltas.items():
+            _adjust(user_id, period, start, spending, count)
+        # Empty periods are removed rather than left at a float residue of 0
+        SpendingRollup.objects.filter(user_id__in={key[0] for key in deltas}, count=0).delete()
+
+
+def apply_activity_change(old, new):
+    """apply_activity_changes for a single activity."""
+    apply_activity_changes([(old, new)])
+
+
+def activity_state(instance):
+    date = DailyActivity._meta.get_field('date').to_python(instance.date)
+    return instance.user_id, date, float(instance.spending or 0)
+
+
+@receiver(pre_save, sender=DailyActivity)
+def _remember_previous_state(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    previous = None
+    if instance.pk is not None:
+        previous = DailyActivity.objects.filter(pk=instance.pk).values_list('user_id', 'date', 'spending').first()
+    instance._rollup_previous = previous
+
+
+@receiver(post_save, sender=DailyActivity)
+def _update_rollups_on_save(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    apply_activity_change(getattr(instance, '_rollup_previous', None), activity_state(instance))
+
+
+@receiver(post_delete, sender=DailyActivity)
+def _update_rollups_on_delete(sender, instance, **kwargs):
+    apply_activity_change(activity_state(instance), None)
+
+
+def rebuild_rollups(user=None):
+    """Recompute rollups from scratch with aggregate queries. Returns the number of rows written."""
+    activities = DailyActivity.objects.all()
+    rollups = SpendingRollup.objects.all()
+    if user is not None:
+        activities = activities.filter(user=user)
+        rollups = rollups.filter(user=user)
+
+    truncations = {
+        SpendingRollup.PERIOD_DAY: TruncDay('date'),
+        SpendingRollup.PERIOD_WEEK: TruncWeek('date'),
+        SpendingRollup.PERIOD_MONTH: TruncMonth('date'),
+    }
+    with transaction.atomic():
+        rollups.delete()
+        rows = []
+        for period, truncation in truncations.items():
+            totals = (activities.annotate(start=truncation).values('user_id', 'start')
+                      .annotate(total=Sum('spending'), count=Count('id')).order_by())
+            rows.extend(
+                SpendingRollup(user_id=row['user_id'], period=period, period_start=row['start'],
+                               total=row['total'] or 0, count=row['count'])
+                for row in totals
+            )
+        SpendingRollup.objects.bulk_create(rows, batch_size=1000)
+    return len(rows)
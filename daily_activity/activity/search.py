@@ -0,0 +1,242 @@
+"""
+Full-text search over activity transcripts and summaries.
+
+On SQLite an FTS5 external-content table mirrors DailyActivity.transcript/summary and
+is kept in sync by triggers (so QuerySet.update() calls, like the job runner's, are
+covered too). The owner's user_id is indexed alongside them and every query matches
+it, so FTS5 intersects the query terms with the user's own rows instead of ranking
+every user's matches and filtering them afterwards. On PostgreSQL the same interface is backed by a GIN-indexed tsvector
+expression. Other databases fall back to an unindexed icontains scan.
+"""
+import logging
+import re
+
+from django.db import DEFAULT_DB_ALIAS, OperationalError, connections
+from django.db.models import Q
+
+from .models import DailyActivity
+
+logger = logging.getLogger('activity_logger')
+
+TABLE = 'activity_dailyactivity'
+FTS_TABLE = 'activity_dailyactivity_fts'
+HIGHLIGHT_START = '<mark>'
+HIGHLIGHT_END = '</mark>'
+SNIPPET_WORDS = 16
+
+SQLITE_SCHEMA = [
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+        transcript, summary, user_id, content='{TABLE}', content_rowid='id', tokenize='porter unicode61'
+    )""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON {TABLE} BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, transcript, summary, user_id)
+        VALUES (new.id, new.transcript, new.summary, new.user_id);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON {TABLE} BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, transcript, summary, user_id)
+        VALUES ('delete', old.id, old.transcript, old.summary, old.user_id);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au AFTER UPDATE OF transcript, summary, user_id ON {TABLE} BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, transcript, summary, user_id)
+        VALUES ('delete', old.id, old.transcript, old.summary, old.user_id);
+        INSERT INTO {FTS_TABLE}(rowid, transcript, summary, user_id)
+        VALUES (new.id, new.transcript, new.summary, new.user_id);
+    END""",
+]
+SQLITE_TRIGGERS = {f'{FTS_TABLE}_ai', f'{FTS_TABLE}_ad', f'{FTS_TABLE}_au'}
+
+POSTGRES_DOCUMENT = "to_tsvector('english', coalesce(transcript, '') || ' ' || coalesce(summary, ''))"
+POSTGRES_INDEX = 'activity_dailyactivity_search_idx'
+
+
+class SQLiteFTSBackend:
+    name = 'sqlite-fts5'
+
+    def ensure_index(self, connection):
+        """
+        Create the FTS table and triggers if they are missing. Django re-creates SQLite
+        tables when altering them, which silently drops triggers, so this also runs
+        after every migrate and rebuilds the index when triggers had to be restored.
+        """
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT name FROM sqlite_master WHERE type = 'trigger' AND tbl_name = %s", [TABLE])
+            missing_triggers = SQLITE_TRIGGERS - {row[0] for row in cursor.fetchall()}
+            if not missing_triggers:
+                return
+            for statement in SQLITE_SCHEMA:
+                cursor.execute(statement)
+            cursor.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+        logger.info("Rebuilt full-text search index %s", FTS_TABLE)
+
+    def drop_index(self, connection):
+        with connection.cursor() as cursor:
+            for trigger in SQLITE_TRIGGERS:
+                cursor.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+            cursor.execute(f"DROP TABLE IF EXISTS {FTS_TABLE}")
+
+    @staticmethod
+    def _match_expression(query, user_id):
+        # Quote every term so user input can't inject FTS5 syntax; a trailing '*' keeps prefix matching.
+        # The terms only match the text columns, the owner only user_id.
+        terms = []
+        for term in query.split():
+            prefix = term.endswith('*')
+            term = term.rstrip('*').replace('"', '""')
+            if term:
+                terms.append(f'"{term}"' + ('*' if prefix else ''))
+        if not terms:
+            return ''
+        return f'user_id : "{int(user_id)}" AND {{transcript summary}} : ({" ".join(terms)})'
+
+    def search(self, connection, user_id, query, limit):
+        match = self._match_expression(query, user_id)
+        if not match:
+            return []
+        with connection.cursor() as cursor:
+            # bm25() weighs the user_id column 0, so ranks only depend on the text
+            cursor.execute(
+                f"""SELECT a.id, a.date, bm25({FTS_TABLE}, 1.0, 1.0, 0.0) AS rank,
+                           snippet({FTS_TABLE}, 0, %s, %s, '…', %s),
+                           snippet({FTS_TABLE}, 1, %s, %s, '…', %s)
+                    FROM {FTS_TABLE} JOIN {TABLE} a ON a.id = {FTS_TABLE}.rowid
+                    WHERE {FTS_TABLE} MATCH %s
+                    ORDER BY rank
+                    LIMIT %s""",
+                [HIGHLIGHT_START, HIGHLIGHT_END, SNIPPET_WORDS,
+                 HIGHLIGHT_START, HIGHLIGHT_END, SNIPPET_WORDS,
+                 match, limit],
+            )
+            # bm25() is lower-is-better; flip it so every backend returns higher-is-better ranks
+            return [_result(row[0], row[1], -row[2], row[3], row[4]) for row in cursor.fetchall()]
+
+
+class PostgresSearchBackend:
+    name = 'postgres-tsvector'
+
+    def ensure_index(self, connection):
+        with connection.cursor() as cursor:
+            cursor.execute(f"CREATE INDEX IF NOT EXISTS {POSTGRES_INDEX} ON {TABLE} USING GIN ({POSTGRES_DOCUMENT})")
+
+    def drop_index(self, connection):
+        with connection.cursor() as cursor:
+            cursor.execute(f"DROP INDEX IF EXISTS {POSTGRES_INDEX}")
+
+    def search(self, connection, user_id, query, limit):
+        options = f'StartSel={HIGHLIGHT_START}, StopSel={HIGHLIGHT_END}, MaxWords={SNIPPET_WORDS}, MinWords=5'
+        with connection.cursor() as cursor:
+            # The WHERE clause repeats the indexed expression verbatim so the GIN index is used
+            cursor.execute(
+                f"""SELECT id, date, ts_rank({POSTGRES_DOCUMENT}, q) AS rank,
+                           ts_headline('english', transcript, q, %s),
+                           ts_headline('english', summary, q, %s)
+                    FROM {TABLE}, websearch_to_tsquery('english', %s) q
+                    WHERE user_id = %s AND {POSTGRES_DOCUMENT} @@ q
+                    ORDER BY rank DESC
+                    LIMIT %s""",
+                [options, options, query, user_id, limit],
+            )
+            return [_result(*row) for row in cursor.fetchall()]
+
+
+class ContainsSearchBackend:
+    """Unindexed fallback for databases without a full-text engine."""
+    name = 'icontains'
+
+    def ensure_index(self, connection):
+        pass
+
+    def drop_index(self, connection):
+        pass
+
+    def search(self, connection, user_id, query, limit):
+        condition = Q()
+        for term in query.split():
+            condition &= Q(transcript__icontains=term) | Q(summary__icontains=term)
+        activities = (DailyActivity.objects.using(connection.alias)
+                      .filter(condition, user_id=user_id).order_by('-date', '-id')[:limit])
+        return [_result(a.id, a.date, 0.0, _highlight(a.transcript, query), _highlight(a.summary, query))
+                for a in activities]
+
+
+def _highlight(text, query):
+    terms = [re.escape(term) for term in query.split() if term]
+    if not terms or not text:
+        return ''
+    pattern = re.compile('|'.join(terms), re.IGNORECASE)
+    match = pattern.search(text)
+    if not match:
+        return ''
+    words = text[max(match.start() - 80, 0):match.end() + 80]
+    return pattern.sub(lambda m: f'{HIGHLIGHT_START}{m.group(0)}{HIGHLIGHT_END}', words)
+
+
+def _result(activity_id, date, rank, transcript_snippet, summary_snippet):
+    return {
+        'id': activity_id,
+        'date': str(date),
+        'rank': rank,
+        'transcript_snippet': transcript_snippet or '',
+        'summary_snippet': summary_snippet or '',
+    }
+
+
+_sqlite_fts_available = {}
+
+
+def _index_backend(connection):
+    if connection.vendor == 'sqlite':
+        return SQLiteFTSBackend()
+    if connection.vendor == 'postgresql':
+        return PostgresSearchBackend()
+    return None
+
+
+def _fts_table_exists(connection):
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s", [FTS_TABLE])
+        return cursor.fetchone() is not None
+
+
+def get_search_backend(connection):
+    if connection.vendor == 'postgresql':
+        return PostgresSearchBackend()
+    if connection.vendor == 'sqlite':
+        if connection.alias not in _sqlite_fts_available:
+            _sqlite_fts_available[connection.alias] = _fts_table_exists(connection)
+        if _sqlite_fts_available[connection.alias]:
+            return SQLiteFTSBackend()
+    return ContainsSearchBackend()
+
+
+def ensure_search_index(connection):
+    """Create the search index for this database; safe to call repeatedly."""
+    _sqlite_fts_available.pop(connection.alias, None)
+    backend = _index_backend(connection)
+    if backend is None:
+        return
+    try:
+        backend.ensure_index(connection)
+    except OperationalError:
+        # e.g. SQLite compiled without FTS5; searches fall back to icontains
+        logger.warning("Full-text search index could not be created; using unindexed search", exc_info=True)
+
+
+def repair_search_index(connection):
+    """
+    Restore the SQLite sync triggers if a migration re-created the activity table.
+    Does nothing unless the search index has been created by its migration.
+    """
+    if connection.vendor == 'sqlite' and _fts_table_exists(connection):
+        SQLiteFTSBackend().ensure_index(connection)
+
+
+def drop_search_index(connection):
+    _sqlite_fts_available.pop(connection.alias, None)
+    backend = _index_backend(connection)
+    if backend is not None:
+        backend.drop_index(connection)
+
+
+def search_activities(user, query, limit=20, using=DEFAULT_DB_ALIAS):
+    connection = connections[using]
+    return get_search_backend(connection).search(connection, user.pk, query, limit)
@@ -1,12 +1,30 @@
+from django.conf import settings
 from rest_framework import serializers
+from django.core.files.storage import default_storage
+from django.urls import reverse
 from .models import DailyActivity
 from django.contrib.auth.models import User
 from .models import Profile
+from .models import ProcessingJob
+from .models import UploadSession, UploadChunk
+from .models import AudioRecording
+from .models import SpendingRollup
 
 class ActivitySerializer(serializers.ModelSerializer):
+    """
+    Accepts an optional `fields` argument to only include a subset of the fields.
+    """
+    def __init__(self, *args, **kwargs):
+        fields = kwargs.pop('fields', None)
+        super().__init__(*args, **kwargs)
+        if fields:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+
     class Meta:
         model = DailyActivity
         fields = '__all__'
+        read_only_fields = ['user', 'sync_version']
 
 class UserSerializer(serializers.ModelSerializer):
     class Meta:
@@ -15,7 +33,72 @@ class UserSerializer(serializers.ModelSerializer):
 
 class ProfileSerializer(serializers.ModelSerializer):
     user = UserSerializer()
+    thumbnails = serializers.SerializerMethodField()
 
     class Meta:
         model = Profile
-        fields = ['user', 'profile_photo']
\ No newline at end of file
+        fields = ['user', 'profile_photo', 'thumbnails']
+
+    def get_thumbnails(self, obj):
+        # {"64": {"webp": url, "jpeg": url}, ...}
+        return {size: {fmt: default_storage.url(path) for fmt, path in variants.items()}
+                for size, variants in obj.thumbnails.items()}
+
+class ProcessingJobSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = ProcessingJob
+        fields = ['id', 'activity', 'status', 'stage', 'attempts', 'max_attempts', 'error', 'created_at', 'updated_at']
+
+
+class UploadChunkSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = UploadChunk
+        fields = ['index', 'offset', 'size', 'sha256']
+
+
+class UploadSessionSerializer(serializers.ModelSerializer):
+    chunks = UploadChunkSerializer(many=True, read_only=True)
+    received_bytes = serializers.SerializerMethodField()
+
+    class Meta:
+        model = UploadSession
+        fields = ['id', 'date', 'file_name', 'total_size', 'status', 'activity', 'received_bytes', 'chunks',
+                  'created_at', 'updated_at']
+
+    def get_received_bytes(self, obj):
+        return sum(chunk.size for chunk in obj.chunks.all())
+
+
+class AudioRecordingSerializer(serializers.ModelSerializer):
+    """
+    Waveform fields come from the recording's blob and are null for recordings
+    stored before content addressing; select_related('blob') when listing.
+    """
+    stream_url = serializers.SerializerMethodField()
+    sample_rate = serializers.IntegerField(source='blob.sample_rate', read_only=True, allow_null=True)
+    channels = serializers.IntegerField(source='blob.channels', read_only=True, allow_null=True)
+    peaks = serializers.SerializerMethodField()
+    peaks_url = serializers.SerializerMethodField()
+
+    class Meta:
+        model = AudioRecording
+        fields = ['id', 'date', 'filename', 'size', 'duration', 'sample_rate', 'channels', 'codec', 'activity',
+                  'created_at', 'stream_url', 'peaks', 'peaks_url']
+
+    def get_stream_url(self, obj):
+        return reverse('audio_stream', args=[obj.pk])
+
+    def get_peaks(self, obj):
+        if not settings.ACTIVITY_PEAKS_LIST_RESOLUTION or obj.blob is None or obj.blob.peaks is None:
+            return None
+        from .utility.waveform import downsample_peaks
+        return downsample_peaks(obj.blob.peaks, settings.ACTIVITY_PEAKS_LIST_RESOLUTION)
+
+    def get_peaks_url(self, obj):
+        return reverse('audio_peaks', args=[obj.pk])
+
+
+class SpendingRollupSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = SpendingRollup
+        fields = ['period_start', 'total', 'count']
@@ -0,0 +1,146 @@
+"""
+HTTP delivery of stored recordings: single byte-range requests for seeking,
+ETag/Last-Modified validators with 304 responses, and optional hand-off of the
+actual copying to the front-end web server (X-Accel-Redirect / X-Sendfile).
+"""
+import mimetypes
+import os
+import re
+from urllib.parse import quote
+
+from django.conf import settings
+from django.http import FileResponse, HttpResponse, HttpResponseNotModified, StreamingHttpResponse
+from django.utils.http import http_date, parse_http_date_safe, quote_etag
+from rest_framework.negotiation import BaseContentNegotiation
+
+from .utility.audio import CHUNK_SIZE
+
+# Recordings re-encoded by storage tiering (activity/tiering.py)
+mimetypes.add_type('audio/flac', '.flac')
+mimetypes.add_type('audio/ogg', '.opus')
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+class FileContentNegotiation(BaseContentNegotiation):
+    """
+    File responses don't go through a renderer, so never reject a request
+    because of what its Accept header (e.g. 'audio/*') asks for.
+    """
+    def select_parser(self, request, parsers):
+        return parsers[0] if parsers else None
+
+    def select_renderer(self, request, renderers, format_suffix=None):
+        return renderers[0], renderers[0].media_type
+
+
+def _etag(stat):
+    return quote_etag(f'{stat.st_size:x}-{stat.st_mtime_ns:x}')
+
+
+def _not_modified(request, etag, mtime):
+    if_none_match = request.headers.get('If-None-Match')
+    if if_none_match is not None:
+        candidates = [tag.strip() for tag in if_none_match.split(',')]
+        # Weak comparison, as RFC 9110 requires for If-None-Match
+        return '*' in candidates or etag in candidates or f'W/{etag}' in candidates
+    if_modified_since = parse_http_date_safe(request.headers.get('If-Modified-Since', ''))
+    return if_modified_since is not None and int(mtime) <= if_modified_since
+
+
+def _parse_range(header, size):
+    """
+    Return (start, end) inclusive for a single 'bytes=' range, None if the header
+    should be ignored, or False if the range can't be satisfied.
+    """
+    match = RANGE_RE.match(header.strip())
+    if not match or match.group(1) == match.group(2) == '':
+        return None  # Multiple or malformed ranges: fall back to the whole file
+    start, end = match.groups()
+    if start == '':
+        # Suffix range: the last N bytes
+        length = int(end)
+        if length == 0:
+            return False
+        return max(size - length, 0), size - 1
+    start = int(start)
+    end = min(int(end), size - 1) if end else size - 1
+    if start >= size or start > end:
+        return False
+    return start, end
+
+
+def _read_range(path, start, length):
+    with open(path, 'rb') as f:
+        f.seek(start)
+        while length > 0:
+            data = f.read(min(CHUNK_SIZE, length))
+            if not data:
+                break
+            length -= len(data)
+            yield data
+
+
+def _offload(path, relative_path):
+    response = HttpResponse()
+    # Let the web server pick the content type, validators and range handling
+    del response['Content-Type']
+    if settings.ACTIVITY_AUDIO_SENDFILE == 'x-accel-redirect':
+        response['X-Accel-Redirect'] = settings.ACTIVITY_AUDIO_ACCEL_PREFIX.rstrip('/') + '/' + quote(relative_path)
+    else:
+        response['X-Sendfile'] = path
+    return response
+
+
+def serve_recording_file(request, path, relative_path):
+    """
+    Build the response for GET/HEAD of the file at `path` (`relative_path` is
+    relative to MEDIA_ROOT and only used for web server offloading).
+    """
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return HttpResponse(status=404)
+
+    etag = _etag(stat)
+    if _not_modified(request, etag, stat.st_mtime):
+        response = HttpResponseNotModified()
+        response['ETag'] = etag
+        return response
+
+    if settings.ACTIVITY_AUDIO_SENDFILE:
+        return _offload(path, relative_path)
+
+    content_type = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+    size = stat.st_size
+    byte_range = None
+    range_header = request.headers.get('Range')
+    if range_header:
+        if_range = request.headers.get('If-Range')
+        # A stale If-Range validator means the client's partial copy is outdated: send everything
+        if if_range is None or if_range == etag or parse_http_date_safe(if_range) == int(stat.st_mtime):
+            byte_range = _parse_range(range_header, size)
+
+    if byte_range is False:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{size}'
+    elif byte_range:
+        start, end = byte_range
+        length = end - start + 1
+        if request.method == 'HEAD':
+            response = HttpResponse(status=206, content_type=content_type)
+        else:
+            response = StreamingHttpResponse(_read_range(path, start, length), status=206, content_type=content_type)
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+        response['Content-Length'] = str(length)
+    elif request.method == 'HEAD':
+        response = HttpResponse(content_type=content_type)
+        response['Content-Length'] = str(size)
+    else:
+        # FileResponse streams in blocks and uses wsgi.file_wrapper (sendfile) when the server offers it
+        response = FileResponse(open(path, 'rb'), content_type=content_type)
+
+    response['Accept-Ranges'] = 'bytes'
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(stat.st_mtime)
+    return response
@@ -0,0 +1,105 @@
+"""
+Delta sync feed: the changes to a user's activities and recordings since a token.
+
+Every change stamps the row with the user's next sync version, and every delete
+leaves a SyncTombstone with one (see activity/versions.py), so changes_since() only
+reads rows past the client's watermark through the (user, sync_version) indexes.
+A client with nothing new costs a single query.
+
+A token is "<version>.<issued>": the watermark, and when the client started syncing
+from it (Unix time). Tombstones are pruned after ACTIVITY_SYNC_TOMBSTONE_DAYS, so
+older tokens are refused and the client starts over with a full sync (no token).
+Deleting an activity detaches its recordings without touching them; clients clear
+`activity` on recordings that point to a deleted activity.
+"""
+import time
+from dataclasses import dataclass, field
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from .models import AudioRecording, DailyActivity, SyncTombstone
+from .versions import SYNC, current_versions
+
+
+class InvalidSyncToken(Exception):
+    pass
+
+
+class ExpiredSyncToken(InvalidSyncToken):
+    pass
+
+
+@dataclass
+class SyncPage:
+    token: str
+    has_more: bool = False
+    activities: list = field(default_factory=list)
+    recordings: list = field(default_factory=list)
+    deleted: list = field(default_factory=list)  # SyncTombstones
+
+
+def make_token(version, issued):
+    return f'{version}.{int(issued)}'
+
+
+def parse_token(token):
+    """Return the (version, issued) of a token, or raise InvalidSyncToken / ExpiredSyncToken."""
+    try:
+        version, issued = (int(part) for part in token.split('.'))
+    except ValueError:
+        raise InvalidSyncToken(token)
+    if time.time() - issued > settings.ACTIVITY_SYNC_TOMBSTONE_DAYS * 86400:
+        raise ExpiredSyncToken(token)
+    return version, issued
+
+
+def changes_since(user, token=None, limit=None):
+    """
+    Return a SyncPage of the user's activities and recordings changed since `token`
+    and those deleted since, or of all of them without a token. At most `limit` rows
+    of each kind are returned, unless one version has more; with `has_more` the
+    client asks again right away with the new token.
+    """
+    limit = limit or settings.ACTIVITY_SYNC_PAGE_SIZE
+    now = time.time()
+    since, issued = parse_token(token) if token else (None, now)
+    # Read before the rows: whatever changes meanwhile is simply sent again next time
+    version = current_versions(user.pk, [SYNC])[0]
+    if since is not None and since >= version:
+        return SyncPage(token=make_token(version, now))
+
+    sources = {
+        'activities': DailyActivity.objects.filter(user=user),
+        'recordings': AudioRecording.objects.filter(user=user).select_related('blob'),
+    }
+    if since is not None:
+        sources = {name: rows.filter(sync_version__gt=since) for name, rows in sources.items()}
+        sources['deleted'] = SyncTombstone.objects.filter(user=user, sync_version__gt=since)
+    sources = {name: rows.order_by('sync_version', 'pk') for name, rows in sources.items()}
+    pages = {name: list(rows[:limit + 1]) for name, rows in sources.items()}
+
+    full = {name: rows for name, rows in pages.items() if len(rows) > limit}
+    if not full:
+        return SyncPage(token=make_token(version, now), **pages)
+
+    # Stop short of the first version a page had no room for, so that no version is split
+    # across pages; a page that is all one version is sent whole
+    upto = min(rows[limit].sync_version - 1 if rows[0].sync_version < rows[limit].sync_version
+               else rows[limit].sync_version for rows in full.values())
+    for name, rows in pages.items():
+        if name in full and rows[limit].sync_version <= upto:
+            pages[name] = list(sources[name].filter(sync_version__lte=upto))
+        else:
+            pages[name] = [row for row in rows if row.sync_version <= upto]
+    # Deletions past `upto` may be older than this request, so the next page keeps the original issue time
+    return SyncPage(token=make_token(upto, issued), has_more=True, **pages)
+
+
+def prune_tombstones(older_than=None):
+    """Delete tombstones older than `older_than` (default ACTIVITY_SYNC_TOMBSTONE_DAYS). Returns how many."""
+    if older_than is None:
+        older_than = timedelta(days=settings.ACTIVITY_SYNC_TOMBSTONE_DAYS)
+    deleted, _ = SyncTombstone.objects.filter(deleted_at__lt=timezone.now() - older_than).delete()
+    return deleted
@@ -1,3 +1,1357 @@
-from django.test import TestCase
+import gzip
+import hashlib
+import importlib
+import os
+import shutil
+import tempfile
+import time
+from datetime import date, timedelta
+from io import BytesIO, StringIO
+from types import SimpleNamespace
+from unittest import mock, skipIf
 
-# Create your tests here.
+import speech_recognition as sr
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.exceptions import ImproperlyConfigured
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncDay, TruncMonth, TruncWeek
+from django.http import HttpResponse
+from django.test import (AsyncClient, RequestFactory, SimpleTestCase, TestCase, TransactionTestCase,
+                         override_settings)
+from django.test.utils import CaptureQueriesContext
+from django.urls import Resolver404, resolve
+from django.utils import timezone
+from rest_framework_simplejwt.tokens import AccessToken
+
+from . import blobs, search, tiering, uploads
+from .benchmarks import StubOpenAI, StubRecognizerBackend, synthetic_wav
+from .bulk import bulk_create_activities, bulk_update_activities
+from .jobs import enqueue_processing, requeue_stale_jobs, run_job
+from .middleware import CompressionMiddleware, brotli
+from .models import (AudioBlob, AudioRecording, DailyActivity, ProcessingJob, SpendingRollup,
+                     SummaryCacheEntry, SyncTombstone, UploadSession)
+from .recordings import delete_recording, save_recording
+from .rollups import rebuild_rollups
+from .sync import prune_tombstones
+from .utility import transcription, utils
+from .utility.audio import AudioConversionError
+from .utility.summary_cache import SummaryCache
+
+
+class CountingOpenAI(StubOpenAI):
+    """StubOpenAI that counts its calls; it raises `error`, or answers `reply`, if given."""
+    def __init__(self, error=None, reply=None):
+        super().__init__()
+        self.calls = 0
+        self.error = error
+        self.reply = reply
+
+    def create(self, model, messages):
+        self.calls += 1
+        if self.error is not None:
+            raise self.error
+        if self.reply is not None:
+            return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=self.reply))])
+        return super().create(model, messages)
+
+
+class MediaRoutesTests(SimpleTestCase):
+    def tearDown(self):
+        importlib.reload(importlib.import_module('daily_activity.urls'))
+
+    @override_settings(DEBUG=True)
+    def test_only_profile_photos_are_served_from_media(self):
+        urls = importlib.reload(importlib.import_module('daily_activity.urls'))
+        resolve('/media/profile_pics/photo.png', urls)
+        for path in ('/media/audio/1/2024-01-01/recording.wav', '/media/blobs/ab/cd/abcd.wav',
+                     '/media/audios/2024-01-01/recording.wav'):
+            with self.assertRaises(Resolver404):
+                resolve(path, urls)
+
+
+class FailingRecognizerBackend:
+    def recognize(self, audio_data):
+        raise sr.RequestError('recognizer unavailable')
+
+
+class StandInServicesMixin:
+    """Replaces the speech recognizer and the OpenAI client with local stand-ins."""
+    def use_services(self, recognizer=None, openai_client=None):
+        self.recognizer = recognizer or StubRecognizerBackend()
+        self.openai = openai_client or CountingOpenAI()
+        for target, name, value in ((transcription, '_backend', self.recognizer), (utils, '_client', self.openai),
+                                    (utils, 'summary_cache', SummaryCache())):
+            patcher = mock.patch.object(target, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+
+class TemporaryMediaMixin:
+    """Runs each test with MEDIA_ROOT in a temporary directory and a synthetic WAV in `self.wav_path`."""
+    def setUp(self):
+        super().setUp()
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        settings_override = override_settings(MEDIA_ROOT=media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.wav_path = self.write_wav('recording.wav', 3.5)
+
+    def write_wav(self, name, seconds):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, name)
+        with open(path, 'wb') as f:
+            f.write(synthetic_wav(seconds))
+        return path
+
+
+class SummaryCacheTests(TestCase):
+    def setUp(self):
+        # A fresh in-process tier per test; the database tier is rolled back with the test
+        patcher = mock.patch.object(utils, 'summary_cache', SummaryCache())
+        self.cache = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_miss_calls_the_api_and_stores_the_summary(self):
+        client = CountingOpenAI()
+        summary = utils.request_summary('went for a run', openai_client=client)
+
+        self.assertEqual(client.calls, 1)
+        entry = SummaryCacheEntry.objects.get()
+        self.assertEqual(entry.summary, summary)
+        self.assertEqual(entry.size, len(summary.encode('utf-8')))
+        self.assertEqual(self.cache.stats()['misses'], 1)
+
+    def test_persistent_hit_does_not_call_the_api(self):
+        summary = utils.request_summary('went for a run', openai_client=CountingOpenAI())
+
+        # A new process: nothing in memory, the entry is only in the database
+        with mock.patch.object(utils, 'summary_cache', SummaryCache()) as cache:
+            client = CountingOpenAI()
+            self.assertEqual(utils.request_summary('went for a run', openai_client=client), summary)
+            self.assertEqual(client.calls, 0)
+            self.assertEqual(cache.stats()['persistent_hits'], 1)
+
+    def test_errors_are_not_cached(self):
+        failing = CountingOpenAI(error=RuntimeError('rate limited'))
+        result = utils.summarize_text('went for a run', openai_client=failing)
+        self.assertEqual(result, 'An error occurred during summarization: rate limited')
+        with self.assertRaises(RuntimeError):
+            utils.request_summary('went for a run', openai_client=failing)
+        self.assertFalse(SummaryCacheEntry.objects.exists())
+
+        client = CountingOpenAI()
+        self.assertTrue(utils.request_summary('went for a run', openai_client=client).startswith('Summary:'))
+        self.assertEqual(client.calls, 1)
+
+    def test_empty_summaries_are_not_cached(self):
+        self.assertEqual(utils.request_summary('silence', openai_client=CountingOpenAI(reply='')), '')
+        self.assertFalse(SummaryCacheEntry.objects.exists())
+
+    def test_least_recently_used_entries_are_evicted_over_the_size_budget(self):
+        now = timezone.now()
+        for index, key in enumerate(['old', 'newer', 'newest']):
+            SummaryCacheEntry.objects.create(key=key, model='m', summary='x' * 100, size=100,
+                                             last_used_at=now - timedelta(minutes=10 - index))
+
+        with override_settings(ACTIVITY_SUMMARY_CACHE_MAX_BYTES=250):
+            self.cache.set('latest', 'm', 'y' * 100)
+
+        self.assertEqual(set(SummaryCacheEntry.objects.values_list('key', flat=True)), {'newest', 'latest'})
+        self.assertEqual(self.cache.stats()['evictions'], 2)
+
+    @override_settings(ACTIVITY_SUMMARY_CACHE_MAX_BYTES=150, ACTIVITY_SUMMARY_CACHE_EVICT_INTERVAL=300)
+    def test_stores_only_evict_when_it_is_due(self):
+        self.cache.set('first', 'm', 'x' * 100)
+        # Within the interval a store is just the write: no expiry delete, size sum or LRU scan
+        with CaptureQueriesContext(connection) as queries:
+            self.cache.set('second', 'm', 'x' * 100)
+        self.assertFalse([query for query in queries if 'DELETE' in query['sql'] or 'SUM(' in query['sql']])
+        self.assertEqual(SummaryCacheEntry.objects.count(), 2)
+
+        with mock.patch.object(time, 'monotonic', return_value=time.monotonic() + 301):
+            self.cache.set('third', 'm', 'x' * 100)
+        self.assertEqual(set(SummaryCacheEntry.objects.values_list('key', flat=True)), {'third'})
+
+
+@override_settings(ACTIVITY_JOB_RUN_IN_PROCESS=False, ACTIVITY_JOB_MAX_ATTEMPTS=3, ACTIVITY_JOB_RETRY_DELAY=10,
+                   ACTIVITY_TRANSCRIPTION_SEGMENT_SECONDS=1, ACTIVITY_TRANSCRIPTION_SPLIT_ON_SILENCE=True)
+class ProcessingJobTests(StandInServicesMixin, TemporaryMediaMixin, TransactionTestCase):
+    # TransactionTestCase: the job runner closes its connection the way a worker thread does
+
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user('runner')
+        self.activity = DailyActivity.objects.create(user=self.user, date=date(2024, 1, 1))
+        self.job = enqueue_processing(self.activity, self.wav_path, user=self.user)
+
+    def refresh(self):
+        self.job.refresh_from_db()
+        self.activity.refresh_from_db()
+
+    def test_job_stores_segmented_transcript_and_summary(self):
+        self.use_services()
+        run_job(self.job.pk)
+        self.refresh()
+
+        self.assertEqual((self.job.status, self.job.stage), (ProcessingJob.STATUS_SUCCEEDED, ProcessingJob.STAGE_DONE))
+        self.assertEqual(self.job.attempts, 1)
+        segments = self.activity.transcript_segments
+        self.assertGreater(len(segments), 1)
+        self.assertEqual(segments[0]['start'], 0)
+        self.assertEqual(segments[-1]['end'], 3.5)
+        for previous, segment in zip(segments, segments[1:]):
+            self.assertEqual(previous['end'], segment['start'])
+        self.assertEqual(self.activity.transcript, ' '.join(segment['text'] for segment in segments))
+        self.assertTrue(self.activity.summary.startswith('Summary:'))
+        self.assertEqual(self.openai.calls, 1)
+
+    def test_failed_attempts_back_off_then_fail_permanently(self):
+        self.use_services(recognizer=FailingRecognizerBackend())
+        delays = []
+        for attempt in range(1, 4):
+            before = timezone.now()
+            run_job(self.job.pk)
+            self.refresh()
+            self.assertEqual(self.job.attempts, attempt)
+            self.assertIn('recognizer unavailable', self.job.error)
+            if attempt < 3:
+                self.assertEqual(self.job.status, ProcessingJob.STATUS_QUEUED)
+                delays.append(round((self.job.run_after - before).total_seconds()))
+                # Not due yet, so another run doesn't claim it
+                run_job(self.job.pk)
+                self.job.refresh_from_db()
+                self.assertEqual(self.job.attempts, attempt)
+                ProcessingJob.objects.filter(pk=self.job.pk).update(run_after=timezone.now())
+
+        self.assertEqual(delays, [10, 20])
+        self.assertEqual(self.job.status, ProcessingJob.STATUS_FAILED)
+        self.assertEqual(self.activity.transcript, '')
+
+    def test_retry_resumes_at_the_failed_stage(self):
+        self.use_services(openai_client=CountingOpenAI(error=RuntimeError('rate limited')))
+        run_job(self.job.pk)
+        self.refresh()
+        self.assertEqual(self.job.status, ProcessingJob.STATUS_QUEUED)
+        self.assertEqual(self.job.stage, ProcessingJob.STAGE_SUMMARIZE)
+        self.assertNotEqual(self.activity.transcript, '')
+
+        self.openai.error = None
+        ProcessingJob.objects.filter(pk=self.job.pk).update(run_after=timezone.now())
+        with mock.patch.object(self.recognizer, 'recognize', side_effect=AssertionError('transcribed twice')):
+            run_job(self.job.pk)
+        self.refresh()
+        self.assertEqual((self.job.status, self.job.attempts), (ProcessingJob.STATUS_SUCCEEDED, 2))
+        self.assertTrue(self.activity.summary.startswith('Summary:'))
+
+    def test_unintelligible_audio_is_not_retried(self):
+        self.use_services()
+        with mock.patch.object(self.recognizer, 'recognize', side_effect=sr.UnknownValueError()):
+            run_job(self.job.pk)
+        self.refresh()
+        self.assertEqual((self.job.status, self.job.attempts), (ProcessingJob.STATUS_SUCCEEDED, 1))
+        self.assertEqual(self.activity.transcript, 'Speech recognition could not understand the audio')
+        self.assertEqual(self.openai.calls, 0)
+
+
+@override_settings(ACTIVITY_JOB_RUN_IN_PROCESS=False)
+class RecordingStorageTests(TemporaryMediaMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user('recorder')
+        self.auth = {'Authorization': f'Bearer {AccessToken.for_user(self.user)}'}
+
+    def upload(self):
+        # save_recording moves a file it is given, so each upload gets its own copy of the same audio
+        return self.write_wav('recording.wav', 3.5)
+
+    async def test_async_delete_of_a_blob_backed_recording(self):
+        activity, _ = await sync_to_async(save_recording)(self.user, '2024-01-01', self.wav_path)
+        recording = await AudioRecording.objects.select_related('blob').aget(activity=activity)
+        blob_path = recording.blob.path
+
+        response = await AsyncClient().post(
+            '/api/async/audio/delete/', {'date': '2024-01-01', 'file_name': recording.filename},
+            content_type='application/json', headers=self.auth,
+        )
+
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertFalse(await AudioRecording.objects.filter(pk=recording.pk).aexists())
+        self.assertFalse(await AudioBlob.objects.aexists())
+        self.assertFalse(os.path.exists(blob_path))
+
+    def test_duplicate_upload_returns_the_existing_activity_and_job(self):
+        activity, job = save_recording(self.user, '2024-01-01', self.upload())
+        again, same_job = save_recording(self.user, '2024-01-01', self.upload())
+
+        self.assertEqual((again.pk, same_job.pk), (activity.pk, job.pk))
+        self.assertEqual(DailyActivity.objects.count(), 1)
+        self.assertEqual(AudioRecording.objects.count(), 1)
+        self.assertEqual(ProcessingJob.objects.count(), 1)
+        self.assertEqual(AudioBlob.objects.get().ref_count, 1)
+
+    def test_same_audio_on_other_dates_shares_one_blob(self):
+        first, _ = save_recording(self.user, '2024-01-01', self.upload())
+        second, _ = save_recording(self.user, '2024-01-02', self.upload())
+        other_user = User.objects.create_user('other')
+        save_recording(other_user, '2024-01-01', self.upload())
+
+        blob = AudioBlob.objects.get()
+        self.assertEqual(blob.ref_count, 3)
+        self.assertEqual(AudioRecording.objects.filter(blob=blob).count(), 3)
+        self.assertEqual(len(os.listdir(os.path.dirname(blob.path))), 1)
+
+        delete_recording(AudioRecording.objects.select_related('blob').get(activity=first))
+        blob.refresh_from_db()
+        self.assertEqual(blob.ref_count, 2)
+        self.assertTrue(os.path.exists(blob.path))
+
+        other_user.delete()
+        delete_recording(AudioRecording.objects.select_related('blob').get(activity=second))
+        self.assertFalse(AudioBlob.objects.exists())
+        self.assertFalse(os.path.exists(blob.path))
+
+    def test_deleted_recording_can_be_uploaded_again(self):
+        activity, _ = save_recording(self.user, '2024-01-01', self.upload())
+        delete_recording(AudioRecording.objects.select_related('blob').get(activity=activity))
+
+        again, job = save_recording(self.user, '2024-01-01', self.upload())
+        self.assertNotEqual(again.pk, activity.pk)
+        self.assertEqual(job.activity_id, again.pk)
+        self.assertEqual(AudioBlob.objects.get().ref_count, 1)
+
+
+@override_settings(ACTIVITY_JOB_RUN_IN_PROCESS=False)
+class BlobWaveformTests(TemporaryMediaMixin, TransactionTestCase):
+    """The WAV is read for its waveform before any transaction takes SQLite's write lock."""
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user('waveform')
+        self.in_transaction = []
+        describe = blobs._describe
+
+        def recording_describe(path):
+            self.in_transaction.append(connection.in_atomic_block)
+            return describe(path)
+        patcher = mock.patch.object(blobs, '_describe', side_effect=recording_describe)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_upload_is_described_outside_the_transaction(self):
+        activity, _ = save_recording(self.user, '2024-01-01', self.wav_path)
+
+        self.assertEqual(self.in_transaction, [False])
+        blob = AudioRecording.objects.get(activity=activity).blob
+        self.assertEqual((blob.duration, blob.sample_rate, blob.channels), (3.5, 16000, 1))
+        self.assertTrue(0 < len(blob.peaks) <= 1024)
+
+    def test_legacy_blob_gets_its_waveform_outside_a_transaction(self):
+        activity, _ = save_recording(self.user, '2024-01-01', self.wav_path)
+        recording = AudioRecording.objects.get(activity=activity)
+        AudioBlob.objects.update(peaks=None, sample_rate=None, channels=None)
+        self.in_transaction.clear()
+
+        self.client.defaults['HTTP_AUTHORIZATION'] = f'Bearer {AccessToken.for_user(self.user)}'
+        response = self.client.get(f'/api/audio/{recording.pk}/peaks/', {'resolution': 64})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['peaks']), 64)
+        self.assertEqual(self.in_transaction, [False])
+        self.assertEqual(AudioBlob.objects.get().sample_rate, 16000)
+
+
+@override_settings(ACTIVITY_JOB_RUN_IN_PROCESS=False, ACTIVITY_UPLOAD_MAX_CHUNK_SIZE=64 * 1024)
+class ChunkedUploadTests(TemporaryMediaMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        settings_override = override_settings(
+            ACTIVITY_UPLOAD_SESSION_DIR=os.path.join(settings.MEDIA_ROOT, 'upload_sessions'))
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.user = User.objects.create_user('uploader')
+        self.client.defaults['HTTP_AUTHORIZATION'] = f'Bearer {AccessToken.for_user(self.user)}'
+        with open(self.wav_path, 'rb') as f:
+            self.data = f.read()
+        # Three chunks of the WAV: (offset, bytes)
+        size = len(self.data) // 3 + 1
+        self.parts = [(offset, self.data[offset:offset + size]) for offset in range(0, len(self.data), size)]
+
+    def start(self, total_size=None):
+        response = self.client.post('/api/uploads/', {'date': '2024-01-01', 'total_size': total_size or len(self.data)})
+        self.assertEqual(response.status_code, 201)
+        return UploadSession.objects.get(pk=response.json()['id'])
+
+    def put(self, session, index, offset, data, sha256=None):
+        return self.client.put(
+            f'/api/uploads/{session.pk}/chunks/{index}/', data, content_type='application/octet-stream',
+            headers={'X-Chunk-Offset': str(offset), 'X-Chunk-SHA256': sha256 or hashlib.sha256(data).hexdigest()},
+        )
+
+    def finalize(self, session, **data):
+        return self.client.post(f'/api/uploads/{session.pk}/finalize/', data)
+
+    def stored_audio(self, activity_id):
+        with open(AudioRecording.objects.get(activity_id=activity_id).path, 'rb') as f:
+            return f.read()
+
+    def test_out_of_order_and_repeated_chunks(self):
+        session = self.start()
+        (first, second, third) = self.parts
+        self.assertEqual(self.put(session, 2, *third).status_code, 200)
+        # A chunk re-sent after a dropped connection replaces the earlier copy
+        self.assertEqual(self.put(session, 0, first[0], b'x' * len(first[1])).status_code, 200)
+        self.assertEqual(self.put(session, 0, *first).status_code, 200)
+        self.assertEqual(self.put(session, 1, *second).status_code, 200)
+        self.assertEqual(self.client.get(f'/api/uploads/{session.pk}/').json()['received_bytes'], len(self.data))
+
+        response = self.finalize(session, sha256=hashlib.sha256(self.data).hexdigest())
+
+        self.assertEqual(response.status_code, 202, response.content)
+        self.assertEqual(self.stored_audio(response.json()['activity_id']), self.data)
+        session.refresh_from_db()
+        self.assertEqual(session.status, UploadSession.STATUS_COMPLETED)
+        self.assertFalse(os.path.exists(uploads.session_dir(session)))
+
+    def test_rejected_chunks_are_not_recorded(self):
+        session = self.start()
+        offset, data = self.parts[0]
+
+        self.assertEqual(self.put(session, 0, offset, data, sha256='0' * 64).status_code, 400)
+        self.assertEqual(self.put(session, 0, len(self.data), data).status_code, 400)
+        self.assertEqual(self.put(session, 0, offset, b'').status_code, 400)
+        with override_settings(ACTIVITY_UPLOAD_MAX_CHUNK_SIZE=len(data) - 1):
+            self.assertEqual(self.put(session, 0, offset, data).status_code, 413)
+
+        self.assertFalse(session.chunks.exists())
+        self.assertEqual(os.listdir(uploads.session_dir(session)), [])
+
+    def test_finalize_needs_every_byte(self):
+        session = self.start()
+        (first, second, third) = self.parts
+        self.put(session, 0, *first)
+        self.put(session, 2, *third)
+
+        response = self.finalize(session)
+        self.assertEqual(response.status_code, 409)
+        self.assertIn(f'offset {second[0]}', response.json()['error'])
+
+        # Overlapping chunks are just as incomplete
+        self.put(session, 1, second[0] + 1, second[1][1:] + third[1][:1])
+        self.assertEqual(self.finalize(session).status_code, 409)
+
+        # The session stays open, so the client can send what was missing
+        self.assertEqual(self.put(session, 1, *second).status_code, 200)
+        self.assertEqual(self.finalize(session).status_code, 202)
+
+    def test_finalize_checks_the_declared_size_and_checksum(self):
+        session = self.start(total_size=len(self.data) + 10)
+        for index, (offset, data) in enumerate(self.parts):
+            self.put(session, index, offset, data)
+        self.assertEqual(self.finalize(session).status_code, 409)
+
+        UploadSession.objects.filter(pk=session.pk).update(total_size=len(self.data))
+        self.assertEqual(self.finalize(session, sha256='0' * 64).status_code, 400)
+        self.assertFalse(DailyActivity.objects.exists())
+        self.assertEqual(UploadSession.objects.get(pk=session.pk).status, UploadSession.STATUS_OPEN)
+
+    def test_concurrent_finalize_assembles_once(self):
+        session = self.start()
+        for index, (offset, data) in enumerate(self.parts):
+            self.put(session, index, offset, data)
+        second_attempts = []
+
+        def save_while_another_request_finalizes(*args, **kwargs):
+            # A second request arriving while the first one is still assembling the file
+            second_attempts.append(self.finalize(session).status_code)
+            return save_recording(*args, **kwargs)
+
+        with mock.patch.object(uploads, 'save_recording', side_effect=save_while_another_request_finalizes) as saved:
+            response = self.finalize(session)
+            again = self.finalize(session)
+
+        self.assertEqual(response.status_code, 202, response.content)
+        self.assertEqual(second_attempts, [409])
+        self.assertEqual(again.status_code, 409)
+        self.assertEqual(saved.call_count, 1)
+        self.assertEqual(DailyActivity.objects.count(), 1)
+        # Chunks can't be sent to a session that is being, or has been, finalized
+        self.assertEqual(self.put(session, 0, *self.parts[0]).status_code, 409)
+
+    def test_other_users_sessions_are_not_found(self):
+        session = self.start()
+        self.client.defaults['HTTP_AUTHORIZATION'] = f'Bearer {AccessToken.for_user(User.objects.create_user("other"))}'
+        self.assertEqual(self.put(session, 0, *self.parts[0]).status_code, 404)
+        self.assertEqual(self.finalize(session).status_code, 404)
+
+
+class MetricsEndpointTests(TestCase):
+    @override_settings(ACTIVITY_METRICS_TOKEN=None)
+    def test_closed_without_a_configured_token(self):
+        self.assertEqual(self.client.get('/api/metrics/').status_code, 403)
+        self.assertEqual(self.client.get('/api/metrics/', headers={'Authorization': 'Bearer None'}).status_code, 403)
+
+    @override_settings(ACTIVITY_METRICS_TOKEN='scrape-secret')
+    def test_requires_the_token(self):
+        self.assertEqual(self.client.get('/api/metrics/').status_code, 401)
+        self.assertEqual(self.client.get('/api/metrics/', headers={'Authorization': 'Bearer wrong'}).status_code, 401)
+        response = self.client.get('/api/metrics/', headers={'Authorization': 'Bearer scrape-secret'})
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'activity_request_seconds', response.content)
+
+    @override_settings(ACTIVITY_METRICS_TOKEN=None)
+    def test_staff_sessions_are_allowed(self):
+        self.client.force_login(User.objects.create_user('viewer'))
+        self.assertEqual(self.client.get('/api/metrics/').status_code, 403)
+        self.client.force_login(User.objects.create_user('operator', is_staff=True))
+        self.assertEqual(self.client.get('/api/metrics/').status_code, 200)
+
+
+class SyncFeedTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('syncer')
+        self.client.defaults['HTTP_AUTHORIZATION'] = f'Bearer {AccessToken.for_user(self.user)}'
+
+    def sync(self, since=None, **params):
+        if since is not None:
+            params['since'] = since
+        response = self.client.get('/api/sync/', params)
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()
+
+    def create_activity(self, day=1, **fields):
+        return DailyActivity.objects.create(user=self.user, date=date(2024, 1, day), **fields)
+
+    def test_token_round_trip(self):
+        first = self.create_activity(1)
+        second = self.create_activity(2)
+        recording = AudioRecording.objects.create(user=self.user, activity=first, date=first.date, filename='a.wav')
+        DailyActivity.objects.create(user=User.objects.create_user('someone-else'), date=date(2024, 1, 1))
+
+        page = self.sync()
+        self.assertFalse(page['has_more'])
+        self.assertEqual({a['id'] for a in page['activities']}, {first.pk, second.pk})
+        self.assertEqual([r['id'] for r in page['recordings']], [recording.pk])
+
+        # Nothing changed: an empty page, with a token that is just as good
+        unchanged = self.sync(page['token'])
+        self.assertEqual((unchanged['activities'], unchanged['recordings']), ([], []))
+        self.assertEqual(unchanged['deleted'], {'activities': [], 'recordings': []})
+
+        second.spending = 12.5
+        second.save()
+        changed = self.sync(unchanged['token'])
+        self.assertEqual([(a['id'], a['spending']) for a in changed['activities']], [(second.pk, 12.5)])
+        self.assertEqual(changed['recordings'], [])
+        self.assertEqual(self.sync(changed['token'])['activities'], [])
+
+    def test_pages_do_not_split_a_version(self):
+        singles = [self.create_activity(day) for day in (1, 2)]
+        bulk, _ = bulk_create_activities(self.user, [{'date': f'2024-01-{day:02}'} for day in (3, 4, 5)])
+        bulk_versions = DailyActivity.objects.filter(pk__in=[a.pk for a in bulk]).values_list('sync_version', flat=True)
+        self.assertEqual(len(set(bulk_versions)), 1)
+
+        pages, token = [], None
+        while True:
+            page = self.sync(token, limit=2)
+            pages.append([a['id'] for a in page['activities']])
+            token = page['token']
+            if not page['has_more']:
+                break
+
+        # The bulk-created version is stopped short of, then sent whole although it is over the limit
+        self.assertEqual(pages, [[a.pk for a in singles], [a.pk for a in bulk], []])
+
+    def test_deletes_leave_tombstones(self):
+        activity = self.create_activity(1)
+        kept = self.create_activity(2)
+        recording = AudioRecording.objects.create(user=self.user, date=kept.date, filename='a.wav')
+        other = DailyActivity.objects.create(user=User.objects.create_user('someone-else'), date=date(2024, 1, 1))
+        token = self.sync()['token']
+
+        activity_id, recording_id = activity.pk, recording.pk
+        activity.delete()
+        recording.delete()
+        other.delete()
+
+        page = self.sync(token)
+        self.assertEqual(page['deleted'], {'activities': [activity_id], 'recordings': [recording_id]})
+        self.assertEqual((page['activities'], page['recordings']), ([], []))
+        # A full sync only lists what exists
+        full = self.sync()
+        self.assertEqual([a['id'] for a in full['activities']], [kept.pk])
+        self.assertEqual(full['deleted'], {'activities': [], 'recordings': []})
+
+    def test_malformed_token_or_limit_is_rejected(self):
+        for params in ({'since': 'garbage'}, {'since': '12'}, {'limit': 'many'}):
+            response = self.client.get('/api/sync/', params)
+            self.assertEqual(response.status_code, 400, params)
+
+    @override_settings(ACTIVITY_SYNC_TOMBSTONE_DAYS=30)
+    def test_token_older_than_the_tombstones_is_gone(self):
+        version = self.sync()['token'].split('.')[0]
+        issued = timezone.now() - timedelta(days=31)
+        response = self.client.get('/api/sync/', {'since': f'{version}.{int(issued.timestamp())}'})
+        self.assertEqual(response.status_code, 410)
+
+    @override_settings(ACTIVITY_SYNC_TOMBSTONE_DAYS=30)
+    def test_prune_removes_only_expired_tombstones(self):
+        old, recent = self.create_activity(1), self.create_activity(2)
+        old.delete()
+        SyncTombstone.objects.update(deleted_at=timezone.now() - timedelta(days=31))
+        recent.delete()
+
+        self.assertEqual(prune_tombstones(), 1)
+        self.assertEqual(SyncTombstone.objects.count(), 1)
+
+
+class SpendingRollupTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('spender')
+        self.other = User.objects.create_user('other-spender')
+
+    def rollups(self):
+        return {(row.user_id, row.period, row.period_start): (round(row.total, 6), row.count)
+                for row in SpendingRollup.objects.all()}
+
+    def aggregated(self):
+        expected = {}
+        for period, truncation in ((SpendingRollup.PERIOD_DAY, TruncDay('date')),
+                                   (SpendingRollup.PERIOD_WEEK, TruncWeek('date')),
+                                   (SpendingRollup.PERIOD_MONTH, TruncMonth('date'))):
+            rows = (DailyActivity.objects.annotate(start=truncation)
+                    .values('user_id', 'start').annotate(total=Sum('spending'), count=Count('id')).order_by())
+            for row in rows:
+                expected[(row['user_id'], period, row['start'])] = (round(row['total'], 6), row['count'])
+        return expected
+
+    def assertRollupsMatchActivities(self):
+        maintained = self.rollups()
+        self.assertEqual(maintained, self.aggregated())
+        rebuild_rollups()
+        self.assertEqual(self.rollups(), maintained)
+
+    def test_saves_and_deletes(self):
+        activity = DailyActivity.objects.create(user=self.user, date=date(2024, 1, 31), spending=10.5)
+        DailyActivity.objects.create(user=self.user, date=date(2024, 1, 31), spending=4)
+        DailyActivity.objects.create(user=self.other, date=date(2024, 1, 31), spending=7)
+        self.assertRollupsMatchActivities()
+
+        activity.spending = 3.25
+        activity.save()
+        self.assertRollupsMatchActivities()
+
+        # Wednesday 31 January to Monday 5 February: another day, week and month
+        activity.date = date(2024, 2, 5)
+        activity.save()
+        self.assertRollupsMatchActivities()
+        self.assertNotIn((self.user.pk, SpendingRollup.PERIOD_DAY, date(2024, 2, 1)), self.rollups())
+
+        activity.delete()
+        self.assertRollupsMatchActivities()
+        self.assertFalse(SpendingRollup.objects.filter(period_start=date(2024, 2, 5)).exists())
+
+    def test_moving_an_activity_to_another_user(self):
+        activity = DailyActivity.objects.create(user=self.user, date=date(2024, 3, 1), spending=8)
+        activity.user = self.other
+        activity.save()
+        self.assertRollupsMatchActivities()
+        self.assertFalse(SpendingRollup.objects.filter(user=self.user).exists())
+
+    def test_spending_cannot_be_cleared(self):
+        activity = DailyActivity.objects.create(user=self.user, date=date(2024, 3, 1), spending=8)
+        self.client.defaults['HTTP_AUTHORIZATION'] = f'Bearer {AccessToken.for_user(self.user)}'
+
+        response = self.client.patch(f'/api/activities/{activity.pk}/', {'spending': None},
+                                     content_type='application/json')
+
+        self.assertEqual(response.status_code, 400)
+        self.assertRollupsMatchActivities()
+        self.assertEqual(self.rollups()[(self.user.pk, SpendingRollup.PERIOD_DAY, date(2024, 3, 1))], (8, 1))
+
+    def test_bulk_writes(self):
+        created, _ = bulk_create_activities(self.user, [
+            {'date': '2024-01-30', 'spending': 1.5},
+            {'date': '2024-01-31', 'spending': 2},
+            {'date': '2024-02-01', 'spending': 4},
+        ])
+        self.assertRollupsMatchActivities()
+
+        bulk_update_activities(self.user, [
+            {'id': created[0].pk, 'date': '2024-02-29'},
+            {'id': created[1].pk, 'spending': 0},
+            {'id': created[2].pk, 'date': '2023-12-31', 'spending': 6},
+        ])
+        self.assertRollupsMatchActivities()
+
+    def test_deleting_the_user_removes_their_rollups(self):
+        for day in (1, 15, 31):
+            DailyActivity.objects.create(user=self.user, date=date(2024, 1, day), spending=day)
+        DailyActivity.objects.create(user=self.other, date=date(2024, 1, 1), spending=2)
+
+        self.user.delete()
+
+        self.assertRollupsMatchActivities()
+        self.assertEqual({key[0] for key in self.rollups()}, {self.other.pk})
+
+
+class SpendingStatsEndpointTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('spender')
+        self.client.defaults['HTTP_AUTHORIZATION'] = f'Bearer {AccessToken.for_user(self.user)}'
+        for day, spending in ((1, 5), (2, 7.5), (8, 1)):
+            DailyActivity.objects.create(user=self.user, date=date(2024, 1, day), spending=spending)
+        DailyActivity.objects.create(user=User.objects.create_user('other-spender'), date=date(2024, 1, 1), spending=9)
+
+    def test_totals_per_period(self):
+        response = self.client.get('/api/stats/', {'period': 'week', 'start': '2024-01-03', 'end': '2024-01-10'})
+
+        self.assertEqual(response.status_code, 200)
+        body = response.json()
+        # Both ends snap to the start of their week
+        self.assertEqual((body['start'], body['end']), ('2024-01-01', '2024-01-08'))
+        self.assertEqual([(row['period_start'], row['total'], row['count']) for row in body['results']],
+                         [('2024-01-01', 12.5, 2), ('2024-01-08', 1.0, 1)])
+        self.assertEqual((body['total'], body['count']), (13.5, 3))
+
+    def test_invalid_parameters(self):
+        for params in ({'period': 'year'},
+                       {'start': '2024-13-01'},
+                       {'end': 'yesterday'},
+                       {'period': 'day', 'start': '2024-01-02', 'end': '2024-01-01'},
+                       {'period': 'day', 'start': '2020-01-01', 'end': '2024-01-01'}):
+            response = self.client.get('/api/stats/', params)
+            self.assertEqual(response.status_code, 400, params)
+
+
+class ConditionalGetTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('reader')
+        self.client.defaults['HTTP_AUTHORIZATION'] = f'Bearer {AccessToken.for_user(self.user)}'
+        self.activity = DailyActivity.objects.create(user=self.user, date=date(2024, 1, 1), spending=3)
+
+    def etag(self, path='/api/activities/'):
+        response = self.client.get(path)
+        self.assertEqual(response.status_code, 200)
+        return response['ETag']
+
+    def assertChangesETag(self, write):
+        before = self.etag()
+        write()
+        self.assertEqual(self.client.get('/api/activities/', headers={'If-None-Match': before}).status_code, 200)
+        self.assertNotEqual(self.etag(), before)
+
+    def test_matching_etag_is_not_modified(self):
+        response = self.client.get('/api/activities/')
+        self.assertTrue(response['ETag'].startswith('W/"'))
+        self.assertEqual(response['Cache-Control'], 'private, no-cache')
+        self.assertIn('Authorization', response['Vary'])
+
+        cached = self.client.get('/api/activities/', headers={'If-None-Match': response['ETag']})
+        self.assertEqual(cached.status_code, 304)
+        self.assertEqual(cached.content, b'')
+        self.assertEqual(cached['ETag'], response['ETag'])
+        self.assertIn('Authorization', cached['Vary'])
+
+    def test_etag_depends_on_the_url_and_the_user(self):
+        detail = f'/api/activities/{self.activity.pk}/'
+        self.assertNotEqual(self.etag(detail), self.etag())
+        self.assertNotEqual(self.etag('/api/activities/?fields=id'), self.etag())
+        list_etag = self.etag()
+        self.client.defaults['HTTP_AUTHORIZATION'] = f'Bearer {AccessToken.for_user(User.objects.create_user("x"))}'
+        self.assertEqual(self.client.get('/api/activities/', headers={'If-None-Match': list_etag}).status_code, 200)
+
+    def test_api_writes_change_the_etag(self):
+        self.assertChangesETag(lambda: self.client.post(
+            '/api/activities/', {'date': '2024-01-02', 'spending': 1}, content_type='application/json'))
+        self.assertChangesETag(lambda: self.client.patch(
+            f'/api/activities/{self.activity.pk}/', {'spending': 4}, content_type='application/json'))
+        self.assertChangesETag(lambda: self.client.delete(f'/api/activities/{self.activity.pk}/'))
+
+    def test_bulk_writes_change_the_etag(self):
+        created = []
+        self.assertChangesETag(lambda: created.extend(bulk_create_activities(self.user, [{'date': '2024-01-03'}])[0]))
+        self.assertChangesETag(lambda: bulk_update_activities(self.user, [{'id': created[0].pk, 'spending': 2}]))
+        self.assertChangesETag(lambda: self.client.post(
+            '/api/activities/bulk/', [{'date': '2024-01-04'}], content_type='application/json'))
+
+    def test_other_users_writes_keep_the_etag(self):
+        before = self.etag()
+        DailyActivity.objects.create(user=User.objects.create_user('someone-else'), date=date(2024, 1, 1))
+        self.assertEqual(self.client.get('/api/activities/', headers={'If-None-Match': before}).status_code, 304)
+
+
+class ProfileRevalidationTests(TemporaryMediaMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user('portrait')
+        self.client.defaults['HTTP_AUTHORIZATION'] = f'Bearer {AccessToken.for_user(self.user)}'
+
+    def photo(self):
+        from PIL import Image
+
+        buffer = BytesIO()
+        Image.new('RGB', (80, 80), 'teal').save(buffer, format='PNG')
+        return SimpleUploadedFile('me.png', buffer.getvalue(), content_type='image/png')
+
+    def test_get_after_an_update_returns_the_new_profile(self):
+        before = self.client.get('/api/profile/')
+        self.assertIsNone(before.json()['profile_photo'])
+        # Clients must revalidate, or their cached copy would outlive their own update
+        self.assertEqual(before['Cache-Control'], 'private, no-cache')
+
+        self.assertEqual(self.client.post('/api/profile/', {'profile_photo': self.photo()}).status_code, 200)
+
+        after = self.client.get('/api/profile/', headers={'If-None-Match': before['ETag']})
+        self.assertEqual(after.status_code, 200)
+        self.assertTrue(after.json()['profile_photo'])
+        self.assertNotEqual(after['ETag'], before['ETag'])
+        self.assertEqual(self.client.get('/api/profile/', headers={'If-None-Match': after['ETag']}).status_code, 304)
+
+
+@override_settings(ACTIVITY_COMPRESS_MIN_BYTES=200)
+class CompressionTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('reader')
+        self.client.defaults['HTTP_AUTHORIZATION'] = f'Bearer {AccessToken.for_user(self.user)}'
+        for day in range(1, 6):
+            DailyActivity.objects.create(user=self.user, date=date(2024, 1, day), transcript='went for a walk ' * 20)
+        self.identity = self.client.get('/api/activities/').content
+
+    def get(self, accept_encoding):
+        return self.client.get('/api/activities/', headers={'Accept-Encoding': accept_encoding})
+
+    @skipIf(brotli is None, "brotli is not installed")
+    def test_brotli_preferred_over_gzip(self):
+        response = self.get('gzip, deflate, br')
+        self.assertEqual(response['Content-Encoding'], 'br')
+        self.assertEqual(brotli.decompress(response.content), self.identity)
+        self.assertEqual(response['Content-Length'], str(len(response.content)))
+        self.assertIn('Accept-Encoding', response['Vary'])
+        self.assertIn('Authorization', response['Vary'])
+
+    def test_gzip(self):
+        response = self.get('gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(response.content), self.identity)
+
+    def test_identity_when_nothing_is_accepted(self):
+        response = self.get('identity')
+        self.assertFalse(response.has_header('Content-Encoding'))
+        self.assertEqual(response.content, self.identity)
+        self.assertIn('Accept-Encoding', response['Vary'])
+
+    def test_small_bodies_are_not_compressed(self):
+        response = self.client.get('/api/activities/?fields=id', headers={'Accept-Encoding': 'br, gzip'})
+        self.assertLess(len(response.content), 200)
+        self.assertFalse(response.has_header('Content-Encoding'))
+
+    def test_encoded_and_non_text_responses_are_passed_through(self):
+        request = RequestFactory().get('/', headers={'Accept-Encoding': 'gzip'})
+        body = b'x' * 1000
+        for content_type, headers in (('application/json', {'Content-Encoding': 'gzip'}),
+                                      ('audio/wav', {})):
+            response = HttpResponse(body, content_type=content_type, headers=headers)
+            response = CompressionMiddleware(lambda request: response)(request)
+            self.assertEqual(response.content, body)
+            self.assertEqual(response.get('Content-Encoding'), headers.get('Content-Encoding'))
+
+    def test_strong_etag_is_weakened_when_compressed(self):
+        request = RequestFactory().get('/', headers={'Accept-Encoding': 'gzip'})
+        response = HttpResponse(b'{"x": 1}' * 100, content_type='application/json', headers={'ETag': '"abc"'})
+        response = CompressionMiddleware(lambda request: response)(request)
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(response['ETag'], 'W/"abc"')
+
+
+class SearchTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('searcher')
+        self.other = User.objects.create_user('other-searcher')
+        self.client.defaults['HTTP_AUTHORIZATION'] = f'Bearer {AccessToken.for_user(self.user)}'
+
+    def ids(self, query, user=None):
+        return [result['id'] for result in search.search_activities(user or self.user, query)]
+
+    def test_sqlite_uses_the_fts_index(self):
+        self.assertIsInstance(search.get_search_backend(connection), search.SQLiteFTSBackend)
+
+    def test_triggers_keep_the_index_in_sync(self):
+        activity = DailyActivity.objects.create(user=self.user, date=date(2024, 1, 1), transcript='walked the dog')
+        self.assertEqual(self.ids('dog'), [activity.pk])
+        self.assertEqual(self.ids('walking'), [activity.pk])  # Porter stemming
+
+        activity.transcript = 'fed the cat'
+        activity.save()
+        self.assertEqual(self.ids('dog'), [])
+        self.assertEqual(self.ids('cat'), [activity.pk])
+
+        # The job runner stores summaries with QuerySet.update(), bypassing signals
+        DailyActivity.objects.filter(pk=activity.pk).update(summary='Bought groceries')
+        self.assertEqual(self.ids('groceries'), [activity.pk])
+
+        DailyActivity.objects.filter(pk=activity.pk).update(user=self.other)
+        self.assertEqual(self.ids('cat'), [])
+        self.assertEqual(self.ids('cat', self.other), [activity.pk])
+
+        activity.delete()
+        self.assertEqual(self.ids('cat', self.other), [])
+
+    def test_only_the_users_own_activities_match(self):
+        own = DailyActivity.objects.create(user=self.user, date=date(2024, 1, 1), transcript='coffee with Sam')
+        DailyActivity.objects.create(user=self.other, date=date(2024, 1, 1), transcript='coffee alone')
+        DailyActivity.objects.create(user=self.other, date=date(2024, 1, 2), transcript=str(self.user.pk))
+
+        self.assertEqual(self.ids('coffee'), [own.pk])
+        # The owner column is only matched against the owner
+        self.assertEqual(self.ids(str(self.user.pk)), [])
+
+    def test_ranked_snippets(self):
+        once = DailyActivity.objects.create(user=self.user, date=date(2024, 1, 1), transcript='a run, then work')
+        often = DailyActivity.objects.create(user=self.user, date=date(2024, 1, 2), transcript='run run run',
+                                             summary='Went for a run')
+
+        results = search.search_activities(self.user, 'run')
+
+        self.assertEqual([result['id'] for result in results], [often.pk, once.pk])
+        self.assertGreater(results[0]['rank'], results[1]['rank'])
+        self.assertEqual(results[0]['summary_snippet'], 'Went for a <mark>run</mark>')
+        self.assertEqual(results[1]['transcript_snippet'], 'a <mark>run</mark>, then work')
+
+    def test_match_expression_quotes_user_input(self):
+        self.assertEqual(search.SQLiteFTSBackend._match_expression('walk* "the park', 7),
+                         'user_id : "7" AND {transcript summary} : ("walk"* """the" "park")')
+        self.assertEqual(search.SQLiteFTSBackend._match_expression('* **', 7), '')
+
+    def test_fts_syntax_is_searched_literally(self):
+        activity = DailyActivity.objects.create(user=self.user, date=date(2024, 1, 1),
+                                                transcript='walk in the park or near the river')
+        for query in ('walk OR', 'NOT walk', 'near(walk park)', 'transcript: walk', '"walk', 'walk"',
+                      '(walk', 'walk AND', '^walk', 'user_id:1', '"', '-walk', 'walk +'):
+            self.assertIsInstance(self.ids(query), list, query)
+        self.assertEqual(self.ids('pa*'), [activity.pk])
+        self.assertEqual(self.ids('walk OR missing'), [])  # OR is a term, not an operator
+        self.assertEqual(self.ids('"walk"'), [activity.pk])
+
+    def test_endpoint(self):
+        activity = DailyActivity.objects.create(user=self.user, date=date(2024, 1, 1), transcript='piano lesson')
+
+        response = self.client.get('/api/search/', {'q': 'piano', 'limit': 5})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['count'], 1)
+        self.assertEqual(response.json()['results'][0]['id'], activity.pk)
+        self.assertEqual(self.client.get('/api/search/', {'q': ' '}).status_code, 400)
+        self.assertEqual(self.client.get('/api/search/', {'q': 'piano', 'limit': 'x'}).status_code, 400)
+
+    def test_icontains_fallback(self):
+        activity = DailyActivity.objects.create(user=self.user, date=date(2024, 1, 1),
+                                                transcript='Practised the Piano', summary='Music')
+        DailyActivity.objects.create(user=self.other, date=date(2024, 1, 1), transcript='piano')
+
+        with mock.patch.dict(search._sqlite_fts_available, {connection.alias: False}):
+            self.assertIsInstance(search.get_search_backend(connection), search.ContainsSearchBackend)
+            results = self.client.get('/api/search/', {'q': 'piano music'}).json()['results']
+            self.assertEqual(self.ids('piano "quoted'), [])
+
+        self.assertEqual([result['id'] for result in results], [activity.pk])
+        self.assertEqual(results[0]['transcript_snippet'], 'Practised the <mark>Piano</mark>')
+        self.assertEqual(results[0]['summary_snippet'], '<mark>Music</mark>')
+
+
+class BulkWriteTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('bulk-writer')
+        self.other = User.objects.create_user('other-writer')
+        self.client.defaults['HTTP_AUTHORIZATION'] = f'Bearer {AccessToken.for_user(self.user)}'
+
+    def bulk(self, method, items):
+        return getattr(self.client, method)('/api/activities/bulk/', items, content_type='application/json')
+
+    def test_create(self):
+        response = self.bulk('post', [{'date': '2024-01-01', 'spending': 2}, {'date': '2024-01-02'}])
+
+        self.assertEqual(response.status_code, 201)
+        results = response.json()['results']
+        self.assertEqual([result['status'] for result in results], ['created', 'created'])
+        self.assertEqual([result['activity']['spending'] for result in results], [2, 0])
+        self.assertEqual(DailyActivity.objects.filter(user=self.user).count(), 2)
+
+    def test_invalid_items_do_not_hold_back_the_valid_ones(self):
+        response = self.bulk('post', [{'date': '2024-01-01'}, {'date': 'someday'}, {'spending': 'lots'},
+                                      {'date': '2024-01-04', 'spending': 3}])
+
+        self.assertEqual(response.status_code, 207)
+        results = response.json()['results']
+        self.assertEqual([result['status'] for result in results], ['created', 'invalid', 'invalid', 'created'])
+        self.assertIn('date', results[1]['errors'])
+        self.assertEqual(set(results[2]['errors']), {'date', 'spending'})
+        self.assertEqual(sorted(str(d) for d in DailyActivity.objects.values_list('date', flat=True)),
+                         ['2024-01-01', '2024-01-04'])
+
+    def test_all_invalid_is_a_bad_request(self):
+        response = self.bulk('post', [{'date': 'someday'}, {}])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual([result['status'] for result in response.json()['results']], ['invalid', 'invalid'])
+        self.assertFalse(DailyActivity.objects.exists())
+
+    def test_update(self):
+        mine = [DailyActivity.objects.create(user=self.user, date=date(2024, 1, day)) for day in (1, 2, 3)]
+        theirs = DailyActivity.objects.create(user=self.other, date=date(2024, 1, 1), spending=1)
+
+        response = self.bulk('patch', [
+            {'id': mine[0].pk, 'spending': 5},
+            {'id': theirs.pk, 'spending': 100},
+            {'id': mine[1].pk, 'date': 'someday'},
+            {'spending': 1},
+            {'id': mine[0].pk, 'spending': 6},
+            {'id': mine[2].pk, 'summary': 'Quiet day'},
+        ])
+
+        self.assertEqual(response.status_code, 207)
+        results = response.json()['results']
+        self.assertEqual([result['status'] for result in results],
+                         ['updated', 'invalid', 'invalid', 'invalid', 'invalid', 'updated'])
+        self.assertEqual(results[1]['errors'], {'id': ['Activity not found.']})
+        self.assertEqual(results[3]['errors'], {'id': ['This field is required.']})
+        self.assertEqual(results[4]['errors'], {'id': ['Activity is updated more than once.']})
+        self.assertEqual(results[0]['activity']['spending'], 5)
+        self.assertEqual(DailyActivity.objects.get(pk=mine[0].pk).spending, 5)
+        self.assertEqual(DailyActivity.objects.get(pk=mine[1].pk).date, date(2024, 1, 2))
+        self.assertEqual(DailyActivity.objects.get(pk=mine[2].pk).summary, 'Quiet day')
+        self.assertEqual(DailyActivity.objects.get(pk=theirs.pk).spending, 1)
+
+    def test_other_users_activities_are_not_found(self):
+        theirs = DailyActivity.objects.create(user=self.other, date=date(2024, 1, 1), spending=1)
+        response = self.bulk('patch', [{'id': theirs.pk, 'spending': 100}])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(DailyActivity.objects.get(pk=theirs.pk).spending, 1)
+
+    @override_settings(ACTIVITY_BULK_MAX_ITEMS=2)
+    def test_request_limits(self):
+        self.assertEqual(self.bulk('post', [{'date': '2024-01-01'}] * 3).status_code, 400)
+        self.assertEqual(self.bulk('post', []).status_code, 400)
+        self.assertEqual(self.bulk('post', {'date': '2024-01-01'}).status_code, 400)
+        self.assertFalse(DailyActivity.objects.exists())
+        self.assertEqual(self.bulk('post', [{'date': '2024-01-01'}] * 2).status_code, 201)
+
+
+@override_settings(ACTIVITY_JOB_RUN_IN_PROCESS=False)
+class BatchDeleteTests(TemporaryMediaMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user('deleter')
+        self.client.defaults['HTTP_AUTHORIZATION'] = f'Bearer {AccessToken.for_user(self.user)}'
+        self.activity, _ = save_recording(self.user, '2024-01-01', self.wav_path)
+        self.recording = AudioRecording.objects.get(activity=self.activity)
+
+    def delete(self, files):
+        return self.client.post('/api/audio/delete/batch/', {'files': files}, content_type='application/json')
+
+    def test_status_per_file(self):
+        other = User.objects.create_user('someone-else')
+        theirs, _ = save_recording(other, '2024-01-01', self.write_wav('theirs.wav', 1))
+        their_name = AudioRecording.objects.get(activity=theirs).filename
+
+        response = self.delete([
+            {'date': '2024-01-01', 'file_name': self.recording.filename},
+            {'date': '2024-01-01', 'file_name': 'missing.wav'},
+            {'date': '2024-01-01', 'file_name': their_name},
+            {'date': 'yesterday', 'file_name': 'a.wav'},
+            {'date': '2024-01-01'},
+            'a.wav',
+        ])
+
+        self.assertEqual(response.status_code, 207)
+        self.assertEqual([result['status'] for result in response.json()['results']],
+                         ['deleted', 'not_found', 'not_found', 'invalid', 'invalid', 'invalid'])
+        self.assertEqual(response.json()['results'][0],
+                         {'date': '2024-01-01', 'file_name': self.recording.filename, 'status': 'deleted'})
+        self.assertFalse(AudioRecording.objects.filter(user=self.user).exists())
+        self.assertTrue(AudioRecording.objects.filter(user=other).exists())
+
+    def test_all_deleted(self):
+        response = self.delete([{'date': '2024-01-01', 'file_name': self.recording.filename}])
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(AudioBlob.objects.exists())
+
+    @override_settings(ACTIVITY_BULK_MAX_ITEMS=2)
+    def test_request_limits(self):
+        file = {'date': '2024-01-01', 'file_name': self.recording.filename}
+        self.assertEqual(self.delete([file] * 3).status_code, 400)
+        self.assertEqual(self.delete([]).status_code, 400)
+        self.assertEqual(self.delete([{'date': 'x'}]).status_code, 400)
+        self.assertTrue(AudioRecording.objects.exists())
+
+
+def fake_encode(source_path, dest_path, extension, bitrate=None):
+    # Stands in for ffmpeg: a third of the bytes, as a lossless encoder might manage
+    with open(source_path, 'rb') as source, open(dest_path, 'wb') as dest:
+        dest.write(source.read()[:os.path.getsize(source_path) // 3])
+    return 'flac'
+
+
+@override_settings(ACTIVITY_JOB_RUN_IN_PROCESS=False)
+class TieringTests(TemporaryMediaMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user('archivist')
+        archive = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, archive)
+        settings_override = override_settings(ACTIVITY_AUDIO_ARCHIVE_DIR=archive, ACTIVITY_AUDIO_ARCHIVE_DAYS=90)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        patcher = mock.patch.object(tiering, 'encode_file', side_effect=fake_encode)
+        self.encode = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def record(self, day, age_days):
+        activity, job = save_recording(self.user, f'2024-01-{day:02}', self.write_wav(f'{day}.wav', 1 + day / 10))
+        AudioRecording.objects.filter(activity=activity).update(created_at=timezone.now() - timedelta(days=age_days))
+        return activity, job
+
+    def tier(self, **kwargs):
+        with self.captureOnCommitCallbacks(execute=True):
+            return tiering.tier_recordings(older_than=timedelta(days=30), extension='flac', **kwargs)
+
+    def test_old_recordings_are_tiered(self):
+        old, old_job = self.record(1, 40)
+        recent, _ = self.record(2, 5)
+        blob = AudioBlob.objects.get(recordings__activity=old)
+        raw_path, raw_size = blob.path, blob.size
+
+        result = self.tier(raw_policy=tiering.RAW_DELETE)
+
+        self.assertEqual((result.tiered, result.failed), (1, 0))
+        self.assertEqual(result.bytes_before, raw_size)
+        self.assertEqual(result.bytes_after, raw_size // 3)
+        blob.refresh_from_db()
+        self.assertEqual((blob.extension, blob.codec, blob.size), ('flac', 'flac', raw_size // 3))
+        self.assertTrue(os.path.exists(blob.path))
+        self.assertFalse(os.path.exists(raw_path))
+        recording = AudioRecording.objects.get(activity=old)
+        self.assertEqual((recording.codec, recording.size), ('flac', raw_size // 3))
+        old.refresh_from_db()
+        self.assertEqual(old.audio_file.name, blob.relative_path)
+        old_job.refresh_from_db()
+        self.assertEqual(old_job.audio_path, blob.path)
+        self.assertEqual(AudioBlob.objects.get(recordings__activity=recent).extension, 'wav')
+
+        # Listing by date still finds it under its original name
+        self.client.defaults['HTTP_AUTHORIZATION'] = f'Bearer {AccessToken.for_user(self.user)}'
+        listing = self.client.get('/api/audio/date/2024-01-01/').json()
+        self.assertIn(recording.filename, str(listing))
+
+        self.assertEqual(self.tier().tiered, 0)
+
+    def test_dry_run_changes_nothing(self):
+        self.record(1, 40)
+        result = self.tier(dry_run=True)
+        self.assertEqual(result.tiered, 1)
+        self.encode.assert_not_called()
+        self.assertEqual(AudioBlob.objects.get().extension, 'wav')
+
+    def test_requeued_job_reads_the_tiered_file(self):
+        _, job = self.record(1, 40)
+        ProcessingJob.objects.filter(pk=job.pk).update(status=ProcessingJob.STATUS_RUNNING,
+                                                       updated_at=timezone.now() - timedelta(hours=2))
+        self.tier()
+
+        self.assertEqual(requeue_stale_jobs(timedelta(hours=1)), 1)
+        job.refresh_from_db()
+        self.assertEqual(job.status, ProcessingJob.STATUS_QUEUED)
+        self.assertTrue(job.audio_path.endswith('.flac'))
+        self.assertTrue(os.path.exists(job.audio_path))
+
+    def test_legacy_recordings_are_adopted_first(self):
+        activity = DailyActivity.objects.create(user=self.user, date=date(2024, 1, 3))
+        recording = AudioRecording.objects.create(user=self.user, activity=activity, date=activity.date,
+                                                  filename='legacy.wav',
+                                                  created_at=timezone.now() - timedelta(days=40))
+        os.makedirs(os.path.dirname(recording.path))
+        shutil.copy(self.wav_path, recording.path)
+        legacy_path = recording.path
+        DailyActivity.objects.filter(pk=activity.pk).update(audio_file=recording.relative_path)
+        job = enqueue_processing(activity, legacy_path, user=self.user)
+
+        result = self.tier()
+
+        self.assertEqual((result.adopted, result.tiered), (1, 1))
+        recording = AudioRecording.objects.select_related('blob').get(pk=recording.pk)
+        self.assertEqual(recording.blob.extension, 'flac')
+        self.assertFalse(os.path.exists(legacy_path))
+        job.refresh_from_db()
+        self.assertEqual(job.audio_path, recording.blob.path)
+
+    def test_failed_encodes_leave_the_blob_alone(self):
+        self.record(1, 40)
+        self.encode.side_effect = AudioConversionError('ffmpeg failed')
+        result = self.tier()
+        self.assertEqual((result.tiered, result.failed), (0, 1))
+        blob = AudioBlob.objects.get()
+        self.assertEqual(blob.extension, 'wav')
+        self.assertTrue(os.path.exists(blob.path))
+
+    def test_raw_files_are_archived_then_purged(self):
+        self.record(1, 40)
+        raw_relative_path = AudioBlob.objects.get().relative_path
+
+        self.tier(raw_policy=tiering.RAW_ARCHIVE)
+
+        archived = os.path.join(settings.ACTIVITY_AUDIO_ARCHIVE_DIR, raw_relative_path)
+        self.assertTrue(os.path.exists(archived))
+        self.assertEqual(tiering.purge_archive(), 0)  # Archived just now
+
+        stale = time.time() - 91 * 86400
+        os.utime(archived, (stale, stale))
+        with override_settings(ACTIVITY_AUDIO_ARCHIVE_DAYS=0):
+            self.assertEqual(tiering.purge_archive(), 0)  # Kept forever
+        self.assertTrue(os.path.exists(archived))
+        self.assertEqual(tiering.purge_archive(), 1)
+        self.assertFalse(os.path.exists(archived))
+
+
+class OwnerMigrationTests(TransactionTestCase):
+    """Runs 0010_assign_owners on rows from before activities had owners."""
+    before = [('activity', '0009_activity_owner')]
+    after = [('activity', '0010_assign_owners')]
+
+    def setUp(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate(self.before)
+        self.apps = executor.loader.project_state(self.before).apps
+        self.addCleanup(self.migrate_to_latest)
+
+    def migrate_to_latest(self):
+        # Rows left without an owner would (rightly) stop the later migrations
+        self.apps.get_model('auth', 'User').objects.all().delete()
+        self.apps.get_model('activity', 'DailyActivity').objects.all().delete()
+        executor = MigrationExecutor(connection)
+        executor.migrate(executor.loader.graph.leaf_nodes())
+
+    def migrate(self):
+        executor = MigrationExecutor(connection)
+        executor.loader.build_graph()
+        executor.migrate(self.after)
+
+    def create_users_and_rows(self, *usernames):
+        users = [self.apps.get_model('auth', 'User').objects.create(username=name) for name in usernames]
+        DailyActivity = self.apps.get_model('activity', 'DailyActivity')
+        traced = DailyActivity.objects.create(date=date(2024, 1, 1))
+        self.apps.get_model('activity', 'ProcessingJob').objects.create(activity=traced, user=users[-1],
+                                                                        audio_path='/nowhere.wav')
+        untraced = DailyActivity.objects.create(date=date(2024, 1, 2))
+        return users, traced, untraced
+
+    def owners(self):
+        return dict(self.apps.get_model('activity', 'DailyActivity').objects.values_list('pk', 'user_id'))
+
+    def test_the_only_account_owns_everything(self):
+        (user,), traced, untraced = self.create_users_and_rows('solo')
+        self.migrate()
+        self.assertEqual(self.owners(), {traced.pk: user.pk, untraced.pk: user.pk})
+
+    def test_untraceable_rows_stop_the_migration(self):
+        _, traced, _ = self.create_users_and_rows('first', 'second')
+        with self.assertRaisesMessage(ImproperlyConfigured, 'ACTIVITY_LEGACY_OWNER'):
+            self.migrate()
+        # Nothing was half-assigned
+        self.assertEqual(set(self.owners().values()), {None})
+
+    def test_legacy_owner_takes_the_untraceable_rows(self):
+        (first, second), traced, untraced = self.create_users_and_rows('first', 'second')
+        with override_settings(ACTIVITY_LEGACY_OWNER='first'):
+            self.migrate()
+        self.assertEqual(self.owners(), {traced.pk: second.pk, untraced.pk: first.pk})
+
+
+class AudioIndexBackfillTests(TemporaryMediaMixin, TestCase):
+    """index_audio on recordings saved per user before the index existed."""
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user('backfill')
+        self.folder = os.path.join(settings.MEDIA_ROOT, 'audio', str(self.user.pk), '2023-05-01')
+        os.makedirs(self.folder)
+        for name in ('morning.wav', 'evening.wav'):
+            shutil.copy(self.wav_path, os.path.join(self.folder, name))
+
+    def index(self, *args):
+        stdout, stderr = StringIO(), StringIO()
+        call_command('index_audio', *args, stdout=stdout, stderr=stderr)
+        return stdout.getvalue() + stderr.getvalue()
+
+    def test_files_on_disk_are_indexed_once(self):
+        self.assertIn('Indexed 2 new and refreshed 0', self.index())
+        recordings = AudioRecording.objects.order_by('filename')
+        self.assertEqual([(r.user, r.filename, str(r.date)) for r in recordings],
+                         [(self.user, 'evening.wav', '2023-05-01'), (self.user, 'morning.wav', '2023-05-01')])
+        self.assertEqual(recordings[0].size, os.path.getsize(self.wav_path))
+        self.assertTrue(all(r.blob_id is None for r in recordings))
+
+        self.assertIn('Indexed 0 new and refreshed 0', self.index())
+        self.assertEqual(AudioRecording.objects.count(), 2)
+
+    def test_changed_files_are_refreshed(self):
+        self.index()
+        shutil.copy(self.write_wav('longer.wav', 5), os.path.join(self.folder, 'morning.wav'))
+
+        self.assertIn('Indexed 0 new and refreshed 1', self.index())
+        recording = AudioRecording.objects.get(filename='morning.wav')
+        self.assertEqual(recording.size, os.path.getsize(os.path.join(self.folder, 'morning.wav')))
+        self.assertEqual(AudioRecording.objects.count(), 2)
+
+    def test_missing_files_are_pruned_only_when_asked(self):
+        self.index()
+        os.remove(os.path.join(self.folder, 'evening.wav'))
+
+        self.assertIn('1 indexed recording(s) are missing', self.index())
+        self.assertEqual(AudioRecording.objects.count(), 2)
+        self.assertIn('Removed 1 index row(s)', self.index('--prune'))
+        self.assertEqual(list(AudioRecording.objects.values_list('filename', flat=True)), ['morning.wav'])
+
+    def test_folders_of_unknown_users_are_skipped(self):
+        orphan = os.path.join(settings.MEDIA_ROOT, 'audio', str(self.user.pk + 100), '2023-05-01')
+        os.makedirs(orphan)
+        shutil.copy(self.wav_path, os.path.join(orphan, 'orphan.wav'))
+
+        self.assertIn(f'no user with id {self.user.pk + 100}', self.index())
+        self.assertFalse(AudioRecording.objects.filter(filename='orphan.wav').exists())
+        self.assertEqual(AudioRecording.objects.count(), 2)
+
+
+class LegacyAudioFolderTests(TemporaryMediaMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.folder = os.path.join(settings.MEDIA_ROOT, 'audio', '2023-05-01')
+        os.makedirs(self.folder)
+        shutil.copy(self.wav_path, os.path.join(self.folder, 'old.wav'))
+
+    def index(self):
+        stderr = StringIO()
+        call_command('index_audio', stdout=StringIO(), stderr=stderr)
+        return stderr.getvalue()
+
+    def test_moved_to_the_only_account(self):
+        user = User.objects.create_user('solo')
+        self.index()
+        recording = AudioRecording.objects.get()
+        self.assertEqual((recording.user, recording.filename, str(recording.date)), (user, 'old.wav', '2023-05-01'))
+        self.assertTrue(os.path.exists(recording.path))
+        self.assertFalse(os.path.exists(os.path.join(self.folder, 'old.wav')))
+
+    def test_skipped_without_a_legacy_owner(self):
+        User.objects.create_user('first')
+        User.objects.create_user('second')
+        self.assertIn('ACTIVITY_LEGACY_OWNER', self.index())
+        self.assertFalse(AudioRecording.objects.exists())
+        self.assertTrue(os.path.exists(os.path.join(self.folder, 'old.wav')))
+
+        with override_settings(ACTIVITY_LEGACY_OWNER='second'):
+            self.index()
+        self.assertEqual(AudioRecording.objects.get().user.username, 'second')
@@ -0,0 +1,191 @@
+"""
+Storage tiering: re-encode aging recordings from WAV to FLAC (lossless) or Opus.
+
+tier_recordings() picks the blobs whose newest reference is older than the cutoff
+and encodes each next to the original without holding any lock. It then swaps the
+blob over while its row is locked: the AudioBlob, its AudioRecordings, the
+DailyActivity.audio_file paths and the audio_path of ProcessingJobs change together,
+so a job that is retried or requeued later reads the re-encoded file. Once that has committed, the raw
+WAV is deleted or moved under ACTIVITY_AUDIO_ARCHIVE_DIR (the retention policy), and
+purge_archive() removes archived files after ACTIVITY_AUDIO_ARCHIVE_DAYS.
+
+Recordings stored before content addressing are adopted into blobs first. Every
+recording keeps its name, so listing and deleting by (date, file_name) work as before.
+Transcription decodes compressed recordings to WAV when it needs to.
+"""
+import logging
+import os
+import shutil
+import time
+from dataclasses import dataclass
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from .blobs import referenced_blob
+from .models import AudioBlob, AudioRecording, DailyActivity, ProcessingJob, blob_relative_path
+from .utility.audio import AudioConversionError, encode_file
+from .utility.metrics import span
+from .versions import touch
+
+logger = logging.getLogger('activity_logger')
+
+RAW_DELETE = 'delete'
+RAW_ARCHIVE = 'archive'
+
+
+@dataclass
+class TieringResult:
+    adopted: int = 0  # Legacy recordings moved into blobs
+    tiered: int = 0
+    failed: int = 0
+    bytes_before: int = 0
+    bytes_after: int = 0
+
+
+class _Gone(Exception):
+    pass
+
+
+def _move_jobs(old_path, new_path):
+    # Jobs keep the absolute path they were enqueued with; one retried after the raw file is gone must not fail
+    ProcessingJob.objects.filter(audio_path=old_path).update(audio_path=new_path)
+
+
+def adopt_legacy_recordings(cutoff, limit=None):
+    """
+    Move recordings created before `cutoff` that still have a file of their own
+    under MEDIA_ROOT/audio/ into content-addressed blobs. Returns how many moved.
+    """
+    adopted = 0
+    legacy = AudioRecording.objects.filter(blob__isnull=True, created_at__lt=cutoff).order_by('created_at')
+    for recording in legacy[:limit].iterator() if limit else legacy.iterator():
+        path, relative_path = recording.path, recording.relative_path
+        if not os.path.exists(path):
+            logger.warning("Not tiering %s: the file is missing (see index_audio --prune)", path)
+            continue
+        try:
+            with referenced_blob(path) as blob:
+                if not AudioRecording.objects.filter(pk=recording.pk, blob__isnull=True).update(blob=blob):
+                    raise _Gone()  # Deleted or adopted meanwhile; give the reference back
+                DailyActivity.objects.filter(audio_file=relative_path).update(audio_file=blob.relative_path)
+                _move_jobs(path, blob.path)
+                touch(AudioRecording.objects.filter(pk=recording.pk))
+                touch(DailyActivity.objects.filter(audio_file=blob.relative_path))
+        except _Gone:
+            continue
+        # Still there if the same audio was stored already
+        if os.path.exists(path):
+            os.remove(path)
+        adopted += 1
+    return adopted
+
+
+def retire_raw_file(path, relative_path, policy):
+    """Delete a WAV that has been re-encoded, or move it under ACTIVITY_AUDIO_ARCHIVE_DIR."""
+    try:
+        if policy == RAW_ARCHIVE:
+            destination = os.path.join(settings.ACTIVITY_AUDIO_ARCHIVE_DIR, relative_path)
+            os.makedirs(os.path.dirname(destination), exist_ok=True)
+            shutil.move(path, destination)
+            # The archive retention period counts from now, not from the recording
+            os.utime(destination)
+        else:
+            os.remove(path)
+    except FileNotFoundError:
+        logger.warning("Raw recording %s was already gone", path)
+
+
+def tier_blob(blob, extension, bitrate=None, raw_policy=RAW_DELETE):
+    """
+    Re-encode a WAV blob to `extension` ('flac' or 'opus'). Returns (bytes before,
+    bytes after), or None if the blob was deleted or tiered meanwhile.
+    """
+    old_path, old_relative_path = blob.path, blob.relative_path
+    new_relative_path = blob_relative_path(blob.digest, extension)
+    new_path = os.path.join(settings.MEDIA_ROOT, new_relative_path)
+    encoded_path = f'{new_path}.tmp'
+    with span('audio_encode'):
+        codec = encode_file(old_path, encoded_path, extension, bitrate)
+    try:
+        with transaction.atomic():
+            locked = AudioBlob.objects.select_for_update().filter(pk=blob.pk, extension='wav').first()
+            if locked is None or not os.path.exists(old_path):
+                return None
+            os.replace(encoded_path, new_path)
+            size = os.path.getsize(new_path)
+            AudioBlob.objects.filter(pk=blob.pk).update(extension=extension, codec=codec, size=size)
+            AudioRecording.objects.filter(blob=blob).update(codec=codec, size=size)
+            DailyActivity.objects.filter(audio_file=old_relative_path).update(audio_file=new_relative_path)
+            _move_jobs(old_path, new_path)
+            touch(AudioRecording.objects.filter(blob=blob))
+            touch(DailyActivity.objects.filter(audio_file=new_relative_path))
+            transaction.on_commit(lambda: retire_raw_file(old_path, old_relative_path, raw_policy))
+    finally:
+        if os.path.exists(encoded_path):
+            os.remove(encoded_path)
+    logger.info("Tiered blob %s to %s: %d -> %d bytes", blob.digest, extension, locked.size, size)
+    return locked.size, size
+
+
+def tier_recordings(older_than=None, extension=None, bitrate=None, raw_policy=None, limit=None, dry_run=False):
+    """
+    Re-encode every WAV recording whose newest upload is older than `older_than`
+    (a timedelta). Defaults come from the ACTIVITY_TIERING_* settings.
+    Returns a TieringResult; with `dry_run` it only counts what would be tiered.
+    """
+    if older_than is None:
+        older_than = timedelta(days=settings.ACTIVITY_TIERING_AGE_DAYS)
+    extension = extension or settings.ACTIVITY_TIERING_FORMAT
+    bitrate = bitrate or settings.ACTIVITY_TIERING_OPUS_BITRATE
+    raw_policy = raw_policy or settings.ACTIVITY_TIERING_RAW_RETENTION
+    cutoff = timezone.now() - older_than
+    result = TieringResult()
+
+    if dry_run:
+        result.adopted = AudioRecording.objects.filter(blob__isnull=True, created_at__lt=cutoff).count()
+    else:
+        result.adopted = adopt_legacy_recordings(cutoff, limit)
+
+    candidates = (AudioBlob.objects.filter(extension='wav')
+                  .annotate(newest=Max('recordings__created_at'))
+                  .filter(newest__lt=cutoff).order_by('newest'))
+    for blob in candidates[:limit].iterator() if limit else candidates.iterator():
+        if dry_run:
+            result.tiered += 1
+            result.bytes_before += blob.size
+            continue
+        try:
+            sizes = tier_blob(blob, extension, bitrate, raw_policy)
+        except (AudioConversionError, OSError):
+            logger.error("Could not tier blob %s", blob.digest, exc_info=True)
+            result.failed += 1
+            continue
+        if sizes is not None:
+            result.tiered += 1
+            result.bytes_before += sizes[0]
+            result.bytes_after += sizes[1]
+    return result
+
+
+def purge_archive(older_than=None):
+    """
+    Delete archived raw files older than `older_than` (default ACTIVITY_AUDIO_ARCHIVE_DAYS;
+    0 keeps them forever). Returns the number of files removed.
+    """
+    if older_than is None:
+        if not settings.ACTIVITY_AUDIO_ARCHIVE_DAYS:
+            return 0
+        older_than = timedelta(days=settings.ACTIVITY_AUDIO_ARCHIVE_DAYS)
+    cutoff = time.time() - older_than.total_seconds()
+    removed = 0
+    for directory, _, filenames in os.walk(settings.ACTIVITY_AUDIO_ARCHIVE_DIR):
+        for filename in filenames:
+            path = os.path.join(directory, filename)
+            if os.path.getmtime(path) < cutoff:
+                os.remove(path)
+                removed += 1
+    return removed
@@ -0,0 +1,158 @@
+"""
+Resumable chunked uploads.
+
+A client opens an UploadSession, PUTs numbered chunks (each with its byte offset and
+SHA-256), can ask which chunks already arrived after a dropped connection, and finally
+asks for the chunks to be assembled and stored like a regular record_activity_api upload.
+Each chunk is kept in its own file under ACTIVITY_UPLOAD_SESSION_DIR, so re-sending a
+chunk simply replaces it.
+"""
+import hashlib
+import logging
+import os
+import shutil
+import tempfile
+
+from django.conf import settings
+from django.utils import timezone
+
+from .models import UploadChunk, UploadSession
+from .recordings import save_recording
+from .utility.audio import CHUNK_SIZE
+
+logger = logging.getLogger('activity_logger')
+
+
+class UploadError(Exception):
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def session_dir(session):
+    return os.path.join(settings.ACTIVITY_UPLOAD_SESSION_DIR, str(session.pk))
+
+
+def _chunk_path(session, index):
+    return os.path.join(session_dir(session), f'{index}.part')
+
+
+def write_chunk(session, index, offset, expected_sha256, stream):
+    """
+    Stream one chunk from `stream` to disk, verifying its size and checksum.
+    Nothing is recorded unless the whole chunk arrived intact.
+    """
+    if session.status != UploadSession.STATUS_OPEN:
+        raise UploadError('Upload session is no longer accepting chunks', status=409)
+    if offset < 0:
+        raise UploadError('Chunk offset must not be negative')
+    if not expected_sha256:
+        raise UploadError('Chunk checksum (X-Chunk-SHA256) not provided')
+
+    directory = session_dir(session)
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            while True:
+                data = stream.read(CHUNK_SIZE)
+                if not data:
+                    break
+                size += len(data)
+                if size > settings.ACTIVITY_UPLOAD_MAX_CHUNK_SIZE:
+                    raise UploadError('Chunk exceeds the maximum chunk size', status=413)
+                digest.update(data)
+                f.write(data)
+
+        if size == 0:
+            raise UploadError('Empty chunk')
+        if session.total_size is not None and offset + size > session.total_size:
+            raise UploadError('Chunk extends past the declared total size')
+        if digest.hexdigest() != expected_sha256.lower():
+            raise UploadError('Chunk checksum mismatch')
+    except Exception:
+        os.remove(tmp_path)
+        raise
+
+    os.replace(tmp_path, _chunk_path(session, index))
+    chunk, _ = UploadChunk.objects.update_or_create(
+        session=session, index=index,
+        defaults={'offset': offset, 'size': size, 'sha256': digest.hexdigest()},
+    )
+    session.save(update_fields=['updated_at'])
+    return chunk
+
+
+def finalize_upload(session, expected_sha256=None):
+    """
+    Check that the received chunks cover the file without gaps, concatenate them on
+    disk and hand the result to save_recording. Returns (activity, job).
+    """
+    # Claim the session so two concurrent finalize calls can't both assemble it
+    claimed = UploadSession.objects.filter(
+        pk=session.pk, status=UploadSession.STATUS_OPEN,
+    ).update(status=UploadSession.STATUS_FINALIZING, updated_at=timezone.now())
+    if not claimed:
+        raise UploadError('Upload session is not open', status=409)
+
+    try:
+        chunks = list(session.chunks.order_by('offset'))
+        if not chunks:
+            raise UploadError('No chunks have been uploaded')
+        position = 0
+        for chunk in chunks:
+            if chunk.offset != position:
+                raise UploadError(f'Missing or overlapping data at offset {position}', status=409)
+            position += chunk.size
+        if session.total_size is not None and position != session.total_size:
+            raise UploadError(f'Received {position} of {session.total_size} bytes', status=409)
+
+        assembled_path = os.path.join(session_dir(session), 'assembled')
+        digest = hashlib.sha256()
+        with open(assembled_path, 'wb') as out:
+            for chunk in chunks:
+                with open(_chunk_path(session, chunk.index), 'rb') as part:
+                    while True:
+                        data = part.read(CHUNK_SIZE)
+                        if not data:
+                            break
+                        digest.update(data)
+                        out.write(data)
+        if expected_sha256 and digest.hexdigest() != expected_sha256.lower():
+            os.remove(assembled_path)
+            raise UploadError('File checksum mismatch')
+
+        activity, job = save_recording(session.user, session.date.strftime('%Y-%m-%d'), assembled_path,
+                                       sha256=digest.hexdigest())
+    except Exception:
+        UploadSession.objects.filter(pk=session.pk).update(status=UploadSession.STATUS_OPEN)
+        raise
+
+    session.status = UploadSession.STATUS_COMPLETED
+    session.activity = activity
+    session.save(update_fields=['status', 'activity', 'updated_at'])
+    shutil.rmtree(session_dir(session), ignore_errors=True)
+    logger.info("Finalized upload %s (%s bytes) as activity %s", session.pk, position, activity.pk)
+    return activity, job
+
+
+def abort_upload(session):
+    shutil.rmtree(session_dir(session), ignore_errors=True)
+    session.delete()
+
+
+def cleanup_abandoned_uploads(older_than):
+    """
+    Delete sessions (and their chunk files) that haven't been touched for `older_than`.
+    Returns the number of sessions removed.
+    """
+    cutoff = timezone.now() - older_than
+    stale = UploadSession.objects.filter(updated_at__lt=cutoff)
+    count = 0
+    for session in stale.iterator():
+        shutil.rmtree(session_dir(session), ignore_errors=True)
+        count += 1
+    stale.delete()
+    return count
@@ -1,6 +1,14 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import ActivityViewSet, record_activity_api,get_audio_files_for_date,delete_audio_file,signup, user_profile
+from .views import ActivityViewSet, record_activity_api,get_audio_files_for_date,delete_audio_file,signup, user_profile, job_status
+from .views import delete_audio_files, recording_peaks
+from .views import AudioRecordingListView, AudioStreamView
+from .views import search_activities_view
+from .views import spending_stats, sync_changes
+from .views import metrics
+from .views import (delete_audio_file_async, get_audio_files_for_date_async, record_activity_async,
+                    summarize_activity_async)
+from .views import upload_init, upload_detail, upload_chunk, upload_finalize
 from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView,TokenVerifyView 
 from django.contrib.auth.views import LoginView
 from .views import ProtectedView
@@ -17,7 +25,25 @@ urlpatterns = [
     path('api/login/', LoginView.as_view(), name='login'),
     path('api/profile/', user_profile, name='user_profile'),
     path('api/record/',record_activity_api, name='record_activity_api'),
+    path('api/audio/', AudioRecordingListView.as_view(), name='audio_recording_list'),
+    path('api/audio/<int:recording_id>/stream/', AudioStreamView.as_view(), name='audio_stream'),
+    path('api/audio/<int:recording_id>/peaks/', recording_peaks, name='audio_peaks'),
     path('api/audio/date/<str:date>/',get_audio_files_for_date, name='get_audio_files_for_date'),
     path('api/audio/delete/',delete_audio_file, name='delete_audio_file'),
+    path('api/audio/delete/batch/', delete_audio_files, name='delete_audio_files'),
+    path('api/uploads/', upload_init, name='upload_init'),
+    path('api/uploads/<uuid:upload_id>/', upload_detail, name='upload_detail'),
+    path('api/uploads/<uuid:upload_id>/chunks/<int:index>/', upload_chunk, name='upload_chunk'),
+    path('api/uploads/<uuid:upload_id>/finalize/', upload_finalize, name='upload_finalize'),
+    path('api/search/', search_activities_view, name='search_activities'),
+    path('api/stats/', spending_stats, name='spending_stats'),
+    path('api/sync/', sync_changes, name='sync_changes'),
+    path('api/jobs/<int:job_id>/', job_status, name='job_status'),
+    path('api/metrics/', metrics, name='metrics'),
+    path('api/async/record/', record_activity_async, name='record_activity_async'),
+    path('api/async/audio/date/<str:date>/', get_audio_files_for_date_async, name='get_audio_files_for_date_async'),
+    path('api/async/audio/delete/', delete_audio_file_async, name='delete_audio_file_async'),
+    path('api/async/activities/<int:activity_id>/summarize/', summarize_activity_async,
+         name='summarize_activity_async'),
     path('api/protected/', ProtectedView.as_view(), name='protected'),
 ]
@@ -0,0 +1,157 @@
+"""
+Streaming audio ingest helpers.
+
+Audio is never decoded into memory here: WAV files are moved/copied as they are,
+anything else is piped through ffmpeg straight into the destination file.
+"""
+import os
+import subprocess
+import tempfile
+import wave
+
+from django.core.files.move import file_move_safe
+from .metrics import span
+
+CHUNK_SIZE = 64 * 1024
+
+
+class AudioConversionError(Exception):
+    pass
+
+
+def is_wav(source):
+    """
+    True if `source` (a path or a seekable file object) is already a PCM WAV that
+    the speech recognizer can read, i.e. it can be stored without transcoding.
+    """
+    try:
+        with wave.open(source, 'rb') as wav:
+            return wav.getnchannels() > 0
+    except (wave.Error, EOFError):
+        return False
+    finally:
+        if hasattr(source, 'seek'):
+            source.seek(0)
+
+
+def probe_wav(path):
+    """
+    Return (duration in seconds, codec name) for a PCM WAV file, reading only its header.
+    """
+    with wave.open(path, 'rb') as wav:
+        sample_width = wav.getsampwidth()
+        duration = wav.getnframes() / float(wav.getframerate())
+    # 8-bit PCM WAV is unsigned, wider samples are signed little-endian
+    codec = 'pcm_u8' if sample_width == 1 else f'pcm_s{sample_width * 8}le'
+    return duration, codec
+
+
+def ffmpeg_binary():
+    # AudioSegment.converter honours the ffmpeg/avconv binary pydub was configured with.
+    # pydub is imported on first use only, since it searches PATH for ffmpeg at import
+    from pydub import AudioSegment
+    return AudioSegment.converter
+
+
+# Compressed formats recordings can be tiered to: extension -> (codec name, ffmpeg output options)
+ENCODINGS = {
+    'flac': ('flac', ['-c:a', 'flac', '-f', 'flac']),
+    'opus': ('opus', ['-c:a', 'libopus', '-f', 'ogg']),
+}
+
+
+def _ffmpeg_command(input_name, dest_path, output_options=('-f', 'wav')):
+    return [
+        ffmpeg_binary(), '-nostdin', '-hide_banner', '-loglevel', 'error', '-y',
+        '-i', input_name, '-vn', *output_options, dest_path,
+    ]
+
+
+def _check_ffmpeg(returncode, stderr, dest_path):
+    if returncode != 0:
+        stderr.seek(0)
+        message = stderr.read().decode(errors='replace').strip()
+        if os.path.exists(dest_path):
+            os.remove(dest_path)
+        raise AudioConversionError(message or f"ffmpeg exited with status {returncode}")
+
+
+def transcode_to_wav(source, dest_path):
+    """
+    Convert `source` (a path, or a Django UploadedFile) to WAV at `dest_path`.
+    ffmpeg reads and writes in small buffers, so memory use does not depend on
+    the length of the recording.
+    """
+    with tempfile.TemporaryFile() as stderr:
+        try:
+            if isinstance(source, (str, os.PathLike)):
+                process = subprocess.run(_ffmpeg_command(source, dest_path), stderr=stderr)
+                returncode = process.returncode
+            else:
+                process = subprocess.Popen(_ffmpeg_command('pipe:0', dest_path),
+                                           stdin=subprocess.PIPE, stderr=stderr)
+                try:
+                    for chunk in source.chunks(CHUNK_SIZE):
+                        process.stdin.write(chunk)
+                except BrokenPipeError:
+                    pass  # ffmpeg gave up early; the error is reported below
+                finally:
+                    process.stdin.close()
+                returncode = process.wait()
+        except OSError as e:
+            raise AudioConversionError(f"Could not run {ffmpeg_binary()}: {e}") from e
+        _check_ffmpeg(returncode, stderr, dest_path)
+
+
+def encode_file(source_path, dest_path, extension, bitrate=None):
+    """
+    Re-encode the audio file at `source_path` into one of the ENCODINGS at
+    `dest_path`; `bitrate` (e.g. '32k') only applies to lossy codecs.
+    Returns the codec name.
+    """
+    codec, options = ENCODINGS[extension]
+    if bitrate and codec != 'flac':
+        options = [*options, '-b:a', bitrate]
+    with tempfile.TemporaryFile() as stderr:
+        try:
+            returncode = subprocess.run(_ffmpeg_command(source_path, dest_path, options), stderr=stderr).returncode
+        except OSError as e:
+            raise AudioConversionError(f"Could not run {ffmpeg_binary()}: {e}") from e
+        _check_ffmpeg(returncode, stderr, dest_path)
+    return codec
+
+
+def store_as_wav(source, dest_path):
+    """
+    Store audio at `dest_path` in WAV format without holding it in memory.
+
+    `source` is a path on disk or a Django UploadedFile. Files on disk (including
+    uploads spooled by TemporaryFileUploadHandler) are moved into place when they
+    are already WAV, or transcoded directly from disk otherwise. Small in-memory
+    uploads are copied or piped through ffmpeg chunk by chunk.
+    Returns True if the audio had to be transcoded.
+    """
+    if isinstance(source, (str, os.PathLike)):
+        source_path = source
+    elif hasattr(source, 'temporary_file_path'):
+        source_path = source.temporary_file_path()
+    else:
+        source_path = None
+
+    if source_path is not None:
+        if is_wav(source_path):
+            with span('audio_move'):
+                file_move_safe(source_path, dest_path, allow_overwrite=True)
+            return False
+        with span('audio_transcode'):
+            transcode_to_wav(source_path, dest_path)
+        return True
+
+    if is_wav(source):
+        with span('audio_write'), open(dest_path, 'wb') as f:
+            for chunk in source.chunks(CHUNK_SIZE):
+                f.write(chunk)
+        return False
+    with span('audio_transcode'):
+        transcode_to_wav(source, dest_path)
+    return True
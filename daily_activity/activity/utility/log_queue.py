@@ -0,0 +1,107 @@
+"""
+Non-blocking file logging.
+
+QueuedRotatingFileHandler puts records on a bounded in-memory queue, and a
+QueueListener thread writes them to a size-rotated log file, so a slow log volume
+never stalls the thread that logged. When the queue is full, records are dropped
+(and counted) rather than blocking the request. SamplingFilter keeps a configurable
+fraction of high-volume INFO records; warnings and errors are always kept.
+
+Rotation is per process: with several worker processes, point each at its own file
+or rotate with an external tool instead.
+"""
+import copy
+import json
+import logging
+import os
+import queue
+import random
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+
+from .metrics import registry
+
+dropped_records = registry.counter(
+    'activity_log_records_dropped_total', 'Log records dropped because the log queue was full.',
+)
+
+# Attributes every LogRecord has; anything else was passed with extra={...}
+_RECORD_ATTRIBUTES = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime', 'sample'}
+
+
+class QueuedRotatingFileHandler(QueueHandler):
+    def __init__(self, filename, maxBytes=0, backupCount=0, encoding='utf-8', queue_size=10000):
+        os.makedirs(os.path.dirname(os.path.abspath(filename)), exist_ok=True)
+        self.target = RotatingFileHandler(filename, maxBytes=maxBytes, backupCount=backupCount, encoding=encoding)
+        super().__init__(queue.Queue(maxsize=queue_size))
+        self.listener = QueueListener(self.queue, self.target, respect_handler_level=True)
+        self.listener.start()
+        self._stopped = False
+
+    def setFormatter(self, fmt):
+        # Formatting (timestamps, JSON) happens on the writer thread
+        self.target.setFormatter(fmt)
+
+    def setLevel(self, level):
+        super().setLevel(level)
+        self.target.setLevel(level)
+
+    def prepare(self, record):
+        """
+        Resolve the message and traceback now, while the arguments and frames are
+        still what they were when logged, but leave the rest to the target formatter.
+        """
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = (self.target.formatter or logging.Formatter()).formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            dropped_records.inc()
+
+    def close(self):
+        # Called by logging.shutdown() at exit: write out what is still queued first
+        if not self._stopped:
+            self._stopped = True
+            self.listener.stop()
+            self.target.close()
+        super().close()
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Keep `rate` (0-1) of the records at or below `level`. A record logged with
+    extra={'sample': False} is always kept.
+    """
+    def __init__(self, rate=1.0, level='INFO'):
+        super().__init__()
+        self.rate = float(rate)
+        self.level = logging.getLevelName(level) if isinstance(level, str) else level
+
+    def filter(self, record):
+        if self.rate >= 1 or record.levelno > self.level or not getattr(record, 'sample', True):
+            return True
+        return random.random() < self.rate
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line, including any fields passed with extra={...}."""
+    def format(self, record):
+        entry = {
+            'time': self.formatTime(record),
+            'level': record.levelname,
+            'logger': record.name,
+            'thread': record.threadName,
+            'message': record.getMessage(),
+        }
+        entry.update({key: value for key, value in vars(record).items() if key not in _RECORD_ATTRIBUTES})
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry['exception'] = record.exc_text
+        return json.dumps(entry, default=str)
@@ -0,0 +1,166 @@
+"""
+In-process latency histograms and counters, rendered in the Prometheus text format.
+
+`span('stage')` times a block of code into the activity_stage_seconds histogram and,
+while a request is being timed (see activity/middleware.py), adds it to that request's
+breakdown. Recording a value is a perf_counter call, a bisect and a locked increment,
+so spans are cheap enough for the hot path. Each process keeps its own numbers; with
+several workers, Prometheus scrapes and sums them per instance.
+"""
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+# Seconds; covers fast DB writes up to long recognizer and OpenAI calls
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+# Per-request list of (stage, seconds), or None outside a timed request
+_breakdown = ContextVar('activity_timing_breakdown', default=None)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _labels(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in list(zip(names, values)) + list(extra)]
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    type = 'counter'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, *labelvalues, amount=1):
+        with self._lock:
+            self._values[labelvalues] = self._values.get(labelvalues, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            values = dict(self._values)
+        for labelvalues, value in sorted(values.items()):
+            yield self.name, _labels(self.labelnames, labelvalues), value
+
+
+class Histogram:
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}  # labelvalues -> [per-bucket counts (last is +Inf), sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value, *labelvalues):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labelvalues)
+            if series is None:
+                series = self._series[labelvalues] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def samples(self):
+        with self._lock:
+            series = {labels: (list(counts), total) for labels, (counts, total) in self._series.items()}
+        for labelvalues, (counts, total) in sorted(series.items()):
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), counts):
+                cumulative += count
+                le = bound if bound == '+Inf' else _number(float(bound))
+                yield f'{self.name}_bucket', _labels(self.labelnames, labelvalues, [('le', le)]), cumulative
+            yield f'{self.name}_sum', _labels(self.labelnames, labelvalues), total
+            yield f'{self.name}_count', _labels(self.labelnames, labelvalues), cumulative
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+        self._collectors = []
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name, documentation, labelnames=()):
+        return self.register(Counter(name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+
+    def add_collector(self, collector):
+        """
+        `collector()` is called on every scrape and returns (name, type, documentation,
+        value) tuples, for values that already live elsewhere (e.g. cache statistics).
+        """
+        with self._lock:
+            self._collectors.append(collector)
+
+    def render(self):
+        lines = []
+        with self._lock:
+            metrics = list(self._metrics.values())
+            collectors = list(self._collectors)
+        for metric in metrics:
+            lines.append(f'# HELP {metric.name} {metric.documentation}')
+            lines.append(f'# TYPE {metric.name} {metric.type}')
+            lines.extend(f'{name}{labels} {_number(value)}' for name, labels, value in metric.samples())
+        for collector in collectors:
+            for name, metric_type, documentation, value in collector():
+                lines.append(f'# HELP {name} {documentation}')
+                lines.append(f'# TYPE {name} {metric_type}')
+                lines.append(f'{name} {_number(value)}')
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
+
+stage_seconds = registry.histogram(
+    'activity_stage_seconds', 'Time spent in each processing stage.', ['stage'],
+)
+stage_errors = registry.counter(
+    'activity_stage_errors_total', 'Processing stages that raised an exception.', ['stage'],
+)
+
+
+@contextmanager
+def span(stage):
+    """Time the enclosed block as `stage`."""
+    start = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        stage_errors.inc(stage)
+        raise
+    finally:
+        elapsed = time.perf_counter() - start
+        stage_seconds.observe(elapsed, stage)
+        breakdown = _breakdown.get()
+        if breakdown is not None:
+            breakdown.append((stage, elapsed))
+
+
+def start_breakdown():
+    """Collect the spans of the current request (or task); returns a token for end_breakdown."""
+    return _breakdown.set([])
+
+
+def end_breakdown(token):
+    breakdown = _breakdown.get()
+    _breakdown.reset(token)
+    return breakdown or []
@@ -0,0 +1,197 @@
+"""
+Content-addressed cache in front of the summarization API.
+
+Summaries are keyed on a hash of (model, prompt, text), so re-processing an identical
+transcript never calls OpenAI twice. A bounded in-process LRU sits in front of the
+SummaryCacheEntry table, which expires entries after ACTIVITY_SUMMARY_CACHE_TTL_DAYS and
+evicts the least recently used ones once their total size exceeds
+ACTIVITY_SUMMARY_CACHE_MAX_BYTES. Only successful results are ever stored.
+
+Eviction reads the size of the whole table, so stores only run it when it is due,
+at most once per ACTIVITY_SUMMARY_CACHE_EVICT_INTERVAL seconds per process; in
+between the table may go over its budget by what was stored meanwhile.
+"""
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db.models import Sum
+from django.utils import timezone
+
+from ..models import SummaryCacheEntry
+from .metrics import registry
+
+
+def cache_key(model, prompt, text):
+    digest = hashlib.sha256()
+    for part in (model, prompt, text):
+        encoded = part.encode('utf-8')
+        # Length-prefix each part so ('ab', 'c') and ('a', 'bc') can't collide
+        digest.update(len(encoded).to_bytes(8, 'big'))
+        digest.update(encoded)
+    return digest.hexdigest()
+
+
+class SummaryCache:
+    def __init__(self, memory_entries=None):
+        self._memory_entries = memory_entries
+        self._memory = OrderedDict()  # key -> (summary, expires_at)
+        self._lock = threading.Lock()
+        self._counters = {'memory_hits': 0, 'persistent_hits': 0, 'misses': 0, 'stores': 0, 'evictions': 0}
+        self._next_eviction = 0.0  # time.monotonic() from which the next store runs evict()
+
+    @property
+    def memory_entries(self):
+        if self._memory_entries is None:
+            return settings.ACTIVITY_SUMMARY_CACHE_MEMORY_ENTRIES
+        return self._memory_entries
+
+    @property
+    def ttl(self):
+        return timedelta(days=settings.ACTIVITY_SUMMARY_CACHE_TTL_DAYS)
+
+    def _count(self, name, amount=1):
+        with self._lock:
+            self._counters[name] += amount
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._counters)
+            stats['memory_size'] = len(self._memory)
+        lookups = stats['memory_hits'] + stats['persistent_hits'] + stats['misses']
+        stats['hit_ratio'] = (stats['memory_hits'] + stats['persistent_hits']) / lookups if lookups else 0.0
+        return stats
+
+    def _remember(self, key, summary, expires_at):
+        with self._lock:
+            self._memory[key] = (summary, expires_at)
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_entries:
+                self._memory.popitem(last=False)
+
+    def get(self, key):
+        now = timezone.now()
+        with self._lock:
+            cached = self._memory.get(key)
+            if cached is not None:
+                if cached[1] > now:
+                    self._memory.move_to_end(key)
+                    self._counters['memory_hits'] += 1
+                    return cached[0]
+                del self._memory[key]
+
+        entry = SummaryCacheEntry.objects.filter(key=key).first()
+        if entry is not None:
+            if entry.created_at + self.ttl > now:
+                SummaryCacheEntry.objects.filter(key=key).update(last_used_at=now)
+                self._remember(key, entry.summary, entry.created_at + self.ttl)
+                self._count('persistent_hits')
+                return entry.summary
+            entry.delete()
+
+        self._count('misses')
+        return None
+
+    def set(self, key, model, summary):
+        now = timezone.now()
+        SummaryCacheEntry.objects.update_or_create(
+            key=key,
+            defaults={
+                'model': model,
+                'summary': summary,
+                'size': len(summary.encode('utf-8')),
+                'created_at': now,
+                'last_used_at': now,
+            },
+        )
+        self._remember(key, summary, now + self.ttl)
+        self._count('stores')
+        if self._eviction_due():
+            self.evict()
+
+    def _eviction_due(self):
+        now = time.monotonic()
+        with self._lock:
+            if now < self._next_eviction:
+                return False
+            self._next_eviction = now + settings.ACTIVITY_SUMMARY_CACHE_EVICT_INTERVAL
+            return True
+
+    def evict(self):
+        """Drop expired entries, then least recently used ones until under the size budget."""
+        evicted, _ = SummaryCacheEntry.objects.filter(created_at__lte=timezone.now() - self.ttl).delete()
+        total = SummaryCacheEntry.objects.aggregate(total=Sum('size'))['total'] or 0
+        excess = total - settings.ACTIVITY_SUMMARY_CACHE_MAX_BYTES
+        if excess > 0:
+            doomed = []
+            for key, size in SummaryCacheEntry.objects.order_by('last_used_at').values_list('key', 'size').iterator():
+                if excess <= 0:
+                    break
+                doomed.append(key)
+                excess -= size
+            evicted += SummaryCacheEntry.objects.filter(key__in=doomed).delete()[0]
+            with self._lock:
+                for key in doomed:
+                    self._memory.pop(key, None)
+        if evicted:
+            self._count('evictions', evicted)
+
+    def get_or_compute(self, model, prompt, text, compute):
+        """
+        Return the cached summary for (model, prompt, text), calling `compute()` on a
+        miss. Exceptions from `compute` propagate and nothing is cached.
+        """
+        key = cache_key(model, prompt, text)
+        summary = self.get(key)
+        if summary is None:
+            summary = compute()
+            if summary:
+                self.set(key, model, summary)
+        return summary
+
+    async def aget_or_compute(self, model, prompt, text, compute):
+        """get_or_compute for coroutines: `compute` is awaited, the cache tiers are read in a thread."""
+        key = cache_key(model, prompt, text)
+        summary = await sync_to_async(self.get)(key)
+        if summary is None:
+            summary = await compute()
+            if summary:
+                await sync_to_async(self.set)(key, model, summary)
+        return summary
+
+    def delete(self, key):
+        SummaryCacheEntry.objects.filter(key=key).delete()
+        with self._lock:
+            self._memory.pop(key, None)
+
+    def clear(self):
+        SummaryCacheEntry.objects.all().delete()
+        with self._lock:
+            self._memory.clear()
+
+
+summary_cache = SummaryCache()
+
+
+def _collect_stats():
+    stats = summary_cache.stats()
+    return [
+        ('activity_summary_cache_memory_hits_total', 'counter', 'Summaries served from the in-process LRU.',
+         stats['memory_hits']),
+        ('activity_summary_cache_persistent_hits_total', 'counter', 'Summaries served from the database tier.',
+         stats['persistent_hits']),
+        ('activity_summary_cache_misses_total', 'counter', 'Summaries that had to be requested from OpenAI.',
+         stats['misses']),
+        ('activity_summary_cache_stores_total', 'counter', 'Summaries written to the cache.', stats['stores']),
+        ('activity_summary_cache_evictions_total', 'counter', 'Database cache entries evicted.', stats['evictions']),
+        ('activity_summary_cache_memory_entries', 'gauge', 'Entries in the in-process LRU.', stats['memory_size']),
+        ('activity_summary_cache_hit_ratio', 'gauge', 'Share of lookups answered from either tier.',
+         stats['hit_ratio']),
+    ]
+
+
+registry.add_collector(_collect_stats)
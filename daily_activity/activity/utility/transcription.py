@@ -0,0 +1,195 @@
+"""
+Segmented speech recognition for long recordings.
+
+A WAV file is cut into segments (at the quietest point near each window boundary, or
+at fixed windows with a small overlap), the segments are recognized concurrently on a
+bounded thread pool, and the results are stitched back together in order with their
+timestamps. Only the segments currently being recognized are held in memory.
+
+The recognizer is pluggable: ACTIVITY_TRANSCRIPTION_BACKEND names a class whose
+`recognize(audio_data)` takes a speech_recognition.AudioData and returns text, raising
+sr.UnknownValueError when there is no intelligible speech.
+"""
+import os
+import tempfile
+import threading
+import wave
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+
+import speech_recognition as sr
+from django.conf import settings
+from django.utils.module_loading import import_string
+from pydub import AudioSegment
+
+from .audio import is_wav, transcode_to_wav
+from .metrics import span
+
+ANALYSIS_WINDOW = 0.1  # Seconds per loudness measurement when looking for silence
+MAX_STITCH_WORDS = 10  # Longest repeated run of words removed where overlapping segments meet
+# 8-bit WAV samples are unsigned; AudioData expects signed samples like sr.AudioFile produces
+_UNSIGNED_TO_SIGNED = bytes((i + 128) & 0xFF for i in range(256))
+
+
+class GoogleRecognizerBackend:
+    def __init__(self):
+        self.recognizer = sr.Recognizer()
+
+    def recognize(self, audio_data):
+        return self.recognizer.recognize_google(audio_data)
+
+
+@dataclass
+class Segment:
+    start: float  # Seconds
+    end: float
+    text: str = ''
+
+
+@dataclass
+class Transcription:
+    text: str
+    segments: list = field(default_factory=list)
+
+    def segments_as_dicts(self):
+        return [{'start': round(s.start, 3), 'end': round(s.end, 3), 'text': s.text} for s in self.segments]
+
+
+_backend = None
+_pool = None
+_lock = threading.Lock()
+
+
+def get_backend():
+    global _backend
+    with _lock:
+        if _backend is None:
+            _backend = import_string(settings.ACTIVITY_TRANSCRIPTION_BACKEND)()
+        return _backend
+
+
+def _get_pool():
+    # Shared by all jobs, so the number of concurrent recognizer calls stays bounded per process
+    global _pool
+    with _lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(max_workers=settings.ACTIVITY_TRANSCRIPTION_WORKERS,
+                                       thread_name_prefix='transcribe')
+        return _pool
+
+
+def _quietest_frame(wav, start_frame, end_frame):
+    """Frame index of the quietest ANALYSIS_WINDOW slice between start_frame and end_frame."""
+    rate = wav.getframerate()
+    step = max(int(rate * ANALYSIS_WINDOW), 1)
+    wav.setpos(start_frame)
+    data = wav.readframes(end_frame - start_frame)
+    bytes_per_frame = wav.getsampwidth() * wav.getnchannels()
+    best_frame, best_rms = end_frame, None
+    for offset in range(0, end_frame - start_frame - step + 1, step):
+        chunk = data[offset * bytes_per_frame:(offset + step) * bytes_per_frame]
+        rms = AudioSegment(data=chunk, sample_width=wav.getsampwidth(), frame_rate=rate,
+                           channels=wav.getnchannels()).rms
+        if best_rms is None or rms < best_rms:
+            best_frame, best_rms = start_frame + offset + step // 2, rms
+    return best_frame
+
+
+def plan_segments(wav, window, overlap=0.0, split_on_silence=True):
+    """
+    Return (start_frame, end_frame) pairs covering the whole file. With
+    split_on_silence, each cut is moved back to the quietest point in the last
+    third of its window (up to 5 seconds) and segments don't overlap.
+    """
+    rate = wav.getframerate()
+    total = wav.getnframes()
+    window_frames = max(int(window * rate), 1)
+    if total <= window_frames:
+        return [(0, total)]
+
+    segments = []
+    start = 0
+    if split_on_silence:
+        search_frames = int(min(window / 3, 5.0) * rate)
+        while total - start > window_frames:
+            target = start + window_frames
+            cut = _quietest_frame(wav, target - search_frames, target) if search_frames else target
+            segments.append((start, cut))
+            start = cut
+        segments.append((start, total))
+    else:
+        step = max(window_frames - int(overlap * rate), 1)
+        while True:
+            end = min(start + window_frames, total)
+            segments.append((start, end))
+            if end >= total:
+                break
+            start += step
+    return segments
+
+
+def _recognize_segment(audio_path, start_frame, end_frame, backend):
+    with wave.open(audio_path, 'rb') as wav:
+        wav.setpos(start_frame)
+        frames = wav.readframes(end_frame - start_frame)
+        if wav.getsampwidth() == 1:
+            frames = frames.translate(_UNSIGNED_TO_SIGNED)
+        audio = sr.AudioData(frames, wav.getframerate(), wav.getsampwidth())
+    try:
+        with span('recognize_segment'):
+            return backend.recognize(audio)
+    except sr.UnknownValueError:
+        return ''  # Silence or noise in this segment only
+
+
+def _stitch(previous, current):
+    """Drop words at the start of `current` that repeat the end of `previous` (segment overlap)."""
+    prev_words, words = previous.split(), current.split()
+    for size in range(min(MAX_STITCH_WORDS, len(prev_words), len(words)), 0, -1):
+        if [w.lower() for w in prev_words[-size:]] == [w.lower() for w in words[:size]]:
+            return ' '.join(words[size:])
+    return current
+
+
+def transcribe_file(audio_path, backend=None, window=None, overlap=None, split_on_silence=None):
+    """
+    Transcribe a WAV file, in parallel segments if it is longer than `window` seconds.
+    Raises sr.UnknownValueError if no segment contains intelligible speech and
+    sr.RequestError if the recognizer service fails.
+    """
+    if not is_wav(audio_path):
+        # Recordings moved to a compressed storage tier are decoded to a temporary WAV first
+        with tempfile.TemporaryDirectory() as directory:
+            wav_path = os.path.join(directory, 'audio.wav')
+            with span('audio_decode'):
+                transcode_to_wav(audio_path, wav_path)
+            return transcribe_file(wav_path, backend, window, overlap, split_on_silence)
+
+    backend = backend or get_backend()
+    window = window or settings.ACTIVITY_TRANSCRIPTION_SEGMENT_SECONDS
+    overlap = settings.ACTIVITY_TRANSCRIPTION_OVERLAP_SECONDS if overlap is None else overlap
+    if split_on_silence is None:
+        split_on_silence = settings.ACTIVITY_TRANSCRIPTION_SPLIT_ON_SILENCE
+
+    with wave.open(audio_path, 'rb') as wav:
+        rate = wav.getframerate()
+        plan = plan_segments(wav, window, overlap, split_on_silence)
+
+    if len(plan) == 1:
+        texts = [_recognize_segment(audio_path, plan[0][0], plan[0][1], backend)]
+    else:
+        futures = [_get_pool().submit(_recognize_segment, audio_path, start, end, backend) for start, end in plan]
+        texts = [future.result() for future in futures]
+
+    segments = []
+    stitched = ''
+    for (start, end), text in zip(plan, texts):
+        if stitched and text and not split_on_silence:
+            text = _stitch(stitched, text)
+        segments.append(Segment(start=start / rate, end=end / rate, text=text))
+        if text:
+            stitched = f'{stitched} {text}' if stitched else text
+
+    if not stitched:
+        raise sr.UnknownValueError()
+    return Transcription(text=stitched, segments=segments)
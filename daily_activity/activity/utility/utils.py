@@ -1,36 +1,108 @@
-import speech_recognition as sr
-from openai import OpenAI
 import os
-from dotenv import load_dotenv
+import threading
 
-# Load environment variables
-load_dotenv()
+from .metrics import span
+from .summary_cache import summary_cache
 
-# Initialize the recognizer
-recognizer = sr.Recognizer()
+# The openai, speech_recognition and pydub packages take most of a second to import,
+# so they are only loaded (and the clients created) the first time they are needed;
+# `manage.py migrate` and fresh workers that never summarize don't pay for them.
+_client = None
+_async_client = None
+_lock = threading.Lock()
+_env_loaded = False
 
-# Initialize the OpenAI client
-client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+def _load_env():
+    # Load environment variables (OPENAI_API_KEY) from .env, once per process
+    global _env_loaded
+    if not _env_loaded:
+        from dotenv import load_dotenv
+        load_dotenv()
+        _env_loaded = True
+
+def get_client():
+    # The OpenAI client, created on first use and shared by all threads
+    global _client
+    if _client is None:
+        with _lock:
+            if _client is None:
+                _load_env()
+                from openai import OpenAI
+                _client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+    return _client
+
+def get_async_client():
+    # Used by the async views, so waiting on OpenAI doesn't hold a thread
+    global _async_client
+    if _async_client is None:
+        with _lock:
+            if _async_client is None:
+                _load_env()
+                from openai import AsyncOpenAI
+                _async_client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+    return _async_client
+
+def recognize_speech(audio_path):
+    # Same as transcribe_audio, but lets recognizer errors propagate so callers
+    # (e.g. the background job runner) can decide whether to retry.
+    # Long recordings are recognized in parallel segments, see transcription.py
+    from .transcription import transcribe_file
+    with span('transcribe'):
+        return transcribe_file(audio_path).text
 
 def transcribe_audio(audio_path):
-    with sr.AudioFile(audio_path) as source:
-        audio = recognizer.record(source)
+    import speech_recognition as sr
     try:
-        return recognizer.recognize_google(audio)
+        return recognize_speech(audio_path)
     except sr.UnknownValueError:
         return "Speech recognition could not understand the audio"
     except sr.RequestError as e:
         return f"Could not request results from the speech recognition service; {e}"
 
-def summarize_text(text):
-    try:
-        response = client.chat.completions.create(
-            model="gpt-3.5-turbo",
-            messages=[
-                {"role": "system", "content": "You are a helpful assistant."},
-                {"role": "user", "content": f"Please summarize the following text:\n{text}"}
-            ]
+SUMMARY_MODEL = "gpt-3.5-turbo"
+SUMMARY_SYSTEM_PROMPT = "You are a helpful assistant."
+SUMMARY_PROMPT = "Please summarize the following text:\n{text}"
+
+def _summary_messages(text):
+    return [
+        {"role": "system", "content": SUMMARY_SYSTEM_PROMPT},
+        {"role": "user", "content": SUMMARY_PROMPT.format(text=text)}
+    ]
+
+def request_summary(text, openai_client=None):
+    # Same as summarize_text, but raises on API errors instead of returning an error string.
+    # Identical (model, prompt, text) requests are answered from the summary cache;
+    # `openai_client` lets callers substitute a stand-in for the OpenAI client
+    def compute():
+        with span('openai_summary'):
+            response = (openai_client or get_client()).chat.completions.create(
+                model=SUMMARY_MODEL,
+                messages=_summary_messages(text)
+            )
+        return response.choices[0].message.content
+
+    with span('summarize'):
+        return summary_cache.get_or_compute(
+            SUMMARY_MODEL, SUMMARY_SYSTEM_PROMPT + "\n" + SUMMARY_PROMPT, text, compute,
         )
+
+async def arequest_summary(text, openai_client=None):
+    # Async request_summary, sharing its cache entries
+    async def compute():
+        with span('openai_summary'):
+            response = await (openai_client or get_async_client()).chat.completions.create(
+                model=SUMMARY_MODEL,
+                messages=_summary_messages(text)
+            )
         return response.choices[0].message.content
+
+    with span('summarize'):
+        return await summary_cache.aget_or_compute(
+            SUMMARY_MODEL, SUMMARY_SYSTEM_PROMPT + "\n" + SUMMARY_PROMPT, text, compute,
+        )
+
+def summarize_text(text, openai_client=None):
+    try:
+        return request_summary(text, openai_client=openai_client)
     except Exception as e:
         return f"An error occurred during summarization: {str(e)}"
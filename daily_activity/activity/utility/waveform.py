@@ -0,0 +1,66 @@
+"""
+Waveform summaries of WAV recordings, for drawing and sizing them without the audio.
+
+wav_peaks() reads the samples in blocks of whole buckets and reduces each block with
+NumPy (absolute value, max over channels, max per bucket), so memory use does not
+depend on the length of the recording. The result is PEAK_BUCKETS peak amplitudes
+between 0 and 1; downsample_peaks() derives any coarser resolution from them.
+"""
+import math
+import wave
+
+import numpy as np
+
+PEAK_BUCKETS = 1024  # Stored resolution
+BLOCK_SAMPLES = 1024 * 1024  # Samples decoded per read, across all channels
+
+
+def _samples(data, sample_width):
+    """Decode little-endian PCM bytes into a signed integer array."""
+    if sample_width == 1:
+        # 8-bit WAV is unsigned
+        return np.frombuffer(data, dtype=np.uint8).astype(np.int16) - 128
+    if sample_width == 3:
+        raw = np.frombuffer(data, dtype=np.uint8).reshape(-1, 3).astype(np.int32)
+        values = raw[:, 0] | (raw[:, 1] << 8) | (raw[:, 2] << 16)
+        return np.where(values & 0x800000, values - 0x1000000, values)
+    return np.frombuffer(data, dtype=f'<i{sample_width}')
+
+
+def wav_peaks(path, buckets=PEAK_BUCKETS):
+    """
+    Return (peaks, sample rate, channels, duration in seconds) for a PCM WAV file.
+    `peaks` has up to `buckets` entries (fewer when the length doesn't divide evenly,
+    noticeably so for very short files), each the largest absolute amplitude in that
+    slice of the recording relative to full scale.
+    """
+    with wave.open(path, 'rb') as wav:
+        channels, sample_width, rate = wav.getnchannels(), wav.getsampwidth(), wav.getframerate()
+        total_frames = wav.getnframes()
+        bucket_frames = max(1, math.ceil(total_frames / buckets))
+        block_frames = bucket_frames * max(1, BLOCK_SAMPLES // (bucket_frames * channels))
+        full_scale = float(2 ** (8 * sample_width - 1))
+
+        peaks = []
+        while True:
+            data = wav.readframes(block_frames)
+            if not data:
+                break
+            # Widened first: abs() of the most negative value overflows the sample's own type
+            samples = _samples(data, sample_width).astype(np.int32 if sample_width < 4 else np.int64)
+            frames = np.abs(samples.reshape(-1, channels)).max(axis=1)
+            if len(frames) % bucket_frames:
+                # Pad the last, partial bucket with silence so every bucket has the same width
+                frames = np.pad(frames, (0, -len(frames) % bucket_frames))
+            peaks.append(frames.reshape(-1, bucket_frames).max(axis=1))
+
+    values = np.concatenate(peaks) / full_scale if peaks else np.zeros(0)
+    return np.round(np.minimum(values, 1.0), 3).tolist(), rate, channels, total_frames / float(rate)
+
+
+def downsample_peaks(peaks, resolution):
+    """Reduce `peaks` to `resolution` buckets (or fewer, if there are fewer peaks) by taking maxima."""
+    if not peaks or resolution >= len(peaks):
+        return list(peaks or [])
+    starts = np.arange(resolution) * len(peaks) // resolution
+    return np.maximum.reduceat(np.asarray(peaks), starts).tolist()
@@ -0,0 +1,163 @@
+"""
+Per-user change versions and conditional GET for the read endpoints.
+
+Every change to a user's activities, recordings or profile bumps that user's
+DataVersion counter for the scope. Changed activities and recordings also bump the
+user's sync counter and are stamped with its new value, and deleted ones leave a
+SyncTombstone with it; the sync feed (activity/sync.py) reads changes by that stamp.
+Model signals cover ordinary saves and deletes; code that bypasses them
+(QuerySet.update, bulk_create, ...) calls touch() (or bump(), for profiles) itself.
+
+conditional_on_versions() derives a response's ETag from those counters and the
+request, without running the view. A client that sends the ETag back in
+If-None-Match gets a 304 for the price of one indexed query, and nothing is
+loaded or serialized.
+"""
+import hashlib
+from collections import defaultdict
+from functools import wraps
+
+from django.contrib.auth.models import User
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+
+from .models import AudioRecording, DailyActivity, DataVersion, Profile, SyncTombstone
+
+ACTIVITIES = DataVersion.SCOPE_ACTIVITIES
+RECORDINGS = DataVersion.SCOPE_RECORDINGS
+PROFILE = DataVersion.SCOPE_PROFILE
+SYNC = DataVersion.SCOPE_SYNC
+
+_SCOPES = {DailyActivity: ACTIVITIES, AudioRecording: RECORDINGS}
+_TOMBSTONE_KINDS = {DailyActivity: SyncTombstone.KIND_ACTIVITY, AudioRecording: SyncTombstone.KIND_RECORDING}
+
+
+def _increment(user_id, scope):
+    versions = DataVersion.objects.filter(user_id=user_id, scope=scope)
+    if versions.update(version=F('version') + 1):
+        return versions
+    try:
+        with transaction.atomic():
+            DataVersion.objects.create(user_id=user_id, scope=scope, version=1)
+    except IntegrityError:
+        # Created concurrently by another request
+        versions.update(version=F('version') + 1)
+    return versions
+
+
+def bump(user_ids, *scopes):
+    """Record a change to `scopes` for a user id, or for each of an iterable of them."""
+    if not isinstance(user_ids, (set, list, tuple)):
+        user_ids = [user_ids]
+    for user_id in set(user_ids) - {None}:
+        for scope in scopes:
+            _increment(user_id, scope)
+
+
+def _next_sync_version(user_id):
+    # Call inside a transaction: the counter row stays locked until the stamped rows commit
+    # with it, so sync versions become visible in increasing order
+    return _increment(user_id, SYNC).values_list('version', flat=True).get()
+
+
+def touch(queryset):
+    """
+    Record a change to the activities or recordings in `queryset`: bump their owners'
+    versions and stamp the rows with the new sync version. Returns that version
+    (the last one, if the rows have several owners), or None if there are no rows.
+    """
+    model = queryset.model
+    version = None
+    with transaction.atomic():
+        owners = defaultdict(list)
+        for pk, user_id in queryset.values_list('pk', 'user_id'):
+            owners[user_id].append(pk)
+        for user_id, pks in owners.items():
+            bump(user_id, _SCOPES[model])
+            version = _next_sync_version(user_id)
+            model.objects.filter(pk__in=pks).update(sync_version=version)
+    return version
+
+
+def current_versions(user_id, scopes):
+    versions = dict(DataVersion.objects.filter(user_id=user_id, scope__in=scopes).values_list('scope', 'version'))
+    return tuple(versions.get(scope, 0) for scope in scopes)
+
+
+def _deleting_user(origin):
+    # Rows deleted along with their user need no new version (and mustn't create one)
+    return isinstance(origin, User) or getattr(origin, 'model', None) is User
+
+
+@receiver(post_save, sender=DailyActivity)
+@receiver(post_save, sender=AudioRecording)
+def _touch_saved(sender, instance, raw=False, **kwargs):
+    if not raw:
+        version = touch(sender.objects.filter(pk=instance.pk))
+        if version is not None:
+            instance.sync_version = version
+
+
+@receiver(post_delete, sender=DailyActivity)
+@receiver(post_delete, sender=AudioRecording)
+def _leave_tombstone(sender, instance, origin=None, **kwargs):
+    if _deleting_user(origin):
+        return
+    with transaction.atomic():
+        bump(instance.user_id, _SCOPES[sender])
+        SyncTombstone.objects.create(user_id=instance.user_id, kind=_TOMBSTONE_KINDS[sender], object_id=instance.pk,
+                                     sync_version=_next_sync_version(instance.user_id))
+
+
+@receiver(post_save, sender=Profile)
+@receiver(post_delete, sender=Profile)
+def _bump_profile(sender, instance, raw=False, origin=None, created=False, **kwargs):
+    # Profiles are created with their defaults on first read, which serializes the same as before
+    if not raw and not created and not _deleting_user(origin):
+        bump(instance.user_id, PROFILE)
+
+
+@receiver(post_save, sender=User)
+def _bump_profile_on_user_change(sender, instance, raw=False, **kwargs):
+    # The serialized profile embeds username/email
+    if not raw:
+        bump(instance.pk, PROFILE)
+
+
+def _etag(request, scopes):
+    versions = current_versions(request.user.pk, scopes)
+    # The same versions give different responses for other URLs, query strings and representations
+    key = f"{request.user.pk}|{request.get_full_path()}|{request.headers.get('Accept', '')}|{versions}"
+    return 'W/"%s"' % hashlib.md5(key.encode(), usedforsecurity=False).hexdigest()
+
+
+def conditional_on_versions(*scopes, max_age=0):
+    """
+    Decorator for GET views of the requesting user's data in `scopes`: adds an ETag
+    and answers a matching If-None-Match with 304 before the view runs.
+    Responses are private to the user; with max_age=0 clients must revalidate every time.
+    Apply it inside @api_view (or to a DRF view method) so the JWT user is known.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD') or not request.user.is_authenticated:
+                return view(request, *args, **kwargs)
+            etag = _etag(request, scopes)
+            response = get_conditional_response(request, etag=etag)
+            if response is None:
+                response = view(request, *args, **kwargs)
+            if response.status_code not in (200, 304):
+                return response
+            response['ETag'] = etag
+            if max_age:
+                patch_cache_control(response, private=True, max_age=max_age)
+            else:
+                patch_cache_control(response, private=True, no_cache=True)
+            patch_vary_headers(response, ('Authorization',))
+            return response
+        return wrapper
+    return decorator
@@ -1,26 +1,33 @@
+import asyncio
 import base64
-from datetime import datetime
-from io import BytesIO
+import hmac
+import operator
+from collections import defaultdict
+from datetime import datetime, timedelta
+from functools import reduce
 import logging
-import os
-from rest_framework import viewsets
+from rest_framework import generics, viewsets
 import json
 
 from rest_framework import status
 from rest_framework.permissions import IsAuthenticated
-from rest_framework.decorators import api_view, permission_classes
+from rest_framework.decorators import action, api_view, permission_classes
 from rest_framework.views import APIView
 from rest_framework.response import Response
+from rest_framework.exceptions import ValidationError
 from rest_framework.decorators import api_view
-from django.core.files.uploadhandler import TemporaryFileUploadHandler
 from django.contrib.auth.models import User
 from django.contrib.auth.hashers import make_password
-from django.http import JsonResponse
+from django.db.models import Q
+from django.http import HttpResponse, JsonResponse
 from django.views.decorators.csrf import csrf_exempt
 from rest_framework.parsers import MultiPartParser, FormParser
 from rest_framework.decorators import api_view, parser_classes
-from pydub import AudioSegment
-from django.views.decorators.http import require_POST
+from django.utils.decorators import method_decorator
+from django.views.decorators.http import require_GET, require_http_methods, require_POST
+from asgiref.sync import sync_to_async
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.settings import api_settings
 from django.contrib.auth.decorators import login_required
 from django.views.decorators.csrf import csrf_exempt
 
@@ -30,11 +37,133 @@ from .models import DailyActivity
 from .serializers import ActivitySerializer
 from .models import Profile
 from .serializers import ProfileSerializer
-from .utility.utils import transcribe_audio, summarize_text
+from .models import ProcessingJob
+from .serializers import ProcessingJobSerializer
+from .recordings import adelete_recording, asave_recording, delete_recording, delete_recordings, save_recording
+from .utility.utils import arequest_summary
+from .models import AudioRecording
+from .serializers import AudioRecordingSerializer
+from .pagination import ActivityCursorPagination, AudioRecordingPagination
+from .streaming import FileContentNegotiation, serve_recording_file
+from .search import search_activities
+from .models import UploadSession
+from .serializers import UploadSessionSerializer
+from .uploads import UploadError, abort_upload, finalize_upload, write_chunk
+from .models import SpendingRollup
+from .serializers import SpendingRollupSerializer
+from .models import SyncTombstone
+from .sync import ExpiredSyncToken, InvalidSyncToken, changes_since
+from .rollups import period_start
+from .profiles import InvalidImage, get_profile_data, update_profile_photo
+from .blobs import HashingUploadHandler, add_waveform
+from .bulk import bulk_create_activities, bulk_update_activities
+from .utility.metrics import registry, span
+from .versions import ACTIVITIES, PROFILE, RECORDINGS, conditional_on_versions, touch
+
+STATS_DEFAULT_PERIODS = {'day': 30, 'week': 12, 'month': 12}
+STATS_MAX_PERIODS = 366
+
+def _parse_date(value):
+    return datetime.strptime(value, '%Y-%m-%d').date()
+
+
+def _batch_status(statuses, success, success_status):
+    """
+    The response status of a batch request whose items each have one of `statuses`:
+    `success_status` if they all succeeded, 400 if they were all invalid and
+    207 Multi-Status otherwise, so that clients look at the per-item results.
+    """
+    if all(item_status == success for item_status in statuses):
+        return success_status
+    if all(item_status == 'invalid' for item_status in statuses):
+        return status.HTTP_400_BAD_REQUEST
+    return status.HTTP_207_MULTI_STATUS
+
 
 class ActivityViewSet(viewsets.ModelViewSet):
+    """
+    Activities, newest first, cursor-paginated ('cursor', 'page_size').
+    List and retrieve accept 'start'/'end' (YYYY-MM-DD, inclusive) to limit the
+    date range, and 'fields' (comma-separated) to return only some fields, e.g.
+    ?fields=id,date,spending to skip the transcript and summary text.
+    POST/PATCH activities/bulk/ create/update a list of activities in one transaction.
+    """
     queryset = DailyActivity.objects.all()
     serializer_class = ActivitySerializer
+    pagination_class = ActivityCursorPagination
+    permission_classes = [IsAuthenticated]
+
+    def get_requested_fields(self):
+        if self.action not in ('list', 'retrieve') or not self.request.query_params.get('fields'):
+            return None
+        fields = [name.strip() for name in self.request.query_params['fields'].split(',') if name.strip()]
+        unknown = set(fields) - {field.name for field in DailyActivity._meta.concrete_fields}
+        if unknown:
+            raise ValidationError({'fields': f"Unknown field(s): {', '.join(sorted(unknown))}"})
+        return fields
+
+    def get_queryset(self):
+        # Only the requesting user's activities; served by the (user, date) index
+        queryset = super().get_queryset().filter(user=self.request.user)
+        params = self.request.query_params
+        try:
+            if params.get('start'):
+                queryset = queryset.filter(date__gte=_parse_date(params['start']))
+            if params.get('end'):
+                queryset = queryset.filter(date__lte=_parse_date(params['end']))
+        except ValueError:
+            raise ValidationError({'error': 'Dates must be in YYYY-MM-DD format'})
+
+        fields = self.get_requested_fields()
+        if fields:
+            # Don't load the columns that won't be serialized; the pagination ordering fields are always needed
+            queryset = queryset.only(*set(fields) | {'id', 'date'})
+        return queryset
+
+    def get_serializer(self, *args, **kwargs):
+        kwargs.setdefault('fields', self.get_requested_fields())
+        return super().get_serializer(*args, **kwargs)
+
+    @method_decorator(conditional_on_versions(ACTIVITIES))
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
+    @method_decorator(conditional_on_versions(ACTIVITIES))
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
+
+    def perform_create(self, serializer):
+        serializer.save(user=self.request.user)
+
+    @action(detail=False, methods=['post', 'patch'])
+    def bulk(self, request):
+        """
+        POST a list of new activities, or PATCH a list of partial updates that each
+        include the activity 'id'. The valid items are written, together; 'results' has
+        one entry per item, in order: {'status': 'created' or 'updated', 'activity': ...}
+        or {'status': 'invalid', 'errors': ...}. 207 when only some items were written.
+        """
+        items = request.data
+        if not isinstance(items, list) or not items:
+            return Response({'error': 'Expected a non-empty list of activities'}, status=status.HTTP_400_BAD_REQUEST)
+        if len(items) > settings.ACTIVITY_BULK_MAX_ITEMS:
+            return Response({'error': f'At most {settings.ACTIVITY_BULK_MAX_ITEMS} activities per request'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        if request.method == 'POST':
+            activities, errors = bulk_create_activities(request.user, items)
+            success, success_status = 'created', status.HTTP_201_CREATED
+        else:
+            activities, errors = bulk_update_activities(request.user, items)
+            success, success_status = 'updated', status.HTTP_200_OK
+
+        results = []
+        for activity, error in zip(activities, errors):
+            if activity is None:
+                results.append({'status': 'invalid', 'errors': error})
+            else:
+                results.append({'status': success, 'activity': self.get_serializer(activity).data})
+        return Response({'results': results},
+                        status=_batch_status([result['status'] for result in results], success, success_status))
 
 class ProtectedView(APIView):
     permission_classes = [IsAuthenticated]  # Restrict access to authenticated users only
@@ -53,56 +182,42 @@ def record_activity_api(request):
         # Log the start of the request
         logger.info("Started processing record_activity request with streaming")
 
-        # Handle streaming uploads with TemporaryFileUploadHandler
-        request.upload_handlers.insert(0, TemporaryFileUploadHandler())
+        # Stream uploads to a temporary file, hashing them on the way for deduplication
+        request.upload_handlers.insert(0, HashingUploadHandler())
 
-        # Get the selected date from the request
-        selected_date = request.POST.get('date')
+        # Get the selected date from the request (this parses the multipart body)
+        with span('upload_parse'):
+            selected_date = request.POST.get('date')
+            uploaded_files = request.FILES
         if not selected_date:
             logger.error("No date provided by the user")
             return JsonResponse({'error': 'No date provided'}, status=400)
 
-        logger.info(f"User selected date: {selected_date}")
+        logger.info("User selected date: %s", selected_date)
 
         # Format the selected date
         formatted_date = datetime.strptime(selected_date, '%Y-%m-%d').strftime('%Y-%m-%d')
 
-        # Create a directory based on the selected date
-        date_folder_path = os.path.join(settings.MEDIA_ROOT, 'audio', formatted_date)
-        if not os.path.exists(date_folder_path):
-            os.makedirs(date_folder_path)  # Create the folder if it doesn't exist
-            logger.info(f"Created directory for date: {formatted_date} at {date_folder_path}")
-        else:
-            logger.info(f"Directory for date: {formatted_date} already exists")
-
         # Handle file upload from React (streaming mode)
-        if 'audio_file' in request.FILES:
-            uploaded_audio = request.FILES['audio_file']
+        if 'audio_file' in uploaded_files:
+            uploaded_audio = uploaded_files['audio_file']
 
             try:
-                # Convert uploaded file to WAV format
                 logger.info("Processing uploaded audio file in streaming mode")
-
-                # If the uploaded file is already in WAV, this will handle it correctly; otherwise, convert to WAV
-                audio_segment = AudioSegment.from_file(uploaded_audio)
-                audio_temp = BytesIO()
-                audio_segment.export(audio_temp, format="wav")  # Convert to WAV
-
-                # Create a unique file name using the current time to avoid file name collisions
-                audio_file_name = f'audio_{formatted_date}_{datetime.now().strftime("%H-%M-%S")}.wav'
-
-                # Save the uploaded file in the date-based folder in .wav format
-                file_path = os.path.join(date_folder_path, audio_file_name)
-                with open(file_path, 'wb') as f:
-                    f.write(audio_temp.getvalue())  # Save the converted audio file as a .wav file
-
-                logger.info(f"Uploaded and converted audio file successfully saved at {file_path}")
-
+                activity, job = save_recording(request.user, formatted_date, uploaded_audio)
             except Exception as e:
                 # Log error and return JSON response
-                logger.error(f"Error processing uploaded audio file: {str(e)}", exc_info=True)
+                logger.error("Error processing uploaded audio file: %s", e, exc_info=True)
                 return JsonResponse({'error': f"Error converting audio: {str(e)}"}, status=400)
 
+            logger.info("Successfully processed record_activity request")
+            return JsonResponse({
+                'message': 'Activity saved and converted to .wav successfully',
+                'activity_id': activity.id,
+                'job_id': job.id,
+                'job_status': job.status,
+            }, status=202)
+
         logger.info("Successfully processed record_activity request")
         return JsonResponse({'message': 'Activity saved and converted to .wav successfully'})
 
@@ -110,6 +225,234 @@ def record_activity_api(request):
     return JsonResponse({'message': 'GET method not supported for this endpoint'}, status=405)
 
 
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def upload_init(request):
+    """
+    Start a resumable upload. Expects 'date' (YYYY-MM-DD) and optionally
+    'file_name' and 'total_size' (bytes).
+    """
+    selected_date = request.data.get('date')
+    if not selected_date:
+        return JsonResponse({'error': 'No date provided'}, status=400)
+    try:
+        formatted_date = datetime.strptime(selected_date, '%Y-%m-%d').strftime('%Y-%m-%d')
+        total_size = request.data.get('total_size')
+        total_size = int(total_size) if total_size not in (None, '') else None
+    except ValueError:
+        return JsonResponse({'error': 'Invalid date or total_size'}, status=400)
+
+    session = UploadSession.objects.create(
+        user=request.user,
+        date=formatted_date,
+        file_name=request.data.get('file_name', ''),
+        total_size=total_size,
+    )
+    logger.info("Started upload session %s for date %s", session.pk, formatted_date)
+    return Response(UploadSessionSerializer(session).data, status=status.HTTP_201_CREATED)
+
+
+@api_view(['GET', 'DELETE'])
+@permission_classes([IsAuthenticated])
+def upload_detail(request, upload_id):
+    """
+    GET reports which chunks have been received, so an interrupted client knows
+    what to re-send. DELETE abandons the upload.
+    """
+    try:
+        session = UploadSession.objects.get(pk=upload_id, user=request.user)
+    except UploadSession.DoesNotExist:
+        return JsonResponse({'error': 'Upload not found'}, status=404)
+
+    if request.method == 'DELETE':
+        abort_upload(session)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+    return Response(UploadSessionSerializer(session).data)
+
+
+@csrf_exempt
+@api_view(['PUT'])
+@permission_classes([IsAuthenticated])
+def upload_chunk(request, upload_id, index):
+    """
+    Store one chunk. The raw request body is the chunk data; the X-Chunk-Offset and
+    X-Chunk-SHA256 headers give its byte offset in the file and its hex SHA-256.
+    """
+    try:
+        session = UploadSession.objects.get(pk=upload_id, user=request.user)
+    except UploadSession.DoesNotExist:
+        return JsonResponse({'error': 'Upload not found'}, status=404)
+    try:
+        offset = int(request.headers.get('X-Chunk-Offset', ''))
+    except ValueError:
+        return JsonResponse({'error': 'Missing or invalid X-Chunk-Offset header'}, status=400)
+
+    if request.stream is None:
+        return JsonResponse({'error': 'Empty chunk'}, status=400)
+
+    try:
+        # Read straight from the request stream so the chunk is never buffered whole
+        chunk = write_chunk(session, index, offset, request.headers.get('X-Chunk-SHA256'), request.stream)
+    except UploadError as e:
+        return JsonResponse({'error': str(e)}, status=e.status)
+    return Response({'index': chunk.index, 'offset': chunk.offset, 'size': chunk.size, 'sha256': chunk.sha256})
+
+
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def upload_finalize(request, upload_id):
+    """
+    Assemble the uploaded chunks and process the recording like record_activity_api.
+    An optional 'sha256' of the whole file is verified during assembly.
+    """
+    try:
+        session = UploadSession.objects.get(pk=upload_id, user=request.user)
+    except UploadSession.DoesNotExist:
+        return JsonResponse({'error': 'Upload not found'}, status=404)
+
+    try:
+        activity, job = finalize_upload(session, expected_sha256=request.data.get('sha256'))
+    except UploadError as e:
+        return JsonResponse({'error': str(e)}, status=e.status)
+    except Exception as e:
+        logger.error("Error finalizing upload %s: %s", session.pk, e, exc_info=True)
+        return JsonResponse({'error': f"Error converting audio: {str(e)}"}, status=400)
+
+    return JsonResponse({
+        'message': 'Activity saved and converted to .wav successfully',
+        'activity_id': activity.id,
+        'job_id': job.id,
+        'job_status': job.status,
+    }, status=202)
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def search_activities_view(request):
+    """
+    Full-text search over the user's transcripts and summaries.
+    'q' is the query; 'limit' caps the number of ranked results (default 20, max 100).
+    """
+    query = request.query_params.get('q', '').strip()
+    if not query:
+        return JsonResponse({'error': 'No search query provided'}, status=400)
+    try:
+        limit = min(max(int(request.query_params.get('limit', 20)), 1), 100)
+    except ValueError:
+        return JsonResponse({'error': 'Invalid limit'}, status=400)
+
+    results = search_activities(request.user, query, limit=limit)
+    return Response({'query': query, 'count': len(results), 'results': results})
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def sync_changes(request):
+    """
+    Delta sync: the activities and recordings changed, and the ids of those deleted,
+    since the 'since' token of the previous response (everything without one).
+    'limit' caps the rows of each kind per page; while 'has_more' is true, ask again
+    with the new token. 410 means the token is too old and the client starts over.
+    """
+    try:
+        limit = min(max(int(request.query_params.get('limit', settings.ACTIVITY_SYNC_PAGE_SIZE)), 1),
+                    settings.ACTIVITY_SYNC_PAGE_SIZE)
+    except ValueError:
+        return JsonResponse({'error': 'Invalid limit'}, status=400)
+    try:
+        page = changes_since(request.user, request.query_params.get('since'), limit)
+    except ExpiredSyncToken:
+        return JsonResponse({'error': 'Sync token expired, sync again without since'}, status=410)
+    except InvalidSyncToken:
+        return JsonResponse({'error': 'Invalid sync token'}, status=400)
+
+    deleted = {'activities': [], 'recordings': []}
+    for tombstone in page.deleted:
+        kind = 'activities' if tombstone.kind == SyncTombstone.KIND_ACTIVITY else 'recordings'
+        deleted[kind].append(tombstone.object_id)
+    return Response({
+        'token': page.token,
+        'has_more': page.has_more,
+        'activities': ActivitySerializer(page.activities, many=True).data,
+        'recordings': AudioRecordingSerializer(page.recordings, many=True).data,
+        'deleted': deleted,
+    })
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def spending_stats(request):
+    """
+    Spending totals and activity counts per 'period' (day, week or month; default month),
+    read from the rollup table. 'start'/'end' (YYYY-MM-DD) select the range; by default
+    the last 30 days, 12 weeks or 12 months. Periods without activities are omitted.
+    """
+    period = request.query_params.get('period', SpendingRollup.PERIOD_MONTH)
+    if period not in STATS_DEFAULT_PERIODS:
+        return JsonResponse({'error': 'Invalid period, expected day, week or month'}, status=400)
+    try:
+        end = _parse_date(request.query_params['end']) if 'end' in request.query_params else datetime.now().date()
+        if 'start' in request.query_params:
+            start = _parse_date(request.query_params['start'])
+        elif period == SpendingRollup.PERIOD_MONTH:
+            months = end.year * 12 + end.month - STATS_DEFAULT_PERIODS[period]
+            start = end.replace(year=months // 12, month=months % 12 + 1, day=1)
+        else:
+            days = STATS_DEFAULT_PERIODS[period] * (7 if period == SpendingRollup.PERIOD_WEEK else 1)
+            start = end - timedelta(days=days - 1)
+    except ValueError:
+        return JsonResponse({'error': 'Invalid date format'}, status=400)
+    start, end = period_start(period, start), period_start(period, end)
+    if start > end:
+        return JsonResponse({'error': 'start must not be after end'}, status=400)
+    # Bound the number of rows read, so the response time doesn't depend on the history length
+    if (end - start).days > STATS_MAX_PERIODS * {'day': 1, 'week': 7, 'month': 31}[period]:
+        return JsonResponse({'error': f'Range too large, at most {STATS_MAX_PERIODS} periods'}, status=400)
+
+    rollups = SpendingRollup.objects.filter(
+        user=request.user, period=period, period_start__range=(start, end),
+    ).order_by('period_start')
+    results = SpendingRollupSerializer(rollups, many=True).data
+    return Response({
+        'period': period,
+        'start': str(start),
+        'end': str(end),
+        'total': sum(row['total'] for row in results),
+        'count': sum(row['count'] for row in results),
+        'results': results,
+    })
+
+
+@require_GET
+def metrics(request):
+    """
+    Request, stage and cache metrics of this process in the Prometheus text format.
+    Only for scrapers sending ACTIVITY_METRICS_TOKEN as a Bearer token and for staff
+    logged in to the admin; without a configured token only staff get in.
+    """
+    if not request.user.is_staff:
+        token = settings.ACTIVITY_METRICS_TOKEN
+        if token is None:
+            return JsonResponse({'error': 'Metrics require ACTIVITY_METRICS_TOKEN to be configured'}, status=403)
+        expected = f'Bearer {token}'
+        if not hmac.compare_digest(request.headers.get('Authorization', '').encode(), expected.encode()):
+            return JsonResponse({'error': 'Invalid metrics token'}, status=401)
+    return HttpResponse(registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def job_status(request, job_id):
+    """
+    Report the progress of a background transcription/summarization job.
+    """
+    try:
+        job = ProcessingJob.objects.get(pk=job_id, user=request.user)
+    except ProcessingJob.DoesNotExist:
+        return JsonResponse({'error': 'Job not found'}, status=404)
+    return Response(ProcessingJobSerializer(job).data)
+
+
 @api_view(['POST'])
 def signup(request):
     try:
@@ -125,59 +468,148 @@ def signup(request):
     
     
 @api_view(['GET', 'POST'])
+@conditional_on_versions(PROFILE)
 def user_profile(request):
     if not request.user.is_authenticated:
         return JsonResponse({'error': 'User not authenticated'}, status=401)
     
-    profile, created = Profile.objects.get_or_create(user=request.user)
-
     if request.method == 'GET':
-        profile = Profile.objects.get(user=request.user)
-        serializer = ProfileSerializer(profile)
-        return Response(serializer.data)
+        return Response(get_profile_data(request.user))
     
     elif request.method == 'POST':
-        profile = Profile.objects.get(user=request.user)
-        profile.profile_photo = request.FILES.get('profile_photo')
-        profile.save()
+        profile, created = Profile.objects.select_related('user').get_or_create(user=request.user)
+        try:
+            update_profile_photo(profile, request.FILES.get('profile_photo'))
+        except InvalidImage:
+            return JsonResponse({'error': 'Invalid image file'}, status=400)
         serializer = ProfileSerializer(profile)
         return Response(serializer.data)
     
 
 #@login_required
-@permission_classes([IsAuthenticated])
 @csrf_exempt
-@api_view(['POST'])
+@api_view(['GET', 'POST'])
+@permission_classes([IsAuthenticated])
+@conditional_on_versions(RECORDINGS)
 def get_audio_files_for_date(request, date):
     """
-    Fetch the list of audio files for the given date.
+    Fetch the list of audio files for the given date from the recording index.
+    Optional 'limit' and 'offset' query parameters page through large days.
+    GET answers If-None-Match with 304 while the user's recordings are unchanged.
     """
-    # if not request.user.is_authenticated:
-    #     return JsonResponse({'error': 'User not authenticated'}, status=401)
-    # Format the date and construct the folder path
-    logger.info(f"Received request for audio files for date: {date}")
-    formatted_date = datetime.strptime(date, '%Y-%m-%d').strftime('%Y-%m-%d')
-    date_folder_path = os.path.join(settings.MEDIA_ROOT, 'audio', formatted_date)
+    logger.info("Received request for audio files for date: %s", date)
+    try:
+        selected_date = _parse_date(date)
+    except ValueError:
+        return JsonResponse({'error': 'Invalid date'}, status=400)
+
+    recordings = (AudioRecording.objects.filter(user=request.user, date=selected_date).select_related('blob')
+                  .order_by('created_at', 'id'))
+    paginator = AudioRecordingPagination()
+    page = paginator.paginate_queryset(recordings, request) if 'limit' in request.query_params else None
+    if page is None:
+        page = list(recordings)
+        count = len(page)
+    else:
+        count = paginator.count
 
-    if not os.path.exists(date_folder_path):
-        return JsonResponse({'files': [], 'message': 'No files found for the selected date.'})
+    if not count:
+        return JsonResponse({'files': [], 'count': 0, 'message': 'No files found for the selected date.'})
 
-    # List all .wav files in the folder
-    files = [f for f in os.listdir(date_folder_path) if f.endswith('.wav')]
-    return JsonResponse({'files': files, 'count': len(files)})
+    return JsonResponse({
+        'files': [recording.filename for recording in page],
+        'count': count,
+        'recordings': AudioRecordingSerializer(page, many=True).data,
+    })
 
-#@login_required
+
+class AudioRecordingListView(generics.ListAPIView):
+    """
+    Paginated list of indexed recordings, optionally limited to a date range
+    with the 'start' and 'end' (inclusive, YYYY-MM-DD) query parameters.
+    """
+    permission_classes = [IsAuthenticated]
+    serializer_class = AudioRecordingSerializer
+    pagination_class = AudioRecordingPagination
+
+    def get_queryset(self):
+        queryset = (AudioRecording.objects.filter(user=self.request.user).select_related('blob')
+                    .order_by('-date', '-created_at', '-id'))
+        try:
+            if self.request.query_params.get('start'):
+                queryset = queryset.filter(date__gte=_parse_date(self.request.query_params['start']))
+            if self.request.query_params.get('end'):
+                queryset = queryset.filter(date__lte=_parse_date(self.request.query_params['end']))
+        except ValueError:
+            raise ValidationError({'error': 'Dates must be in YYYY-MM-DD format'})
+        return queryset
+
+    @method_decorator(conditional_on_versions(RECORDINGS))
+    def get(self, request, *args, **kwargs):
+        return super().get(request, *args, **kwargs)
+
+
+class AudioStreamView(APIView):
+    """
+    Authenticated playback of a recording with Range, ETag/Last-Modified and
+    optional X-Accel-Redirect/X-Sendfile support.
+    """
+    permission_classes = [IsAuthenticated]
+    content_negotiation_class = FileContentNegotiation
+
+    def get(self, request, recording_id):
+        try:
+            recording = AudioRecording.objects.select_related('blob').get(pk=recording_id, user=request.user)
+        except AudioRecording.DoesNotExist:
+            return JsonResponse({'error': 'File not found'}, status=404)
+        return serve_recording_file(request, recording.path, recording.relative_path)
+
+
+@api_view(['GET'])
 @permission_classes([IsAuthenticated])
+def recording_peaks(request, recording_id):
+    """
+    Waveform peaks (0-1) of a recording at ?resolution=, one of ACTIVITY_PEAKS_RESOLUTIONS
+    (the finest by default), with its duration, sample rate and channels.
+    """
+    try:
+        resolution = int(request.query_params.get('resolution', max(settings.ACTIVITY_PEAKS_RESOLUTIONS)))
+    except ValueError:
+        resolution = None
+    if resolution not in settings.ACTIVITY_PEAKS_RESOLUTIONS:
+        allowed = ', '.join(map(str, settings.ACTIVITY_PEAKS_RESOLUTIONS))
+        return JsonResponse({'error': f'resolution must be one of {allowed}'}, status=400)
+    try:
+        recording = AudioRecording.objects.select_related('blob').get(pk=recording_id, user=request.user)
+    except AudioRecording.DoesNotExist:
+        return JsonResponse({'error': 'File not found'}, status=404)
+
+    blob = recording.blob
+    # Blobs stored before peaks were recorded get them on first request
+    if blob is None or (blob.peaks is None and not add_waveform(blob)):
+        return JsonResponse({'error': 'No waveform is available for this recording'}, status=404)
+
+    from .utility.waveform import downsample_peaks
+    peaks = downsample_peaks(blob.peaks, resolution)
+    return JsonResponse({
+        'id': recording.pk,
+        'duration': blob.duration,
+        'sample_rate': blob.sample_rate,
+        'channels': blob.channels,
+        'resolution': len(peaks),
+        'peaks': peaks,
+    })
+
+
+#@login_required
 @require_POST
 @csrf_exempt
 @api_view(['POST'])
+@permission_classes([IsAuthenticated])
 def delete_audio_file(request):
     """
-    Delete a specific audio file.
+    Delete a specific audio file and its index entry.
     """
-    # if not request.user.is_authenticated:
-    #     return JsonResponse({'error': 'User not authenticated'}, status=401)
-    
     logger.info("Received request to delete audio file")
     try:
         data = json.loads(request.body)  # Parse the JSON request body
@@ -186,19 +618,220 @@ def delete_audio_file(request):
     except json.JSONDecodeError:
         return JsonResponse({'error': 'Invalid JSON'}, status=400)
 
-    logger.info(f"Received request to delete file: {file_name} for date: {date}")
+    logger.info("Received request to delete file: %s for date: %s", file_name, date)
     
     if not file_name or not date:
         return JsonResponse({'error': 'File name or date not provided'}, status=400)
 
-    # Format the date and construct the file path
-    formatted_date = datetime.strptime(date, '%Y-%m-%d').strftime('%Y-%m-%d')
-    file_path = os.path.join(settings.MEDIA_ROOT, 'audio', formatted_date, file_name)
+    try:
+        recording = AudioRecording.objects.get(user=request.user, date=_parse_date(date), filename=file_name)
+    except (ValueError, AudioRecording.DoesNotExist):
+        return JsonResponse({'error': 'File not found'}, status=404)
 
-    logger.info(f"Attempting to delete file: {file_path}")
-    
-    if os.path.exists(file_path):
-        os.remove(file_path)
-        return JsonResponse({'message': f'{file_name} deleted successfully'})
+    logger.info("Attempting to delete file: %s", recording.path)
+    delete_recording(recording)
+    return JsonResponse({'message': f'{file_name} deleted successfully'})
+
+
+@csrf_exempt
+@api_view(['POST'])
+@permission_classes([IsAuthenticated])
+def delete_audio_files(request):
+    """
+    Delete several audio files at once: {"files": [{"date": "YYYY-MM-DD", "file_name": ...}, ...]}.
+    Returns a result per file, in order, with a status of 'deleted', 'not_found' or 'invalid';
+    207 unless all of them were deleted (400 if all were invalid).
+    """
+    files = request.data.get('files') if isinstance(request.data, dict) else None
+    if not isinstance(files, list) or not files:
+        return JsonResponse({'error': 'Expected a non-empty list of files'}, status=400)
+    if len(files) > settings.ACTIVITY_BULK_MAX_ITEMS:
+        return JsonResponse({'error': f'At most {settings.ACTIVITY_BULK_MAX_ITEMS} files per request'}, status=400)
+
+    keys = []
+    for item in files:
+        try:
+            key = (_parse_date(item['date']), item['file_name'])
+        except (KeyError, TypeError, ValueError):
+            key = None
+        keys.append(key if key and isinstance(key[1], str) and key[1] else None)
+    logger.info("Received request to delete %d audio files", len(files))
+
+    # One query for all of them, one (date, filenames) condition per date
+    names_by_date = defaultdict(set)
+    for key in filter(None, keys):
+        names_by_date[key[0]].add(key[1])
+    recordings = {}
+    if names_by_date:
+        condition = reduce(operator.or_, (Q(date=date, filename__in=names) for date, names in names_by_date.items()))
+        for recording in AudioRecording.objects.filter(condition, user=request.user):
+            recordings[(recording.date, recording.filename)] = recording
+    delete_recordings(recordings.values())
+
+    results = []
+    for item, key in zip(files, keys):
+        result = {'date': item.get('date'), 'file_name': item.get('file_name')} if isinstance(item, dict) else {}
+        if key is None:
+            result['status'] = 'invalid'
+        else:
+            result['status'] = 'deleted' if key in recordings else 'not_found'
+        results.append(result)
+    return JsonResponse({'results': results},
+                        status=_batch_status([result['status'] for result in results], 'deleted', 200))
+
+
+# Async (ASGI-native) versions of the record, list, delete and summarize endpoints,
+# mounted under api/async/. They bypass DRF, so authentication is done here: a
+# session user or a JWT Bearer token. Served by an ASGI server, waiting on the disk,
+# the database or OpenAI doesn't tie up a worker thread per request.
+
+async def _authenticated_user(request):
+    user = await request.auser()
+    if user.is_authenticated:
+        return user
+    # The same (JWT) authentication classes the DRF views use
+    for authentication_class in api_settings.DEFAULT_AUTHENTICATION_CLASSES:
+        try:
+            result = await sync_to_async(authentication_class().authenticate)(request)
+        except AuthenticationFailed:
+            return None
+        if result:
+            return result[0]
+    return None
+
+
+def _read_recording_upload(request):
+    # Multipart parsing writes the upload to a temporary file, so it runs on a worker thread
+    request.upload_handlers.insert(0, HashingUploadHandler())
+    return request.POST.get('date'), request.FILES.get('audio_file')
+
+
+@csrf_exempt
+@require_POST
+async def record_activity_async(request):
+    """
+    Async record_activity_api.
+    """
+    user = await _authenticated_user(request)
+    if user is None:
+        return JsonResponse({'error': 'User not authenticated'}, status=401)
+
+    with span('upload_parse'):
+        selected_date, uploaded_audio = await asyncio.to_thread(_read_recording_upload, request)
+    if not selected_date:
+        logger.error("No date provided by the user")
+        return JsonResponse({'error': 'No date provided'}, status=400)
+    try:
+        formatted_date = _parse_date(selected_date).strftime('%Y-%m-%d')
+    except ValueError:
+        return JsonResponse({'error': 'Invalid date'}, status=400)
+
+    if uploaded_audio is None:
+        return JsonResponse({'message': 'Activity saved and converted to .wav successfully'})
+    try:
+        activity, job = await asave_recording(user, formatted_date, uploaded_audio)
+    except Exception as e:
+        logger.error("Error processing uploaded audio file: %s", e, exc_info=True)
+        return JsonResponse({'error': f"Error converting audio: {str(e)}"}, status=400)
+
+    return JsonResponse({
+        'message': 'Activity saved and converted to .wav successfully',
+        'activity_id': activity.id,
+        'job_id': job.id,
+        'job_status': job.status,
+    }, status=202)
+
+
+@csrf_exempt
+@require_http_methods(['GET', 'POST'])
+async def get_audio_files_for_date_async(request, date):
+    """
+    Async get_audio_files_for_date, with the same 'limit' and 'offset' parameters.
+    """
+    user = await _authenticated_user(request)
+    if user is None:
+        return JsonResponse({'error': 'User not authenticated'}, status=401)
+    try:
+        selected_date = _parse_date(date)
+    except ValueError:
+        return JsonResponse({'error': 'Invalid date'}, status=400)
+
+    recordings = (AudioRecording.objects.filter(user=user, date=selected_date).select_related('blob')
+                  .order_by('created_at', 'id'))
+    if 'limit' in request.GET:
+        try:
+            limit = min(max(int(request.GET['limit']), 1), AudioRecordingPagination.max_limit)
+            offset = max(int(request.GET.get('offset', 0)), 0)
+        except ValueError:
+            return JsonResponse({'error': 'Invalid limit or offset'}, status=400)
+        count = await recordings.acount()
+        page = [recording async for recording in recordings[offset:offset + limit]]
     else:
-        return JsonResponse({'error': 'File not found'}, status=404)
\ No newline at end of file
+        page = [recording async for recording in recordings]
+        count = len(page)
+
+    if not count:
+        return JsonResponse({'files': [], 'count': 0, 'message': 'No files found for the selected date.'})
+
+    return JsonResponse({
+        'files': [recording.filename for recording in page],
+        'count': count,
+        'recordings': AudioRecordingSerializer(page, many=True).data,
+    })
+
+
+@csrf_exempt
+@require_POST
+async def delete_audio_file_async(request):
+    """
+    Async delete_audio_file.
+    """
+    user = await _authenticated_user(request)
+    if user is None:
+        return JsonResponse({'error': 'User not authenticated'}, status=401)
+    try:
+        data = json.loads(request.body)
+        file_name = data.get('file_name')
+        date = data.get('date')
+    except json.JSONDecodeError:
+        return JsonResponse({'error': 'Invalid JSON'}, status=400)
+    if not file_name or not date:
+        return JsonResponse({'error': 'File name or date not provided'}, status=400)
+
+    try:
+        recording = await (AudioRecording.objects.select_related('blob')
+                           .aget(user=user, date=_parse_date(date), filename=file_name))
+    except (ValueError, AudioRecording.DoesNotExist):
+        return JsonResponse({'error': 'File not found'}, status=404)
+
+    logger.info("Attempting to delete file: %s", recording.path)
+    await adelete_recording(recording)
+    return JsonResponse({'message': f'{file_name} deleted successfully'})
+
+
+@csrf_exempt
+@require_POST
+async def summarize_activity_async(request, activity_id):
+    """
+    (Re-)summarize an activity's transcript with the async OpenAI client and store the summary.
+    """
+    user = await _authenticated_user(request)
+    if user is None:
+        return JsonResponse({'error': 'User not authenticated'}, status=401)
+    try:
+        activity = await DailyActivity.objects.only('id', 'transcript').aget(pk=activity_id, user=user)
+    except DailyActivity.DoesNotExist:
+        return JsonResponse({'error': 'Activity not found'}, status=404)
+    if not activity.transcript:
+        return JsonResponse({'error': 'Activity has no transcript yet'}, status=409)
+
+    try:
+        summary = await arequest_summary(activity.transcript)
+    except Exception as e:
+        logger.error("Summarization failed for activity %s: %s", activity_id, e, exc_info=True)
+        return JsonResponse({'error': f"An error occurred during summarization: {str(e)}"}, status=502)
+
+    changed = DailyActivity.objects.filter(pk=activity.pk)
+    await changed.aupdate(summary=summary)
+    await sync_to_async(touch)(changed)
+    return JsonResponse({'id': activity.pk, 'summary': summary})
@@ -49,6 +49,8 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'activity.middleware.CompressionMiddleware',
+    'django.middleware.http.ConditionalGetMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -56,6 +58,7 @@ MIDDLEWARE = [
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     'corsheaders.middleware.CorsMiddleware',
+    'activity.middleware.TimingMiddleware',
 ]
 
 ROOT_URLCONF = 'daily_activity.urls'
@@ -82,12 +85,63 @@ WSGI_APPLICATION = 'daily_activity.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+# SQLite by default; set DATABASE_ENGINE=postgresql and the DATABASE_* variables below for PostgreSQL
+DATABASE_ENGINE = os.getenv('DATABASE_ENGINE', 'sqlite3')
+# Seconds to keep a connection open between requests (0 closes it after each request)
+DATABASE_CONN_MAX_AGE = int(os.getenv('DATABASE_CONN_MAX_AGE', 60))
+
+if DATABASE_ENGINE == 'postgresql':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.getenv('DATABASE_NAME', 'daily_activity'),
+            'USER': os.getenv('DATABASE_USER', ''),
+            'PASSWORD': os.getenv('DATABASE_PASSWORD', ''),
+            'HOST': os.getenv('DATABASE_HOST', ''),
+            'PORT': os.getenv('DATABASE_PORT', ''),
+            'CONN_MAX_AGE': DATABASE_CONN_MAX_AGE,
+            'CONN_HEALTH_CHECKS': True,  # Reconnect instead of failing a request on a dropped persistent connection
+        }
+    }
+    # psycopg 3 connection pool shared by the process's threads (requires psycopg[pool]).
+    # Django doesn't combine pooling with persistent connections, so the pool replaces CONN_MAX_AGE
+    if os.getenv('DATABASE_POOL', 'false').lower() == 'true':
+        from psycopg_pool import ConnectionPool
+
+        DATABASES['default']['CONN_MAX_AGE'] = 0
+        DATABASES['default']['OPTIONS'] = {
+            'pool': {
+                'min_size': int(os.getenv('DATABASE_POOL_MIN_SIZE', 2)),
+                'max_size': int(os.getenv('DATABASE_POOL_MAX_SIZE', 10)),
+                'timeout': float(os.getenv('DATABASE_POOL_TIMEOUT', 10)),  # Seconds to wait for a free connection
+                'check': ConnectionPool.check_connection,  # Health check on checkout
+            },
+        }
+else:
+    # Seconds a writer waits for SQLite's lock before failing with "database is locked"
+    DATABASE_SQLITE_BUSY_TIMEOUT = float(os.getenv('DATABASE_SQLITE_BUSY_TIMEOUT', 20))
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': os.getenv('DATABASE_NAME', BASE_DIR / 'db.sqlite3'),
+            'CONN_MAX_AGE': DATABASE_CONN_MAX_AGE,
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {
+                'timeout': DATABASE_SQLITE_BUSY_TIMEOUT,
+                # Take the write lock when a transaction starts, so concurrent writers wait for the
+                # busy timeout instead of failing when a read lock can't be upgraded
+                'transaction_mode': 'IMMEDIATE',
+                # Run on every new connection. WAL lets readers proceed while one writer commits;
+                # synchronous=NORMAL is durable across application crashes in WAL mode
+                'init_command': ';'.join([
+                    'PRAGMA journal_mode=WAL',
+                    'PRAGMA synchronous=NORMAL',
+                    f'PRAGMA busy_timeout={int(DATABASE_SQLITE_BUSY_TIMEOUT * 1000)}',
+                    f"PRAGMA mmap_size={int(os.getenv('DATABASE_SQLITE_MMAP_SIZE', 256 * 1024 * 1024))}",
+                ]),
+            },
+        }
     }
-}
 
 
 # Password validation
@@ -155,9 +209,16 @@ CORS_ALLOW_HEADERS = [
 
 
 
+# JWT users are cached in-process for this many seconds instead of being loaded on every request
+ACTIVITY_JWT_USER_CACHE_SECONDS = int(os.getenv('ACTIVITY_JWT_USER_CACHE_SECONDS', 60))
+# Build request.user from the token without any query. Deactivated users then keep
+# access until their access token expires
+ACTIVITY_JWT_STATELESS = os.getenv('ACTIVITY_JWT_STATELESS', 'false').lower() == 'true'
+
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': (
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'activity.authentication.StatelessJWTAuthentication' if ACTIVITY_JWT_STATELESS
+        else 'activity.authentication.CachedJWTAuthentication',
     ),
     # 'DEFAULT_PERMISSION_CLASSES': (
     #     'rest_framework.permissions.IsAuthenticated',  # By default, all views require authentication
@@ -171,14 +232,40 @@ MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
 
+# Logging. Records are written to a size-rotated file by a background thread (see
+# activity/utility/log_queue.py), so requests never wait on the log volume
+ACTIVITY_LOG_FILE = os.getenv('ACTIVITY_LOG_FILE', os.path.join(BASE_DIR, 'logs', 'activity.log'))
+ACTIVITY_LOG_MAX_BYTES = int(os.getenv('ACTIVITY_LOG_MAX_BYTES', 20 * 1024 * 1024))  # Rotate at this size
+ACTIVITY_LOG_BACKUP_COUNT = int(os.getenv('ACTIVITY_LOG_BACKUP_COUNT', 5))  # Rotated files to keep
+ACTIVITY_LOG_FORMAT = os.getenv('ACTIVITY_LOG_FORMAT', 'text')  # 'text' or 'json'
+# Fraction of activity_logger INFO records to keep; warnings and errors are always written
+ACTIVITY_LOG_INFO_SAMPLE_RATE = float(os.getenv('ACTIVITY_LOG_INFO_SAMPLE_RATE', 1.0))
+
 LOGGING = {
     'version': 1,
     'disable_existing_loggers': False,
+    'formatters': {
+        'text': {
+            'format': '%(asctime)s %(levelname)s %(name)s [%(threadName)s] %(message)s',
+        },
+        'json': {
+            '()': 'activity.utility.log_queue.JsonFormatter',
+        },
+    },
+    'filters': {
+        'sample_info': {
+            '()': 'activity.utility.log_queue.SamplingFilter',
+            'rate': ACTIVITY_LOG_INFO_SAMPLE_RATE,
+        },
+    },
     'handlers': {
         'file': {
             'level': 'INFO',
-            'class': 'logging.FileHandler',
-            'filename': os.path.join(BASE_DIR, 'logs', 'activity.log'),  # Log file location
+            'class': 'activity.utility.log_queue.QueuedRotatingFileHandler',
+            'filename': ACTIVITY_LOG_FILE,  # Log file location
+            'maxBytes': ACTIVITY_LOG_MAX_BYTES,
+            'backupCount': ACTIVITY_LOG_BACKUP_COUNT,
+            'formatter': ACTIVITY_LOG_FORMAT,
         },
     },
     'loggers': {
@@ -190,6 +277,7 @@ LOGGING = {
         'activity_logger': {
             'handlers': ['file'],
             'level': 'INFO',
+            'filters': ['sample_info'],
             'propagate': True,
         },
     },
@@ -197,6 +285,81 @@ LOGGING = {
 
 LOGIN_URL = '/login/'
 
+# Background transcription/summarization jobs (see activity/jobs.py)
+ACTIVITY_JOB_WORKERS = int(os.getenv('ACTIVITY_JOB_WORKERS', 2))  # Concurrent jobs per process
+ACTIVITY_JOB_MAX_ATTEMPTS = int(os.getenv('ACTIVITY_JOB_MAX_ATTEMPTS', 3))
+ACTIVITY_JOB_RETRY_DELAY = float(os.getenv('ACTIVITY_JOB_RETRY_DELAY', 10))  # Seconds, doubled on each retry
+# Run jobs on a thread pool inside the web process. Set to 'false' when running `manage.py run_jobs` workers instead
+ACTIVITY_JOB_RUN_IN_PROCESS = os.getenv('ACTIVITY_JOB_RUN_IN_PROCESS', 'true').lower() == 'true'
+
+# Resumable chunked uploads (see activity/uploads.py). Chunks are kept outside MEDIA_ROOT so
+# partial uploads are never served
+ACTIVITY_UPLOAD_SESSION_DIR = os.path.join(BASE_DIR, 'upload_sessions')
+ACTIVITY_UPLOAD_MAX_CHUNK_SIZE = int(os.getenv('ACTIVITY_UPLOAD_MAX_CHUNK_SIZE', 8 * 1024 * 1024))  # Bytes
+ACTIVITY_UPLOAD_SESSION_TTL_HOURS = int(os.getenv('ACTIVITY_UPLOAD_SESSION_TTL_HOURS', 24))  # Used by cleanup_uploads
+
+# Recording playback (api/audio/<id>/stream/). Set to 'x-accel-redirect' (nginx) or 'x-sendfile'
+# (Apache/lighttpd) to let the web server copy the file after Django has checked access
+ACTIVITY_AUDIO_SENDFILE = os.getenv('ACTIVITY_AUDIO_SENDFILE') or None
+# Internal nginx location that aliases MEDIA_ROOT, used with 'x-accel-redirect'
+ACTIVITY_AUDIO_ACCEL_PREFIX = os.getenv('ACTIVITY_AUDIO_ACCEL_PREFIX', '/protected-media/')
+
+# Summarization cache (see activity/utility/summary_cache.py)
+ACTIVITY_SUMMARY_CACHE_MEMORY_ENTRIES = int(os.getenv('ACTIVITY_SUMMARY_CACHE_MEMORY_ENTRIES', 256))  # In-process LRU size
+ACTIVITY_SUMMARY_CACHE_TTL_DAYS = int(os.getenv('ACTIVITY_SUMMARY_CACHE_TTL_DAYS', 30))
+ACTIVITY_SUMMARY_CACHE_MAX_BYTES = int(os.getenv('ACTIVITY_SUMMARY_CACHE_MAX_BYTES', 50 * 1024 * 1024))  # Database tier
+# Each process runs eviction (a scan of the database tier) on a store at most once per this many seconds
+ACTIVITY_SUMMARY_CACHE_EVICT_INTERVAL = int(os.getenv('ACTIVITY_SUMMARY_CACHE_EVICT_INTERVAL', 300))
+
+# Speech recognition (see activity/utility/transcription.py). Recordings longer than one segment
+# are split and recognized in parallel
+ACTIVITY_TRANSCRIPTION_BACKEND = os.getenv('ACTIVITY_TRANSCRIPTION_BACKEND',
+                                           'activity.utility.transcription.GoogleRecognizerBackend')
+ACTIVITY_TRANSCRIPTION_SEGMENT_SECONDS = float(os.getenv('ACTIVITY_TRANSCRIPTION_SEGMENT_SECONDS', 30))
+ACTIVITY_TRANSCRIPTION_OVERLAP_SECONDS = float(os.getenv('ACTIVITY_TRANSCRIPTION_OVERLAP_SECONDS', 1))  # Fixed windows only
+ACTIVITY_TRANSCRIPTION_SPLIT_ON_SILENCE = os.getenv('ACTIVITY_TRANSCRIPTION_SPLIT_ON_SILENCE', 'true').lower() == 'true'
+ACTIVITY_TRANSCRIPTION_WORKERS = int(os.getenv('ACTIVITY_TRANSCRIPTION_WORKERS', 4))  # Concurrent recognizer calls
+
+# Profile endpoint (see activity/profiles.py). Square thumbnails are generated for each size in pixels
+ACTIVITY_PROFILE_THUMBNAIL_SIZES = [int(size) for size in os.getenv('ACTIVITY_PROFILE_THUMBNAIL_SIZES', '64,128,256').split(',')]
+ACTIVITY_PROFILE_CACHE_SECONDS = int(os.getenv('ACTIVITY_PROFILE_CACHE_SECONDS', 300))
+
+# Metrics (see activity/utility/metrics.py), scraped from api/metrics/ in the Prometheus text format.
+# Scrapers send ACTIVITY_METRICS_TOKEN as a Bearer token; while it is unset only staff (admin session) can read them
+ACTIVITY_METRICS_TOKEN = os.getenv('ACTIVITY_METRICS_TOKEN') or None
+# Log each request's total time and the time spent in every stage
+ACTIVITY_METRICS_LOG_TIMINGS = os.getenv('ACTIVITY_METRICS_LOG_TIMINGS', 'false').lower() == 'true'
+
+# Storage tiering (see activity/tiering.py, run with `manage.py tier_audio`): WAV recordings older than
+# ACTIVITY_TIERING_AGE_DAYS are re-encoded to ACTIVITY_TIERING_FORMAT, 'flac' (lossless) or 'opus'
+ACTIVITY_TIERING_AGE_DAYS = int(os.getenv('ACTIVITY_TIERING_AGE_DAYS', 30))
+ACTIVITY_TIERING_FORMAT = os.getenv('ACTIVITY_TIERING_FORMAT', 'flac')
+ACTIVITY_TIERING_OPUS_BITRATE = os.getenv('ACTIVITY_TIERING_OPUS_BITRATE', '32k')
+# What happens to the raw WAV once re-encoded: 'delete' it or 'archive' it under ACTIVITY_AUDIO_ARCHIVE_DIR
+ACTIVITY_TIERING_RAW_RETENTION = os.getenv('ACTIVITY_TIERING_RAW_RETENTION', 'delete')
+ACTIVITY_AUDIO_ARCHIVE_DIR = os.getenv('ACTIVITY_AUDIO_ARCHIVE_DIR', os.path.join(BASE_DIR, 'audio_archive'))
+ACTIVITY_AUDIO_ARCHIVE_DAYS = int(os.getenv('ACTIVITY_AUDIO_ARCHIVE_DAYS', 90))  # 0 keeps archived files forever
+
+# Waveform peaks (see activity/utility/waveform.py): the resolutions api/audio/<id>/peaks/ serves,
+# and the one included in recording listings (0 leaves peaks out of listings)
+ACTIVITY_PEAKS_RESOLUTIONS = [int(size) for size in os.getenv('ACTIVITY_PEAKS_RESOLUTIONS', '64,256,1024').split(',')]
+ACTIVITY_PEAKS_LIST_RESOLUTION = int(os.getenv('ACTIVITY_PEAKS_LIST_RESOLUTION', 64))
+
+# Responses smaller than this are sent uncompressed (see activity/middleware.py CompressionMiddleware)
+ACTIVITY_COMPRESS_MIN_BYTES = int(os.getenv('ACTIVITY_COMPRESS_MIN_BYTES', 1024))
+
+# Sync feed (see activity/sync.py): rows of each kind per page, and how long deletions are
+# remembered; clients that haven't synced for longer have to start over
+ACTIVITY_SYNC_PAGE_SIZE = int(os.getenv('ACTIVITY_SYNC_PAGE_SIZE', 500))
+ACTIVITY_SYNC_TOMBSTONE_DAYS = int(os.getenv('ACTIVITY_SYNC_TOMBSTONE_DAYS', 30))
+
+# Largest list accepted by the bulk activity and batch audio delete endpoints
+ACTIVITY_BULK_MAX_ITEMS = int(os.getenv('ACTIVITY_BULK_MAX_ITEMS', 500))
+
+# Username that owns the activities and recordings from before per-user ownership that can't be
+# traced to anyone else. Needed by migrations 0010/0020 and index_audio once there are several accounts
+ACTIVITY_LEGACY_OWNER = os.getenv('ACTIVITY_LEGACY_OWNER') or None
+
 #Uncomment if you want to limit the audio file size
 #DATA_UPLOAD_MAX_MEMORY_SIZE = 52428800  # 50 MB
 
@@ -14,6 +14,8 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
+import os
+
 from django.contrib import admin
 from django.urls import include, path
 from django.conf import settings
@@ -24,4 +26,7 @@ urlpatterns = [
     path('', include('activity.urls')),
 ]
 
-urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+# Only profile photos are served straight from MEDIA_ROOT (in DEBUG); recordings and audio blobs
+# are only available through the authenticated api/audio/<id>/stream/
+urlpatterns += static(f'{settings.MEDIA_URL}profile_pics/',
+                      document_root=os.path.join(settings.MEDIA_ROOT, 'profile_pics'))